@@ -0,0 +1,55 @@
+from dataclasses import replace
+from unittest.mock import patch
+
+from siebenapp import components
+from siebenapp.domain import RenderResult
+from siebenapp.goaltree import Goals
+from siebenapp.layers import all_layers
+from siebenapp.open_view import ToggleOpenView
+from siebenapp.render import Renderer
+from siebenapp.render_next import full_render
+from siebenapp.switchable_view import ToggleSwitchableView
+from benchmarks.common import build_tree, measure, report
+
+
+def forest(size: int) -> RenderResult:
+    """A big tree without its root goal: several large independent subtrees."""
+    rr = build_tree(size, 4).q()
+    rows = [row for row in rr.rows if row.goal_id != Goals.ROOT_ID]
+    return RenderResult(rows, roots={2, 3, 4, 5})
+
+
+def main() -> None:
+    for size in [3000, 10000, 30000]:
+        goals = all_layers(build_tree(size))
+        goals.accept_all(ToggleOpenView(), ToggleSwitchableView())
+        rr = goals.q()
+        if size <= 10000:
+            with patch("siebenapp.render.split_components", lambda r: [r]):
+                report(
+                    f"Renderer, switchable view of {size}, single graph",
+                    measure(lambda: Renderer(rr).build(), 1),
+                )
+        report(
+            f"Renderer, switchable view of {size}, components",
+            measure(lambda: Renderer(rr).build(), 3),
+        )
+        report(
+            f"full_render, switchable view of {size}, components",
+            measure(lambda: full_render(goals, Renderer.DEFAULT_WIDTH), 3),
+        )
+    for size in [3000, 10000]:
+        rr = forest(size)
+        with patch.object(components, "PARALLEL_FROM", 10**9):
+            report(
+                f"Renderer, forest of {size}, sequential",
+                measure(lambda: Renderer(replace(rr)).build(), 1),
+            )
+        report(
+            f"Renderer, forest of {size}, parallel",
+            measure(lambda: Renderer(replace(rr)).build(), 1),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import subprocess
+import sys
+from os import path
+from tempfile import TemporaryDirectory
+from time import sleep
+
+from siebenapp.daemon import request
+from siebenapp.layers import all_layers
+from siebenapp.system import save
+from benchmarks.common import build_tree, measure, report
+
+MANAGE = [sys.executable, "-c", "from siebenapp.manage import main; main()"]
+
+
+def manage(*args: str) -> None:
+    subprocess.run([*MANAGE, *args], check=True, stdout=subprocess.DEVNULL)
+
+
+def main() -> None:
+    with TemporaryDirectory() as tmp:
+        address = path.join(tmp, "daemon.sock")
+        daemon = subprocess.Popen([*MANAGE, "--socket", address, "serve"])
+        while not path.exists(address):
+            sleep(0.01)
+        try:
+            for size in [1000, 20000]:
+                file_name = path.join(tmp, f"daemon {size}.db")
+                save(all_layers(build_tree(size)), file_name)
+                report(
+                    f"md of {size}, cold",
+                    measure(lambda: manage("--direct", "md", file_name), 3),
+                )
+                report(
+                    f"md of {size}, daemon",
+                    measure(lambda: manage("--socket", address, "md", file_name), 3),
+                )
+                options = {"n": False, "p": False, "t": False}
+                message = {"command": "md", "db": file_name, "options": options}
+                report(
+                    f"md of {size}, daemon request only",
+                    measure(lambda: request(address, message)),
+                )
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+from os import path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from siebenapp.domain import Graph, Rename
+from siebenapp.layers import all_layers
+from siebenapp.system import load, save
+from benchmarks.common import build_tree, measure, report
+
+
+def bench_freeze(size: int) -> None:
+    goals: Graph = all_layers(build_tree(size))
+    report(f"q() of {size}", measure(goals.q, 3))
+    start = perf_counter()
+    goals.freeze()
+    report(f"first freeze() of {size}", perf_counter() - start)
+    report(f"freeze() of {size}", measure(goals.freeze, 100))
+    frozen: Graph = goals.freeze()
+
+    def rename() -> None:
+        for _ in range(100):
+            goals.accept(Rename("Renamed", 2))
+
+    report(f"100 renames of {size} with a frozen copy", measure(rename))
+    report(f"q() of frozen {size}", measure(frozen.q, 3))
+
+
+def bench_lazy_freeze(size: int) -> None:
+    with TemporaryDirectory() as tmp:
+        file_name = path.join(tmp, f"freeze {size}.db")
+        save(all_layers(build_tree(size)), file_name)
+        goals: Graph = load(file_name, lazy=True)
+        report(f"Lazy q() of {size}", measure(goals.q, 3))
+        report(f"Lazy freeze() of {size}", measure(goals.freeze, 100))
+        frozen: Graph = goals.freeze()
+        report(f"Lazy q() of frozen {size}", measure(frozen.q, 3))
+
+
+def main() -> None:
+    for size in [1000, 20000]:
+        bench_freeze(size)
+        bench_lazy_freeze(size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+from contextlib import closing
+from os import path
+from tempfile import TemporaryDirectory
+
+from siebenapp.archive import archive_subtrees
+from siebenapp.domain import EdgeType
+from siebenapp.goaltree import Goals, GoalsData, EdgesData
+from siebenapp.layers import all_layers
+from siebenapp.snapshot import write_snapshot
+from siebenapp.system import connect, load, save
+from benchmarks.common import build_tree, measure, report
+
+
+def build_mostly_closed_tree(size: int, fanout: int = 5) -> Goals:
+    """Build a balanced goal tree where only the last subtree of the root is open."""
+    edges: EdgesData = [
+        ((goal_id - 2) // fanout + 1, goal_id, EdgeType.PARENT)
+        for goal_id in range(2, size + 1)
+    ]
+    top: dict[int, int] = {}
+    for parent, goal_id, _ in edges:
+        top[goal_id] = top.get(parent, goal_id)
+    goals: GoalsData = [(1, "Root", True)]
+    goals.extend(
+        (goal_id, f"Goal {goal_id}", top[goal_id] == fanout + 1)
+        for goal_id in range(2, size + 1)
+    )
+    return Goals.build(goals, edges)
+
+
+def bench_archive(tmp: str) -> None:
+    size: int = 50000
+    file_name = path.join(tmp, f"archive {size}.db")
+    save(all_layers(build_mostly_closed_tree(size)), file_name)
+    report(
+        f"Load and render {size}, 80% closed", measure(lambda: load(file_name).q(), 3)
+    )
+    with closing(connect(file_name)) as connection:
+        archive_subtrees(connection)
+    report(
+        f"Load and render {size}, closed are archived",
+        measure(lambda: load(file_name).q(), 3),
+    )
+    report(
+        f"Load {size} with verification, closed are archived",
+        measure(lambda: load(file_name, verify=True), 3),
+    )
+
+
+def main() -> None:
+    with TemporaryDirectory() as tmp:
+        for size in [10000, 50000]:
+            file_name = path.join(tmp, f"load {size}.db")
+            goals = all_layers(build_tree(size))
+            save(goals, file_name)
+            report(f"Load {size}", measure(lambda: load(file_name), 3))
+            report(
+                f"Load {size} with verification",
+                measure(lambda: load(file_name, verify=True), 3),
+            )
+            report(
+                f"Write snapshot {size}",
+                measure(lambda: write_snapshot(goals, file_name), 3),
+            )
+            report(
+                f"Load {size} from snapshot",
+                measure(lambda: load(file_name, snapshot=True), 3),
+            )
+        bench_archive(tmp)
+
+
+if __name__ == "__main__":
+    main()
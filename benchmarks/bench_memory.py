@@ -0,0 +1,89 @@
+"""Peak memory of the in-memory Goals compared to LazyGoals.
+
+Trees are built and measured in separate processes, so that peak RSS of one of them
+does not affect another one (peak RSS of the parent process is inherited by children).
+"""
+
+import resource
+import subprocess
+import sys
+from os import path
+from tempfile import TemporaryDirectory
+
+from siebenapp.domain import Add, Rename
+from siebenapp.layers import all_layers
+from siebenapp.system import load, save
+from benchmarks.common import build_tree
+
+EDITS = 1000
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is measured in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(file_name: str, lazy: bool, render: bool) -> None:
+    """Open the file, make a few edits (and render it), then print peak RSS."""
+    goals = load(file_name, lazy=lazy)
+    for i in range(EDITS):
+        goals.accept_all(Add(f"New {i}", 2), Rename(f"Renamed {i}", 3))
+    if render:
+        goals.q()
+    print(peak_rss_mb())
+
+
+def build(file_name: str, size: int) -> None:
+    save(all_layers(build_tree(size)), file_name)
+
+
+def run_self(*args: str) -> str:
+    return subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_memory", *args],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+
+def measure_rss(file_name: str, lazy: bool, render: bool) -> float:
+    return float(
+        run_self(
+            "run",
+            file_name,
+            *(["lazy"] if lazy else []),
+            *(["render"] if render else []),
+        )
+    )
+
+
+def report_rss(name: str, megabytes: float) -> None:
+    print(f"{name:<50} {megabytes:>10.1f} MB")
+
+
+def main() -> None:
+    with TemporaryDirectory() as tmp:
+        # Rendering of all goals takes too long for the larger tree
+        for size, render in [(100000, True), (1000000, False)]:
+            file_name = path.join(tmp, f"memory {size}.db")
+            run_self("build", file_name, str(size))
+            for lazy in [False, True]:
+                kind: str = "lazy" if lazy else "in-memory"
+                report_rss(
+                    f"{EDITS} edits of {size}, {kind}",
+                    measure_rss(file_name, lazy, False),
+                )
+                if render:
+                    report_rss(
+                        f"{EDITS} edits and render of {size}, {kind}",
+                        measure_rss(file_name, lazy, True),
+                    )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["build"]:
+        build(sys.argv[2], int(sys.argv[3]))
+    elif sys.argv[1:2] == ["run"]:
+        run(sys.argv[2], "lazy" in sys.argv, "render" in sys.argv)
+    else:
+        main()
@@ -0,0 +1,43 @@
+"""Measure repaint time of the central widget (run with QT_QPA_PLATFORM=offscreen)."""
+
+import os
+import sys
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6.QtWidgets import QApplication, QLabel  # type: ignore
+
+from siebenapp.app import CentralWidget
+from siebenapp.render import Renderer, render_lines
+from benchmarks.common import build_tree, measure, report
+
+
+def main() -> None:
+    app = QApplication(sys.argv)
+    render_result = Renderer(build_tree(5000, 20), 60).build()
+    edges = sum(len(o["edge_render"]) for o in render_result.node_opts.values())
+    widget = CentralWidget()
+    for goal_id, opts in render_result.node_opts.items():
+        label = QLabel(str(goal_id) if goal_id > 0 else "")
+        widget.layout().addWidget(label, opts["row"], opts["col"])  # type: ignore
+    widget.setupData(render_result)
+    widget.resize(8000, 4000)
+    widget.show()
+    app.processEvents()
+
+    report(
+        f"render_lines, {edges} edges",
+        measure(lambda: render_lines(widget, render_result), 3),
+    )
+
+    def cold_repaint() -> None:
+        widget.geometry_revision += 1
+        widget.repaint()
+
+    report(f"repaint, {edges} edges, cold cache", measure(cold_repaint, 3))
+    report(f"repaint, {edges} edges, warm cache", measure(widget.repaint, 10))
+    widget.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+from os import path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from siebenapp.domain import Graph, QuerySpec
+from siebenapp.filter_view import FilterBy
+from siebenapp.goaltree import Goals
+from siebenapp.layers import all_layers, get_root
+from siebenapp.system import load, save
+from siebenapp.zoom_view import ToggleZoom
+from benchmarks.common import build_tree, measure, report
+
+
+def small_subtree(goals: Goals, size: int) -> int:
+    """Find a goal with not more than `size` goals in its zoomed subtree."""
+    goal_id: int = Goals.ROOT_ID
+    while len(goals._zoomed_subtree(goal_id)) > size:
+        goal_id = min(goals.edges_forward[goal_id])
+    return goal_id
+
+
+def bench_views(name: str, goals: Graph, repeat: int = 3) -> None:
+    zoom_root: int = small_subtree(get_root(goals, Goals), 40)
+    cases: list[tuple[str, list, list]] = [
+        ("open goals", [], []),
+        ("filter", [FilterBy("goal 1")], [FilterBy("")]),
+        ("zoom to 40 goals", [ToggleZoom(zoom_root)], [ToggleZoom(zoom_root)]),
+    ]
+    for case, enter, leave in cases:
+        goals.accept_all(*enter)
+        report(f"{name}, {case}", measure(goals.q, repeat))
+        with patch.object(QuerySpec, "push_down", False):
+            report(f"{name}, {case}, without push-down", measure(goals.q, repeat))
+        goals.accept_all(*leave)
+
+
+def main() -> None:
+    for size in [20000, 100000]:
+        bench_views(f"q() of {size}", all_layers(build_tree(size)))
+    with TemporaryDirectory() as tmp:
+        size = 100000
+        file_name = path.join(tmp, f"query {size}.db")
+        save(all_layers(build_tree(size)), file_name)
+        bench_views(f"Lazy q() of {size}", load(file_name, lazy=True), 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+from siebenapp.domain import Add, EdgeType, RenderResult, ToggleLink
+from siebenapp.goaltree import Goals
+from siebenapp.render_next import (
+    HORIZONTAL_ITERATIONS,
+    Tube,
+    find_previous,
+    full_render,
+    revert_rows,
+    shift_columns,
+    shift_columns_vectorized,
+    np,
+)
+from benchmarks.common import measure, report
+from tests.dsl import diamond_ladder
+
+
+def wide_tree(size: int) -> Goals:
+    goals = Goals("Root")
+    for i in range(2, size + 1):
+        goals.accept(Add(f"Goal {i}", i // 3 or 1))
+    for i in range(2, size + 1, 7):
+        goals.accept(ToggleLink(i, size + 1 - i, EdgeType.BLOCKER))
+    return goals
+
+
+def edge_length(rr: RenderResult) -> int:
+    """Total horizontal length of edges: the less it is, the better the layout."""
+    cols = {goal_id: opts["col"] for goal_id, opts in rr.node_opts.items()}
+    return sum(
+        abs(cols[row.goal_id] - cols[e[0]]) for row in rr.rows for e in row.edges
+    )
+
+
+def main() -> None:
+    for rungs in [100, 1000, 10000]:
+        rr = diamond_ladder(rungs).q()
+        report(
+            f"find_previous, diamond ladder of {rungs}",
+            measure(lambda: find_previous(rr)),
+        )
+    for size in [1000, 5000]:
+        rr = wide_tree(size).q()
+        rr.node_opts = {row.goal_id: {} for row in rr.rows}
+        placed = revert_rows(Tube(8, rr).build().result())
+        for iterations in [2, HORIZONTAL_ITERATIONS]:
+            report(
+                f"shift_columns, {size} goals, {iterations} iterations",
+                measure(lambda: shift_columns(placed, iterations), 3),
+            )
+            if np is not None:
+                report(
+                    f"shift_columns_vectorized, {size} goals, {iterations} iterations",
+                    measure(lambda: shift_columns_vectorized(placed, iterations), 3),
+                )
+
+    for size in [1000, 5000]:
+        goals = wide_tree(size)
+        for iterations in [2, HORIZONTAL_ITERATIONS]:
+            name = f"full_render, {size} goals, {iterations} iterations"
+            report(
+                name, measure(lambda: full_render(goals, 8, iterations=iterations), 3)
+            )
+            print(
+                f"{'':<4}edge length: {edge_length(full_render(goals, 8, iterations=iterations))}"
+            )
+
+
+if __name__ == "__main__":
+    main()
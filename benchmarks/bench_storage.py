@@ -0,0 +1,120 @@
+import sqlite3
+from contextlib import closing
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import perf_counter
+from os import path
+
+from siebenapp.domain import Delete, Rename
+from siebenapp.layers import all_layers
+from siebenapp.system import (
+    Storage,
+    load,
+    open_storage,
+    save,
+    DURABILITY_MODES,
+    PROFILES,
+    SYNC,
+    ASYNC_FLUSH_ON_QUIT,
+)
+from benchmarks.common import build_tree, measure, report
+
+RENAMES = 10000
+
+
+def bench_subtree_delete(tmp: str) -> None:
+    for name, with_index in [("without index", False), ("with index", True)]:
+        file_name = path.join(tmp, f"delete {name}.db")
+        goals = all_layers(build_tree(100000))
+        save(goals, file_name)
+        if not with_index:
+            with closing(sqlite3.connect(file_name)) as conn:
+                conn.execute("drop index edges_child")
+        # Goal 32 is the root of a subtree with ~800 goals
+        goals.accept(Delete(32))
+        storage = Storage(file_name)
+        report(
+            f"Delete subtree of 100k, {name}", measure(lambda: storage.save(goals), 1)
+        )
+        storage.close()
+
+
+def bench_profiles(tmp: str) -> None:
+    for profile in PROFILES:
+        file_name = path.join(tmp, f"profile {profile}.db")
+        goals = all_layers(build_tree(10000))
+        save(goals, file_name, profile)
+
+        def write(count: int) -> None:
+            # Storage is created here, because connections can't be shared between threads
+            storage = Storage(file_name, profile=profile)
+            for i in range(count):
+                goals.accept(Rename(f"Goal {i}", 2))
+                storage.save(goals)
+            storage.close()
+
+        report(f"1000 renames, {profile} profile", measure(lambda: write(1000), 1))
+        report(
+            f"Load, {profile} profile",
+            measure(lambda: load(file_name, profile=profile), 3),
+        )
+
+        writer = Thread(target=write, args=(RENAMES,))
+        writer.start()
+        reads: int = 0
+        start = perf_counter()
+        while writer.is_alive() and reads < 20:
+            load(file_name, profile=profile)
+            reads += 1
+        elapsed = perf_counter() - start
+        writer.join()
+        report(f"Load during writes, {profile} profile", elapsed / reads)
+
+
+def bench_journal(tmp: str) -> None:
+    for name, extension in [("database", ".db"), ("journal", ".journal")]:
+        for durability in DURABILITY_MODES:
+            file_name = path.join(tmp, f"backend {durability}{extension}")
+            goals = all_layers(build_tree(10000))
+            save(goals, file_name)
+
+            def run() -> None:
+                storage = open_storage(file_name, durability)
+                for i in range(1000):
+                    goals.accept(Rename(f"Goal {i}", 2))
+                    storage.save(goals)
+                storage.close()
+
+            report(f"1000 renames, {name}, {durability}", measure(run, 1))
+        report(f"Load 10k, {name}", measure(lambda: load(file_name), 3))
+
+
+def main() -> None:
+    with TemporaryDirectory() as tmp:
+        bench_profiles(tmp)
+        bench_subtree_delete(tmp)
+        bench_journal(tmp)
+        for name, durability in [
+            ("per-save connect", None),
+            ("session", SYNC),
+            ("write-behind session", ASYNC_FLUSH_ON_QUIT),
+        ]:
+            file_name = path.join(tmp, f"{name}.db")
+            goals = all_layers(build_tree(1000))
+            save(goals, file_name)
+
+            def run() -> None:
+                storage = Storage(file_name, durability or SYNC)
+                for i in range(RENAMES):
+                    goals.accept(Rename(f"Goal {i}", 2))
+                    if durability is None:
+                        save(goals, file_name)
+                    else:
+                        storage.save(goals)
+                storage.close(quitting=True)
+
+            report(f"{RENAMES} renames, {name}", measure(run, 1))
+
+
+if __name__ == "__main__":
+    main()
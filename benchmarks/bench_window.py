@@ -0,0 +1,34 @@
+from itertools import islice
+from os import path
+from tempfile import TemporaryDirectory
+
+from siebenapp.domain import Graph
+from siebenapp.enumeration import Enumeration
+from siebenapp.layers import all_layers
+from siebenapp.system import load, save
+from benchmarks.common import build_tree, measure, report
+
+
+def bench_first_rows(name: str, goals: Graph, repeat: int = 3) -> None:
+    report(f"{name}, all rows", measure(lambda: goals.q(), repeat))
+    report(f"{name}, first row", measure(lambda: next(goals.iter_rows()), repeat))
+    report(
+        f"{name}, page of 50 rows",
+        measure(lambda: list(islice(goals.iter_rows(), 50)), repeat),
+    )
+
+
+def main() -> None:
+    size: int = 100000
+    bench_first_rows(f"Layers of {size}", all_layers(build_tree(size)))
+    bench_first_rows(
+        f"Enumeration of {size}", Enumeration(all_layers(build_tree(size)))
+    )
+    with TemporaryDirectory() as tmp:
+        file_name = path.join(tmp, f"window {size}.db")
+        save(all_layers(build_tree(size)), file_name)
+        bench_first_rows(f"Lazy enumeration of {size}", load(file_name, lazy=True), 1)
+
+
+if __name__ == "__main__":
+    main()
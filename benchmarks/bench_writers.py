@@ -0,0 +1,45 @@
+import multiprocessing
+from os import path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from siebenapp.domain import Add
+from siebenapp.layers import all_layers
+from siebenapp.session import GoalsHolder
+from siebenapp.system import PROFILES, load, save
+from benchmarks.common import build_tree, report
+
+ADDS = 200
+
+
+def add_goals(file_name: str, profile: str, count: int) -> None:
+    goals_holder = GoalsHolder(
+        load(file_name, profile=profile), file_name, profile=profile
+    )
+    for i in range(count):
+        goals_holder.accept(Add(f"New goal {i}", 1))
+    goals_holder.close()
+
+
+def bench_writers(tmp: str, profile: str) -> None:
+    for writers in [1, 2, 4, 8]:
+        file_name = path.join(tmp, f"writers {writers} {profile}.db")
+        save(all_layers(build_tree(1000)), file_name, profile)
+        with multiprocessing.Pool(writers) as pool:
+            start = perf_counter()
+            pool.starmap(add_goals, [(file_name, profile, ADDS)] * writers)
+            elapsed = perf_counter() - start
+        total: int = writers * ADDS
+        assert len(load(file_name).q().rows) >= total
+        report(f"{total} adds by {writers} writers, {profile} profile", elapsed)
+        print(f"{'  throughput':<50} {total / elapsed:>10.0f} adds/s")
+
+
+def main() -> None:
+    with TemporaryDirectory() as tmp:
+        for profile in PROFILES:
+            bench_writers(tmp, profile)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+from collections.abc import Callable
+from time import perf_counter
+from typing import Any
+
+from siebenapp.domain import EdgeType
+from siebenapp.goaltree import Goals, GoalsData, EdgesData
+
+
+def measure(fn: Callable[[], Any], repeat: int = 5) -> float:
+    """Run given function several times and return the best time (in seconds)."""
+    best: float = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        fn()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def report(name: str, seconds: float) -> None:
+    print(f"{name:<50} {seconds * 1000:>10.2f} ms")
+
+
+def build_tree(size: int, fanout: int = 5) -> Goals:
+    """Build a balanced goal tree of the given size where every third leaf is closed."""
+    edges: EdgesData = [
+        ((goal_id - 2) // fanout + 1, goal_id, EdgeType.PARENT)
+        for goal_id in range(2, size + 1)
+    ]
+    parents: set[int] = {parent for parent, _, _ in edges}
+    goals: GoalsData = [
+        (
+            goal_id,
+            f"Goal {goal_id}",
+            goal_id in parents or goal_id % 3 != 0,
+        )
+        for goal_id in range(1, size + 1)
+    ]
+    return Goals.build(goals, edges)
@@ -1,10 +1,22 @@
 #!/usr/bin/env python3
 import sys
 from argparse import ArgumentParser
+from collections import defaultdict
+from functools import partial
 from os.path import dirname, join, realpath
+from time import perf_counter
 from typing import Any
 
-from PySide6.QtCore import Signal, Qt, QRect, QFile, QIODevice, QEvent  # type: ignore
+from PySide6.QtCore import (  # type: ignore
+    Signal,
+    Qt,
+    QRect,
+    QLine,
+    QFile,
+    QIODevice,
+    QEvent,
+    QTimer,
+)
 from PySide6.QtGui import QPainter, QPen  # type: ignore
 from PySide6.QtUiTools import QUiLoader  # type: ignore
 from PySide6.QtWidgets import (  # type: ignore
@@ -22,8 +34,10 @@ from siebenapp.selectable_view import (
     Select,
     HoldSelect,
 )
+from siebenapp.journal import JOURNAL_EXTENSION, is_journal
 from siebenapp.progress_view import ToggleProgress
 from siebenapp.filter_view import FilterBy
+from siebenapp.daemon import socket_path
 from siebenapp.domain import (
     EdgeType,
     ToggleClose,
@@ -38,11 +52,40 @@ from siebenapp.domain import (
 )
 from siebenapp.switchable_view import ToggleSwitchableView
 from siebenapp.open_view import ToggleOpenView
-from siebenapp.render import Renderer, GeometryProvider, render_lines, GoalsHolder
-from siebenapp.system import load, split_long
+from siebenapp.components import shutdown_executor
+from siebenapp.render import (
+    Renderer,
+    GeometryProvider,
+    LayoutWorker,
+    LinesCache,
+    Point,
+    RenderStats,
+)
+from siebenapp.session import GoalsHolder
+from siebenapp.system import (
+    load,
+    split_long,
+    DURABILITY_MODES,
+    SYNC,
+    PROFILES,
+    PROFILE_ENV,
+    SAFE,
+)
 from siebenapp.ui.goalwidget import Ui_GoalBody  # type: ignore
 from siebenapp.zoom_view import ToggleZoom
 
+# Goal widgets are created only for grid rows that are closer than this (in pixels)
+# to the visible area
+VISIBLE_MARGIN = 500
+
+# Layouts are built in a background thread, which doesn't touch Qt objects,
+# so the GUI thread checks this often (in milliseconds) whether one is built
+LAYOUT_POLL_INTERVAL = 10
+
+# Refreshes requested within this time (in milliseconds) after the first one
+# are drawn together, e.g. when several keys are typed quickly
+REFRESH_DELAY = 20
+
 
 class GoalWidget(QWidget, Ui_GoalBody):
     clicked = Signal()
@@ -52,6 +95,7 @@ class GoalWidget(QWidget, Ui_GoalBody):
         self._click_in_progress = False
         self.setupUi(self)
         self.widget_id = None
+        self.grid_row = None
 
     def setup_data(self, row: RenderRow, selection: tuple[GoalId, GoalId]) -> None:
         self.widget_id = row.goal_id
@@ -84,6 +128,7 @@ class GoalWidget(QWidget, Ui_GoalBody):
 
 class CentralWidget(QWidget):
     __metaclass__ = GeometryProvider
+    painted = Signal()
 
     EDGE_PENS = {
         EdgeType.RELATION: QPen(Qt.black, 1, Qt.DotLine),  # type: ignore
@@ -99,57 +144,147 @@ class CentralWidget(QWidget):
         layout.setContentsMargins(0, 0, 0, 0)
         self.setLayout(layout)
         self.render_result = None
+        # Grid cells of all goals, and grid rows where goal widgets are created
+        # (see SiebenApp.show_visible_rows)
+        self.goal_cells: set[tuple[int, int]] = set()
+        self.shown_rows: set[int] = set()
+        # Incremented on every change of child widgets geometry
+        self.geometry_revision = 0
+        self.lines_cache = LinesCache()
+        self._batched_lines = None
+        self._painter_lines = {}
 
     def setupData(self, render_result):
         self.render_result = render_result
+        self.goal_cells = {
+            (opts["row"], opts["col"])
+            for opts in (render_result.node_opts[r.goal_id] for r in render_result.rows)
+        }
+        self.geometry_revision += 1
+
+    def event(self, event):
+        result = super().event(event)
+        if event.type() == QEvent.LayoutRequest:
+            self.geometry_revision += 1
+        return result
+
+    def resizeEvent(self, event):
+        self.geometry_revision += 1
+        super().resizeEvent(event)
 
-    def itemAt(self, row, col):
+    def cell(self, row, col):
+        """Geometry of the grid cell. Missing cells are placed to the right
+        of the nearest existing cell on the left."""
         if col < 0:
-            g = self.itemAt(row, 0).geometry()
+            g = self.cell(row, 0)
             return QRect(0, g.topLeft().y(), 0, g.height())
-        item = self.layout().itemAtPosition(row, col)
-        if item is not None:
-            return item
-        g = self.itemAt(row, col - 1).geometry()
-        return QRect(g.topRight().x() + 100, g.topRight().y(), 0, g.height())
+        missing = 0
+        while (g := self._goal_geometry(row, col - missing)) is None:
+            if col - missing == 0:
+                g = QRect(0, 0, 0, 0)
+                break
+            missing += 1
+        for _ in range(missing):
+            g = QRect(g.topRight().x() + 100, g.topRight().y(), 0, g.height())
+        return g
+
+    def _goal_geometry(self, row, col):
+        if (row, col) not in self.goal_cells:
+            return None
+        if row in self.shown_rows:
+            return self.layout().itemAtPosition(row, col).geometry()
+        # Goal widget is not created, but its row keeps the size
+        return self.layout().cellRect(row, col)
 
     def top_left(self, row, col):
-        w = self.itemAt(row, col)
-        return w.topLeft() if isinstance(w, QRect) else w.geometry().topLeft()
+        return _point(self.cell(row, col).topLeft())
 
     def top_right(self, row, col):
-        w = self.itemAt(row, col)
-        return w.topRight() if isinstance(w, QRect) else w.geometry().topRight()
+        return _point(self.cell(row, col).topRight())
 
     def bottom_left(self, row, col):
-        w = self.itemAt(row, col)
-        return w.bottomLeft() if isinstance(w, QRect) else w.geometry().bottomLeft()
+        return _point(self.cell(row, col).bottomLeft())
 
     def bottom_right(self, row, col):
-        w = self.itemAt(row, col)
-        return w.bottomRight() if isinstance(w, QRect) else w.geometry().bottomRight()
+        return _point(self.cell(row, col).bottomRight())
 
     def paintEvent(self, event):
+        if self.render_result is None:
+            return
+        lines = self.lines_cache.get(self, self.render_result, self.geometry_revision)
+        if lines is not self._batched_lines:
+            self._batched_lines = lines
+            self._painter_lines = {
+                edge_type: [QLine(*coords[i : i + 4]) for i in range(0, len(coords), 4)]
+                for edge_type, coords in lines.items()
+            }
         painter = QPainter(self)
-        lines = render_lines(self, self.render_result)
-
-        for edge_type, start, end, _ in lines:
+        for edge_type, painter_lines in self._painter_lines.items():
             painter.setPen(self.EDGE_PENS[edge_type])
-            painter.drawLine(start, end)
+            painter.drawLines(painter_lines)
+        self.painted.emit()
+
+
+def _point(p) -> Point:
+    return Point(p.x(), p.y())
 
 
 class SiebenApp(QMainWindow):
     refresh = Signal()
     quit_app = Signal()
-
-    def __init__(self, db, experimental, *args, **kwargs):
+    # Emitted from a background thread when another process changes the same file
+    remote_change = Signal()
+
+    def __init__(
+        self,
+        db,
+        experimental,
+        durability=SYNC,
+        profile=None,
+        verify=False,
+        snapshot=False,
+        archive_after=None,
+        lazy=False,
+        *args,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
-        self.refresh.connect(self.save_and_render)
+        self.refresh.connect(self.schedule_render)
+        self.remote_change.connect(self.apply_remote_changes)
+        self.quit_app.connect(partial(self.close_file, True))
         self.quit_app.connect(QApplication.instance().quit)
-        goals = load(db, self.show_user_message)
         self.classic_render = not experimental
-        self.goals_holder = GoalsHolder(goals, db, self.classic_render)
+        self.durability = durability
+        self.profile = profile
+        self.verify = verify
+        self.snapshot = snapshot
+        self.archive_after = archive_after
+        self.lazy = lazy
+        self.stats = RenderStats()
+        self.render_timer = QTimer(self)
+        self.render_timer.setSingleShot(True)
+        self.render_timer.setInterval(REFRESH_DELAY)
+        self.render_timer.timeout.connect(self.save_and_render)
+        self.layouts = LayoutWorker(self.stats)
+        self.layout_timer = QTimer(self)
+        self.layout_timer.setSingleShot(True)
+        self.layout_timer.setInterval(LAYOUT_POLL_INTERVAL)
+        self.layout_timer.timeout.connect(self.show_layout)
+        self.quit_app.connect(self.layouts.close)
+        # Only after the layout that may still use worker processes is done
+        self.quit_app.connect(shutdown_executor)
+        # Times of the first command that is not shown yet, and of the one
+        # that is shown but not painted yet (see RenderStats.first_paint)
+        self.command_at: float | None = None
+        self.shown_command_at: float | None = None
+        self.goals_holder = self._open(db)
         self.columns = Renderer.DEFAULT_WIDTH
+        self.render_result = RenderResult([])
+        # Goals by grid rows, and grid rows that have goal widgets now
+        self.grid_rows: dict[int, list[RenderRow]] = {}
+        # Heights of rows which have been shown, and an estimated height of other ones
+        self.row_heights: dict[int, int] = {}
+        self.row_height = 0
 
     def setup(self):
         self.centralWidget().action_New.triggered.connect(self.show_new_dialog)
@@ -174,7 +309,14 @@ class SiebenApp(QMainWindow):
         self.centralWidget().scrollArea.setWidget(
             self.centralWidget().scrollAreaWidgetContents
         )
+        self.centralWidget().scrollAreaWidgetContents.painted.connect(self.count_paint)
         self.centralWidget().installEventFilter(self)
+        scroll_bar = self.centralWidget().scrollArea.verticalScrollBar()
+        scroll_bar.valueChanged.connect(self.show_visible_rows)
+        scroll_bar.rangeChanged.connect(self.show_visible_rows)
+        sample = GoalWidget()
+        self.row_height = sample.sizeHint().height()
+        sample.deleteLater()
         self._reset_controls_and_title()
         self.refresh.emit()
 
@@ -188,28 +330,105 @@ class SiebenApp(QMainWindow):
     def close_goal(self, goal_id):
         return self.with_refresh(self.goals_holder.accept, ToggleClose(goal_id))
 
+    def schedule_render(self):
+        """Commands are applied and saved right away, but a burst of them is drawn
+        once. The window is not extended by new refreshes, so typing never
+        postpones drawing for longer than REFRESH_DELAY."""
+        if self.command_at is None:
+            self.command_at = perf_counter()
+        if self.render_timer.isActive():
+            self.stats.avoided += 1
+        else:
+            self.render_timer.start()
+
     def save_and_render(self):
-        render_result, partial_change = self.goals_holder.render(self.columns)
-        if "setupData" in dir(self.centralWidget().scrollAreaWidgetContents):
-            self.centralWidget().scrollAreaWidgetContents.setupData(render_result)
+        if self.goals_holder.reload():
+            self.show_user_message("Goals have been changed by another process")
+        # Layout is built in background, while new commands are accepted
+        self.layouts.submit(
+            self.goals_holder.goals, self.columns, self.goals_holder.classic
+        )
+        self.show_layout()
+
+    def show_layout(self):
+        if (result := self.layouts.take()) is None:
+            if self.layouts.pending is not None:
+                self.layout_timer.start()
+            return
+        self.shown_command_at, self.command_at = self.command_at, None
+        render_result, partial_change = self.goals_holder.show(result)
+        contents = self.centralWidget().scrollAreaWidgetContents
+        self.render_result = render_result
+        if "setupData" in dir(contents):
+            contents.setupData(render_result)
         if not partial_change:
-            for child in self.centralWidget().scrollAreaWidgetContents.children():
+            for child in contents.children():
                 if isinstance(child, GoalWidget):
                     child.deleteLater()
+            layout = contents.layout()
+            for grid_row in range(layout.rowCount()):
+                layout.setRowMinimumHeight(grid_row, 0)
+            self.grid_rows = defaultdict(list)
             for row in render_result.rows:
-                self._make_widget(render_result, row)
+                self.grid_rows[render_result.node_opts[row.goal_id]["row"]].append(row)
+            contents.shown_rows = set()
+            self.row_heights = {}
+            for grid_row in self.grid_rows:
+                self._hide_grid_row(grid_row, self.row_height)
+            self.show_visible_rows()
         else:
-            for child in self.centralWidget().scrollAreaWidgetContents.children():
+            for child in contents.children():
                 if isinstance(child, GoalWidget) and child.widget_id in partial_change:
                     child.deleteLater()
             for row_id in partial_change:
                 row = render_result.by_id(row_id)
-                self._make_widget(render_result, row)
-        self.centralWidget().scrollAreaWidgetContents.update()
+                if render_result.node_opts[row_id]["row"] in contents.shown_rows:
+                    self._make_widget(render_result, row)
+        contents.update()
+
+    def count_paint(self):
+        if self.shown_command_at is not None:
+            self.stats.first_paint.append(perf_counter() - self.shown_command_at)
+            self.shown_command_at = None
+
+    def show_visible_rows(self, *_):
+        """Create goal widgets for grid rows close to the visible area and remove
+        widgets of other rows. Rows without widgets keep their height, so that
+        the scroll area (and edges between goals) are the same as with all widgets."""
+        contents = self.centralWidget().scrollAreaWidgetContents
+        layout = contents.layout()
+        area = self.centralWidget().scrollArea
+        top: int = area.verticalScrollBar().value() - VISIBLE_MARGIN
+        bottom: int = top + area.viewport().height() + 2 * VISIBLE_MARGIN
+        # Positions are estimated here, because Qt may not have applied the layout yet
+        y: int = 0
+        for grid_row in sorted(self.grid_rows):
+            height: int = self.row_heights.get(grid_row, self.row_height)
+            visible: bool = y <= bottom and y + height >= top
+            if visible and grid_row not in contents.shown_rows:
+                layout.setRowMinimumHeight(grid_row, 0)
+                for row in self.grid_rows[grid_row]:
+                    self._make_widget(self.render_result, row)
+                contents.shown_rows.add(grid_row)
+            elif not visible and grid_row in contents.shown_rows:
+                if measured := layout.cellRect(grid_row, 0).height():
+                    self.row_heights[grid_row] = measured
+                for child in contents.children():
+                    if isinstance(child, GoalWidget) and child.grid_row == grid_row:
+                        child.deleteLater()
+                self._hide_grid_row(grid_row, measured or height)
+                contents.shown_rows.discard(grid_row)
+            y += height + layout.verticalSpacing()
+
+    def _hide_grid_row(self, grid_row: int, height: int) -> None:
+        layout = self.centralWidget().scrollAreaWidgetContents.layout()  # type: ignore
+        # Spacing is not added around empty rows
+        layout.setRowMinimumHeight(grid_row, height + layout.verticalSpacing())
 
     def _make_widget(self, render_result: RenderResult, row: RenderRow) -> None:
         attributes = render_result.node_opts[row.goal_id]
         widget = GoalWidget()
+        widget.grid_row = attributes["row"]
         self.centralWidget().scrollAreaWidgetContents.layout().addWidget(  # type: ignore
             widget, attributes["row"], attributes["col"]
         )
@@ -280,23 +499,55 @@ class SiebenApp(QMainWindow):
             super().keyPressEvent(event)
 
     def show_new_dialog(self):
-        name = QFileDialog.getSaveFileName(self, caption="Save as...", filter="*.db")[0]
+        name = QFileDialog.getSaveFileName(
+            self, caption="Save as...", filter=f"*.db *{JOURNAL_EXTENSION}"
+        )[0]
         if name:
-            if not name.endswith(".db"):
+            if not name.endswith(".db") and not is_journal(name):
                 name = name + ".db"
-            goals = load(name, self.show_user_message)
-            self.goals_holder = GoalsHolder(goals, name, self.classic_render)
-            self._reset_controls_and_title()
-            self.refresh.emit()
+            self.open_file(name)
 
     def show_open_dialog(self):
-        name = QFileDialog.getOpenFileName(self, caption="Open file", filter="*.db")[0]
+        name = QFileDialog.getOpenFileName(
+            self, caption="Open file", filter=f"*.db *{JOURNAL_EXTENSION}"
+        )[0]
         if name:
-            goals = load(name, self.show_user_message)
-            self.goals_holder = GoalsHolder(goals, name, self.classic_render)
-            self._reset_controls_and_title()
+            self.open_file(name)
+
+    def open_file(self, name):
+        self.close_file()
+        self.goals_holder = self._open(name)
+        self._reset_controls_and_title()
+        self.refresh.emit()
+
+    def _open(self, name):
+        goals = load(
+            name,
+            self.show_user_message,
+            self.profile,
+            self.verify,
+            self.snapshot,
+            self.archive_after,
+            self.lazy,
+        )
+        return GoalsHolder(
+            goals,
+            name,
+            self.classic_render,
+            self.durability,
+            self.profile,
+            self.snapshot,
+            socket_path(),
+            self.remote_change.emit,
+        )
+
+    def apply_remote_changes(self):
+        if self.goals_holder.receive():
             self.refresh.emit()
 
+    def close_file(self, quitting=False):
+        self.goals_holder.close(quitting)
+
     def start_edit(self, label, fn, pre_fn=None):
         def inner():
             self.centralWidget().dockWidget.setWindowTitle(label)
@@ -448,16 +699,70 @@ def main():
         default=False,
         help="Enable experimental features",
     )
+    parser.add_argument(
+        "--durability",
+        choices=DURABILITY_MODES,
+        default=SYNC,
+        help="When changes are written into the database file (default: sync). "
+        "Files opened by several processes at once need sync mode",
+    )
+    parser.add_argument(
+        "--storage",
+        choices=list(PROFILES),
+        default=None,
+        help=f"Storage profile (default: ${PROFILE_ENV} or {SAFE})",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        default=False,
+        help="Fully verify goal tree on load, even when the file is known to be correct",
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        default=False,
+        help="Keep a binary snapshot next to the database file for faster startup",
+    )
+    parser.add_argument(
+        "--archive-after",
+        type=float,
+        default=None,
+        metavar="DAYS",
+        help="Archive subtrees that have been closed for more than DAYS days",
+    )
+    parser.add_argument(
+        "--lazy",
+        action="store_true",
+        help="Read goals from the database on demand (for very large files)",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print rendering statistics (e.g. time to first paint) on exit",
+    )
     args = parser.parse_args()
     app = QApplication(sys.argv)
     root = dirname(realpath(__file__))
-    sieben = SiebenApp(args.db, args.experimental)
+    sieben = SiebenApp(
+        args.db,
+        args.experimental,
+        args.durability,
+        args.storage,
+        args.verify,
+        args.snapshot,
+        args.archive_after,
+        args.lazy,
+    )
     w = loadUi(join(root, "ui", "main.ui"), sieben)
     sieben.about = loadUi(join(root, "ui", "about.ui"), sieben)
     sieben.hotkeys = loadUi(join(root, "ui", "hotkeys.ui"), sieben)
     sieben.setup()
     w.showMaximized()
-    sys.exit(app.exec_())
+    code = app.exec_()
+    if args.stats:
+        print(sieben.stats.summary())
+    sys.exit(code)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,167 @@
+"""Archive of fully closed subtrees.
+
+Archived goals and edges are moved from the goals and edges tables into the
+archive_goals and archive_edges tables, marked by the id of the subtree top goal.
+The top goal itself stays in the tree as a placeholder; the archived table keeps
+the number of goals archived below it (so that progress is still counted right).
+Archived goals are loaded back only on demand (see Goals.accept_Unarchive).
+"""
+
+import sqlite3
+from collections import defaultdict
+
+from siebenapp.domain import EdgeType
+from siebenapp.goaltree import Goals, GoalsData, EdgesData
+
+
+def read_archive(
+    connection: sqlite3.Connection, root: int
+) -> tuple[GoalsData, EdgesData]:
+    """Return archived goals and edges below the given placeholder."""
+    goals: GoalsData = list(
+        connection.execute(
+            "select goal_id, name, open from archive_goals where root=?", (root,)
+        )
+    )
+    edges: EdgesData = list(
+        connection.execute(
+            "select parent, child, reltype from archive_edges where root=?", (root,)
+        )
+    )
+    return goals, edges
+
+
+def find_archivable(
+    connection: sqlite3.Connection,
+    older_than: float = 0,
+    roots: list[int] | None = None,
+) -> dict[int, list[int]]:
+    """Find subtrees that could be archived, along with all their goals (except top ones).
+    A subtree could be archived when all its goals are closed more than `older_than`
+    days ago, have no autolinks and no links to goals outside the subtree.
+    Only the largest subtrees are returned (i.e. they never include each other),
+    unless top goals are given explicitly."""
+    closed: set[int] = {
+        goal_id
+        for goal_id, is_open in connection.execute("select goal_id, open from goals")
+        if not is_open
+    }
+    children: defaultdict[int, list[int]] = defaultdict(list)
+    links: defaultdict[int, list[int]] = defaultdict(list)
+    for parent, child, reltype in connection.execute(
+        "select parent, child, reltype from edges"
+    ):
+        links[parent].append(child)
+        links[child].append(parent)
+        if reltype == EdgeType.PARENT:
+            children[parent].append(child)
+    closed_at: dict[int, float] = dict(
+        connection.execute("select goal_id, at from closed_at")
+    )
+    autolinked: set[int] = {
+        goal for (goal,) in connection.execute("select goal from autolink")
+    }
+    (now,) = connection.execute("select julianday('now')").fetchone()
+
+    # Number subtrees in depth-first order, so that each of them is a range of numbers
+    order: dict[int, int] = {}
+    last: dict[int, int] = {}
+    stack: list[tuple[int, bool]] = [(Goals.ROOT_ID, False)]
+    while stack:
+        goal_id, done = stack.pop()
+        if done:
+            last[goal_id] = len(order) - 1
+            continue
+        order[goal_id] = len(order)
+        stack.append((goal_id, True))
+        stack.extend((c, False) for c in children[goal_id])
+
+    def subgoals(goal_id: int) -> list[int]:
+        result: list[int] = []
+        front: list[int] = list(children[goal_id])
+        while front:
+            result.append(front.pop())
+            front.extend(children[result[-1]])
+        return result
+
+    def can_archive(goal_id: int, goals: list[int]) -> bool:
+        first, end = order[goal_id], last[goal_id]
+        return (
+            goal_id in closed
+            and all(
+                g in closed
+                and g not in autolinked
+                and all(first <= order.get(x, -1) <= end for x in links[g])
+                for g in goals
+            )
+            and now - max(closed_at.get(g, 0) for g in [goal_id, *goals]) >= older_than
+        )
+
+    result: dict[int, list[int]] = {}
+    front: list[int] = list(children[Goals.ROOT_ID])
+    while front:
+        goal_id = front.pop()
+        goals: list[int] = subgoals(goal_id)
+        if (
+            goals
+            and (roots is None or goal_id in roots)
+            and can_archive(goal_id, goals)
+        ):
+            result[goal_id] = goals
+        else:
+            front.extend(children[goal_id])
+    return result
+
+
+def archive_subtrees(
+    connection: sqlite3.Connection,
+    older_than: float = 0,
+    roots: list[int] | None = None,
+) -> list[int]:
+    """Archive all subtrees that could be archived (or only the given ones).
+    Return ids of goals that have become placeholders."""
+    archivable: dict[int, list[int]] = find_archivable(connection, older_than, roots)
+    archived: dict[int, int] = dict(
+        connection.execute("select goal_id, goals from archived")
+    )
+    cur = connection.cursor()
+    for root, goals in archivable.items():
+        params: list[tuple[int, int]] = [(root, goal_id) for goal_id in goals]
+        # Previously archived subtrees are merged into the new one
+        nested: list[tuple[int, int]] = [p for p in params if p[1] in archived]
+        cur.executemany(
+            "insert into archive_goals select ?, goal_id, name, open from goals "
+            "where goal_id=?",
+            params,
+        )
+        cur.executemany(
+            "insert into archive_edges select ?, parent, child, reltype from edges "
+            "where child=?",
+            params,
+        )
+        cur.executemany("update archive_goals set root=? where root=?", nested)
+        cur.executemany("update archive_edges set root=? where root=?", nested)
+        cur.executemany(
+            "delete from archived where goal_id=?", [(g,) for _, g in nested]
+        )
+        cur.executemany("delete from edges where child=?", [(g,) for g in goals])
+        cur.executemany("delete from goals where goal_id=?", [(g,) for g in goals])
+        cur.execute(
+            "insert or replace into archived values (?, ?)",
+            (
+                root,
+                len(goals)
+                + archived.get(root, 0)
+                + sum(archived.get(g, 0) for g in goals),
+            ),
+        )
+    if archivable:
+        # Archiving is a new revision of the database, like any batch of events
+        # (see system.apply_events), so that running front-ends see it
+        cur.execute("update revision set value = value + 1")
+        cur.executemany(
+            "insert or replace into goal_revisions select ?, value from revision",
+            [(g,) for root, goals in archivable.items() for g in [root, *goals]],
+        )
+    connection.commit()
+    return list(archivable)
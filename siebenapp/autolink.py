@@ -1,3 +1,4 @@
+from collections.abc import Iterable, Iterator
 from dataclasses import dataclass, replace
 
 from siebenapp.domain import (
@@ -10,7 +11,10 @@ from siebenapp.domain import (
     Insert,
     Rename,
     Delete,
+    Sync,
+    EVERYTHING,
     GoalId,
+    QuerySpec,
     RenderResult,
     RenderRow,
 )
@@ -78,12 +82,10 @@ class AutoLink(Graph):
 
     def _autolink_new_goal(self, command: Add | Insert) -> None:
         matching: list[int] = self._find_matching_goals(command.name)
-        ids_before: set[int] = set(self.goaltree.goals.keys())
+        # Goal ids are contiguous, so the new goal (if any) has the last one
+        count_before: int = len(self.goaltree.goals)
         self.goaltree.accept(command)
-        ids_after: set[int] = set(self.goaltree.goals.keys())
-        ids_diff: set[int] = ids_after.difference(ids_before)
-        if ids_diff:
-            added_id: int = ids_diff.pop()
+        if (added_id := len(self.goaltree.goals)) > count_before:
             self._make_links(matching, added_id)
 
     def accept_Rename(self, command: Rename) -> None:
@@ -92,6 +94,9 @@ class AutoLink(Graph):
         self._make_links(matching, command.goal_id)
 
     def accept_Delete(self, command: Delete) -> None:
+        if not self.back_kw:
+            self.goaltree.accept(command)
+            return
         edges: dict[int, list[tuple[GoalId, EdgeType]]] = {
             row.raw_id: row.edges for row in self.goaltree.q().rows
         }
@@ -107,6 +112,24 @@ class AutoLink(Graph):
                 self.events().append(("remove_autolink", goal_id))
         self.goaltree.accept(command)
 
+    def accept_Sync(self, command: Sync) -> None:
+        for goal_id in [*command.removed, *(row.raw_id for row in command.rows)]:
+            if goal_id in self.back_kw:
+                self.keywords.pop(self.back_kw.pop(goal_id))
+        for row in command.rows:
+            if keyword := row.attrs.get("Autolink"):
+                self.keywords[keyword] = row.raw_id
+                self.back_kw[row.raw_id] = keyword
+        self.goaltree.accept(command)
+
+    def freeze(self) -> Graph:
+        frozen = super().freeze()
+        assert isinstance(frozen, AutoLink)
+        # Keywords are set by hand one by one, so there are few of them to copy
+        frozen.keywords = dict(self.keywords)
+        frozen.back_kw = dict(self.back_kw)
+        return frozen
+
     def _find_matching_goals(self, text: str) -> list[int]:
         return [goal_id for kw, goal_id in self.keywords.items() if kw in text.lower()]
 
@@ -120,25 +143,28 @@ class AutoLink(Graph):
             if target_goal not in self_children[add_to]:
                 self.goaltree.accept(ToggleLink(add_to, target_goal, EdgeType.PARENT))
 
-    def q(self) -> RenderResult:
-        render_result = self.goaltree.q()
+    def q(self, spec: QuerySpec = EVERYTHING) -> RenderResult:
+        render_result = self.goaltree.q(spec)
         if not self.back_kw:
             # Fast exit without creating new objects
             return render_result
-        rows: list[RenderRow] = [
-            replace(
-                row,
-                attrs=row.attrs
-                | (
-                    {"Autolink": self.back_kw[int(row.goal_id)]}
-                    if row.goal_id in self.back_kw
-                    else {}
-                ),
-            )
-            for row in render_result.rows
-        ]
+        rows: list[RenderRow] = [self._with_keyword(row) for row in render_result.rows]
         return replace(render_result, rows=rows)
 
+    def iter_rows(self, spec: QuerySpec = EVERYTHING) -> Iterator[RenderRow]:
+        rows = self.goaltree.iter_rows(spec)
+        yield from map(self._with_keyword, rows) if self.back_kw else rows
+
+    def rows_of(self, goal_ids: Iterable[int]) -> Iterator[RenderRow]:
+        return map(self._with_keyword, self.goaltree.rows_of(goal_ids))
+
+    def _with_keyword(self, row: RenderRow) -> RenderRow:
+        if row.goal_id not in self.back_kw:
+            return row
+        return replace(
+            row, attrs=row.attrs | {"Autolink": self.back_kw[int(row.goal_id)]}
+        )
+
     @staticmethod
     def export(goals: "AutoLink") -> AutoLinkData:
         return [(goal_id, kw) for goal_id, kw in goals.back_kw.items()]
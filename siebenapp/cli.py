@@ -1,18 +1,19 @@
 import sys
 import shutil
 from argparse import ArgumentParser
+from itertools import islice
 from operator import itemgetter
-from typing import Any
 from collections.abc import Mapping
 
 from siebenapp.autolink import ToggleAutoLink
+from siebenapp.daemon import socket_path
 from siebenapp.selectable_view import (
     OPTION_SELECT,
     OPTION_PREV_SELECT,
     Select,
     HoldSelect,
 )
-from siebenapp.render import GoalsHolder
+from siebenapp.session import GoalsHolder
 from siebenapp.domain import (
     ToggleClose,
     Delete,
@@ -25,15 +26,19 @@ from siebenapp.domain import (
     RenderResult,
     RenderRow,
     Command,
+    GoalId,
 )
+from siebenapp.goaltree import Goals
 from siebenapp.progress_view import ToggleProgress
 from siebenapp.filter_view import FilterBy
 from siebenapp.open_view import ToggleOpenView
 from siebenapp.switchable_view import ToggleSwitchableView
-from siebenapp.system import load
+from siebenapp.system import load, DURABILITY_MODES, SYNC, PROFILES, PROFILE_ENV, SAFE
 from siebenapp.zoom_view import ToggleZoom
 
 USER_MESSAGE: str = ""
+# Commands to scroll through goals when they don't fit the terminal
+PAGE_COMMANDS: Mapping[str, int] = {"[": -1, "]": 1}
 
 
 class IO:
@@ -48,6 +53,9 @@ class IO:
     def width(self) -> int:
         return 40
 
+    def height(self) -> int:
+        return 25
+
 
 class ConsoleIO(IO):
     def __init__(self, prompt: str):
@@ -64,6 +72,9 @@ class ConsoleIO(IO):
     def width(self) -> int:
         return shutil.get_terminal_size((80, 20))[0]
 
+    def height(self) -> int:
+        return shutil.get_terminal_size((80, 20))[1]
+
 
 def update_message(message: str = "") -> None:
     global USER_MESSAGE
@@ -112,9 +123,38 @@ def fmt(render_result: RenderResult, row: RenderRow, id_width: int) -> str:
     )
 
 
-def build_actions(command: str, goals_holder: GoalsHolder) -> list[Command]:
-    selection = int(goals_holder.goals.settings("selection"))
-    prev_selection = int(goals_holder.goals.settings("previous_selection"))
+def page_result(goals: Graph, rows: list[RenderRow]) -> RenderResult:
+    """Wrap a page of rows, marking selected goals when they are on the page."""
+    # Zoom shows the selected root goal as a fake one with id -1
+    real_ids: dict[GoalId, GoalId] = {
+        Goals.ROOT_ID if row.raw_id == -1 else row.raw_id: row.goal_id for row in rows
+    }
+    return RenderResult(
+        rows,
+        global_opts={
+            OPTION_SELECT: real_ids.get(goals.settings("selection")),
+            OPTION_PREV_SELECT: real_ids.get(goals.settings("previous_selection")),
+        },
+    )
+
+
+def by_position(render_result: RenderResult) -> list[RenderRow]:
+    """Rows of the rendered tree, from the top to the bottom."""
+    return sorted(
+        render_result.rows,
+        key=lambda r: itemgetter("row", "col")(render_result.node_opts[r.goal_id]),
+        reverse=True,
+    )
+
+
+def format_rows(render_result: RenderResult, rows: list[RenderRow]) -> list[str]:
+    id_width: int = len(str(max(r.goal_id for r in rows)))
+    return [fmt(render_result, row, id_width) for row in rows]
+
+
+def build_actions(command: str, goals: Graph) -> list[Command]:
+    selection = int(goals.settings("selection"))
+    prev_selection = int(goals.settings("previous_selection"))
     simple_commands: Mapping[str, Command] = {
         "c": ToggleClose(selection),
         "d": Delete(selection),
@@ -146,27 +186,56 @@ def build_actions(command: str, goals_holder: GoalsHolder) -> list[Command]:
     return []
 
 
-def loop(io: IO, goals: Graph, db_name: str) -> None:
+def loop(
+    io: IO,
+    goals: Graph,
+    db_name: str,
+    durability: str = SYNC,
+    profile: str | None = None,
+    snapshot: bool = False,
+    share: str | None = None,
+) -> None:
     cmd: str = ""
-    goals_holder: GoalsHolder = GoalsHolder(goals, db_name)
+    goals_holder: GoalsHolder = GoalsHolder(
+        goals,
+        db_name,
+        durability=durability,
+        profile=profile,
+        snapshot=snapshot,
+        share=share,
+    )
+    offset: int = 0
     while cmd != "q":
-        render_result, _ = goals_holder.render(100)
-        index: list[tuple[RenderRow, Any, Any]] = sorted(
-            [
-                (
-                    row,
-                    render_result.node_opts[row.goal_id]["row"],
-                    render_result.node_opts[row.goal_id]["col"],
-                )
-                for row in render_result.rows
-            ],
-            key=itemgetter(1, 2),
-            reverse=True,
+        if goals_holder.receive():
+            update_message("Goals have been changed by another window")
+        elif goals_holder.reload():
+            update_message("Goals have been changed by another process")
+        # Separator, paging hint, user message and prompt take one line each
+        page_size: int = max(io.height() - 4, 1)
+        # Rows are streamed, so only the current page (and one more row) is built
+        page: list[RenderRow] = list(
+            islice(goals_holder.goals.iter_rows(), offset, offset + page_size + 1)
         )
-        id_width: int = len(str(max(r.goal_id for r in render_result.rows)))
+        if offset and not page:
+            offset = 0
+            continue
         io.write("-" * io.width())
-        for row, _, __ in index:
-            io.write(fmt(render_result, row, id_width))
+        more: bool = len(page) > page_size
+        if offset or more:
+            # Tree doesn't fit the terminal: show goals in the order of their ids,
+            # without a layout of the whole tree
+            render_result = page_result(goals_holder.goals, page[:page_size])
+            rows: list[RenderRow] = render_result.rows
+            hints: list[str] = [
+                *(["'[' for previous goals"] if offset else []),
+                *(["']' for next goals"] if more else []),
+            ]
+            io.write(f"Goals {offset + 1}-{offset + len(rows)}, {', '.join(hints)}")
+        else:
+            render_result, _ = goals_holder.render(100)
+            rows = by_position(render_result)
+        for line in format_rows(render_result, rows):
+            io.write(line)
         if USER_MESSAGE:
             io.write(USER_MESSAGE)
         update_message()
@@ -174,8 +243,13 @@ def loop(io: IO, goals: Graph, db_name: str) -> None:
             cmd = io.read().strip()
         except EOFError:
             break
-        actions = build_actions(cmd, goals_holder)
+        if cmd in PAGE_COMMANDS:
+            if (step := PAGE_COMMANDS[cmd]) < 0 or more:
+                offset = max(offset + step * page_size, 0)
+            continue
+        actions = build_actions(cmd, goals_holder.goals)
         goals_holder.accept(*actions)
+    goals_holder.close(quitting=True)
 
 
 def main() -> None:
@@ -187,6 +261,59 @@ def main() -> None:
         default="sieben.db",
         help="Path to the database file",
     )
+    parser.add_argument(
+        "--durability",
+        choices=DURABILITY_MODES,
+        default=SYNC,
+        help="When changes are written into the database file (default: sync). "
+        "Files opened by several processes at once need sync mode",
+    )
+    parser.add_argument(
+        "--storage",
+        choices=list(PROFILES),
+        default=None,
+        help=f"Storage profile (default: ${PROFILE_ENV} or {SAFE})",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        default=False,
+        help="Fully verify goal tree on load, even when the file is known to be correct",
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        default=False,
+        help="Keep a binary snapshot next to the database file for faster startup",
+    )
+    parser.add_argument(
+        "--archive-after",
+        type=float,
+        default=None,
+        metavar="DAYS",
+        help="Archive subtrees that have been closed for more than DAYS days",
+    )
+    parser.add_argument(
+        "--lazy",
+        action="store_true",
+        help="Read goals from the database on demand (for very large files)",
+    )
     args = parser.parse_args()
-    goals = load(args.db, update_message)
-    loop(io, goals, args.db)
+    goals = load(
+        args.db,
+        update_message,
+        args.storage,
+        args.verify,
+        args.snapshot,
+        args.archive_after,
+        args.lazy,
+    )
+    loop(
+        io,
+        goals,
+        args.db,
+        args.durability,
+        args.storage,
+        args.snapshot,
+        socket_path(),
+    )
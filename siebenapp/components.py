@@ -0,0 +1,165 @@
+import atexit
+import os
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from multiprocessing import get_context
+from typing import Any
+
+from siebenapp.domain import GoalId, RenderResult, RenderRow
+
+# Layout function: takes a render result of a single component and a width limit,
+# returns the same render result with "row", "col" and "edge_render" node options
+Layout = Callable[[RenderResult, int], RenderResult]
+
+# Components of this size (or larger) are laid out in a process pool,
+# when there are at least two of them
+PARALLEL_FROM = 1000
+
+_executor: ProcessPoolExecutor | None = None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Process pool is created once and then reused by all subsequent renders.
+    Workers are spawned, not forked: the pool may be created by a background
+    thread of the app (see LayoutWorker), and a fork of a multithreaded process
+    may hold locks that are never released in the child."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(mp_context=get_context("spawn"))
+    return _executor
+
+
+@atexit.register
+def shutdown_executor() -> None:
+    """Stop worker processes; a new pool is created by the next render that needs it."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+        _executor = None
+
+
+def split_components(rr: RenderResult) -> list[RenderResult]:
+    """Split render result into connected components (edge direction is ignored).
+    Components are ordered by their first row; rows keep their original order."""
+    owner: dict[GoalId, GoalId] = {row.goal_id: row.goal_id for row in rr.rows}
+
+    def find(goal_id: GoalId) -> GoalId:
+        while owner[goal_id] != goal_id:
+            owner[goal_id] = owner[owner[goal_id]]
+            goal_id = owner[goal_id]
+        return goal_id
+
+    for row in rr.rows:
+        for target, _ in row.edges:
+            a, b = find(row.goal_id), find(target)
+            if a != b:
+                owner[b] = a
+
+    groups: dict[GoalId, list[RenderRow]] = {}
+    for row in rr.rows:
+        groups.setdefault(find(row.goal_id), []).append(row)
+    if len(groups) < 2:
+        return [rr]
+    return [
+        RenderResult(
+            rows,
+            roots={row.goal_id for row in rows if row.goal_id in rr.roots},
+            global_opts=rr.global_opts,
+        )
+        for rows in groups.values()
+    ]
+
+
+def layout_components(
+    rr: RenderResult,
+    components: list[RenderResult],
+    width: int,
+    layout: Layout,
+    fake_id_start: int = 0,
+) -> RenderResult:
+    """Lay out each component independently (large ones in parallel),
+    then pack results side by side and merge them into a single render result.
+    Layout function must be picklable (i.e. defined on the module level)."""
+    results: list[RenderResult | None] = [None] * len(components)
+    large: list[int] = [
+        i for i, c in enumerate(components) if len(c.rows) >= PARALLEL_FROM
+    ]
+    if len(large) > 1 and (os.cpu_count() or 1) > 1:
+        parallel_results = _get_executor().map(
+            layout, [components[i] for i in large], [width] * len(large)
+        )
+        for i, result in zip(large, parallel_results):
+            results[i] = result
+    # Isolated goals always have the same layout, so it's calculated only once
+    isolated: dict[str, Any] | None = None
+    for i, component in enumerate(components):
+        if results[i] is not None:
+            continue
+        if len(component.rows) == 1 and not component.rows[0].edges:
+            goal_id: GoalId = component.rows[0].goal_id
+            if isolated is None:
+                isolated = layout(component, width).node_opts[goal_id]
+            results[i] = replace(component, node_opts={goal_id: isolated})
+        else:
+            results[i] = layout(component, width)
+    return merge_components(
+        rr, [r for r in results if r is not None], width, fake_id_start
+    )
+
+
+def _bounds(rr: RenderResult) -> tuple[int, int, int]:
+    """Return min row, height and width of the component layout."""
+    rows = [opts["row"] for opts in rr.node_opts.values()]
+    cols = [opts["col"] for opts in rr.node_opts.values()]
+    return min(rows), max(rows) - min(rows) + 1, max(cols) + 1
+
+
+def merge_components(
+    rr: RenderResult, results: list[RenderResult], width: int, fake_id_start: int = 0
+) -> RenderResult:
+    """Pack component layouts into "shelves" of the given width.
+    Components on the same shelf are aligned by their top row.
+    Nodes that are created during layout (i.e. have no corresponding rows) get
+    new unique ids starting from fake_id_start."""
+    bounds: list[tuple[int, int, int]] = [_bounds(result) for result in results]
+    shelves: list[list[tuple[RenderResult, int, int, int]]] = [[]]
+    used: int = 0
+    for result, (min_row, height, comp_width) in zip(results, bounds):
+        if shelves[-1] and used + comp_width > width:
+            shelves.append([])
+            used = 0
+        shelves[-1].append((result, min_row, height, used))
+        used += comp_width
+
+    node_opts: dict[GoalId, dict[str, Any]] = {}
+    edge_opts: dict[GoalId, tuple[int, int, int]] = {}
+    next_fake: int = fake_id_start
+    top: int = min((b[0] for b in bounds), default=0)
+    for shelf in shelves:
+        shelf_height: int = max(height for _, _, height, _ in shelf)
+        for result, min_row, height, left in shelf:
+            real_ids = result.index
+            remap: dict[GoalId, GoalId] = {}
+            for goal_id in result.node_opts:
+                if goal_id not in real_ids:
+                    remap[goal_id] = next_fake
+                    next_fake -= 1
+            row_shift: int = top - min_row
+            for goal_id, opts in result.node_opts.items():
+                new_opts = opts | {
+                    "row": opts["row"] + row_shift,
+                    "col": opts["col"] + left,
+                }
+                if "edge_render" in opts:
+                    new_opts["edge_render"] = [
+                        (remap.get(target, target), e_type)
+                        for target, e_type in opts["edge_render"]
+                    ]
+                node_opts[remap.get(goal_id, goal_id)] = new_opts
+            edge_opts |= {
+                remap.get(goal_id, goal_id): value
+                for goal_id, value in result.edge_opts.items()
+            }
+        top += shelf_height
+    return replace(rr, node_opts=node_opts, edge_opts=edge_opts)
@@ -0,0 +1,339 @@
+"""Daemon that keeps goal trees loaded, so that command line tools don't have to.
+
+The daemon listens on a Unix domain socket (see socket_path). Each connection
+carries a single request and a single response, both are JSON objects on one line:
+
+    {"command": "md", "db": "/abs/path/sieben.db", "options": {...}, ...}
+    {"output": "..."} or {"error": "..."}
+
+Errors are raised in clients as DaemonError. A daemon that doesn't respond in time
+(see REQUEST_TIMEOUT) is treated as a missing one, except for requests that save
+changes: they could be saved anyway, so it's an error too.
+
+Only persistent layers of each file are kept in memory. Every request gets fresh
+view layers, so it sees the same tree as a freshly loaded one would.
+Outputs of requests that don't change the tree are reused until it's changed.
+Requests to the same file are handled one by one in a thread of their own
+(goal trees and database connections are not thread-safe), while requests
+to different files don't wait for each other.
+A file changed by another process is loaded again on the next request.
+
+Front-ends that work on the same file share their changes through the daemon, too.
+A "subscribe" request keeps its connection open, and every "publish" request
+for the same file is forwarded into it as a single line (see GoalsHolder).
+
+Requests may read and change any goal file of the user, so the socket is created
+in a private directory and only its owner could connect. Clients don't talk
+to a socket (or a directory) of another user: it's the same as no daemon at all.
+"""
+
+import asyncio
+import json
+import os
+import socket
+from collections.abc import Callable, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from os import environ, path
+from signal import SIGINT, SIGTERM
+from tempfile import gettempdir
+from threading import Thread
+from typing import Any
+
+from siebenapp.autolink import AutoLink
+from siebenapp.domain import Graph
+from siebenapp.enumeration import Enumeration
+from siebenapp.goaltree import Goals
+from siebenapp.layers import get_root, view_layers
+from siebenapp.system import JournalStorage, Storage, drain_events, load, open_storage
+
+# Environment variable with the socket path, used when no path is given explicitly
+SOCKET_ENV = "SIEBEN_SOCKET"
+
+# Handler builds the output of a request from a freshly wrapped goal tree and options
+Handler = Callable[[Graph, Mapping[str, Any]], str]
+
+# Seconds to wait for the daemon before the file is handled without it
+REQUEST_TIMEOUT = 30.0
+
+
+class DaemonError(Exception):
+    """Request has failed in the daemon, or the daemon has stopped responding
+    after it was asked to save changes."""
+
+
+def socket_path(given: str | None = None) -> str:
+    return (
+        given
+        or environ.get(SOCKET_ENV)
+        or path.join(
+            environ.get("XDG_RUNTIME_DIR") or gettempdir(),
+            f"siebenapp-{os.getuid()}",
+            "daemon.sock",
+        )
+    )
+
+
+def _owned(name: str) -> bool:
+    try:
+        return os.lstat(name).st_uid == os.getuid()
+    except FileNotFoundError:
+        return False
+
+
+def is_trusted(address: str) -> bool:
+    """Whether the socket and its directory belong to the current user."""
+    return _owned(address) and _owned(path.dirname(path.abspath(address)))
+
+
+def request(address: str, message: dict[str, Any]) -> str | None:
+    """Send a request to the daemon and return its output.
+    None is returned when the daemon is not running or doesn't respond in time.
+    DaemonError is raised when the request has failed."""
+    if not is_trusted(address):
+        return None
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(REQUEST_TIMEOUT)
+        try:
+            client.connect(address)
+            client.sendall(json.dumps(message).encode() + b"\n")
+        except (FileNotFoundError, ConnectionRefusedError, TimeoutError):
+            return None
+        try:
+            with client.makefile("rb") as stream:
+                line: bytes = stream.readline()
+        except TimeoutError:
+            if message.get("save"):
+                # Changes could still be saved by the daemon, so they are not repeated
+                raise DaemonError(
+                    f"Daemon on {address} doesn't respond, changes may be lost"
+                )
+            return None
+    response: dict[str, str] = json.loads(line)
+    if "error" in response:
+        raise DaemonError(response["error"])
+    return response["output"]
+
+
+class Subscription:
+    """Connection to the daemon that receives messages published by other front-ends
+    of the same file. Messages are received in a background thread."""
+
+    def __init__(
+        self, connection: socket.socket, receive: Callable[[dict[str, Any]], None]
+    ) -> None:
+        self.connection = connection
+        self.thread = Thread(target=self._run, args=(receive,), daemon=True)
+        self.thread.start()
+
+    def _run(self, receive: Callable[[dict[str, Any]], None]) -> None:
+        with self.connection.makefile("rb") as stream:
+            for line in stream:
+                receive(json.loads(line))
+
+    def close(self) -> None:
+        self.connection.shutdown(socket.SHUT_RDWR)
+        self.thread.join()
+        self.connection.close()
+
+
+def subscribe(
+    address: str,
+    filename: str,
+    origin: str,
+    receive: Callable[[dict[str, Any]], None],
+) -> Subscription | None:
+    """Receive messages published for the file by front-ends with other origins.
+    None is returned when the daemon is not running."""
+    if not is_trusted(address):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(REQUEST_TIMEOUT)
+    try:
+        client.connect(address)
+        message = {"command": "subscribe", "db": filename, "origin": origin}
+        client.sendall(json.dumps(message).encode() + b"\n")
+    except (FileNotFoundError, ConnectionRefusedError, TimeoutError):
+        client.close()
+        return None
+    # Subscription waits for messages as long as the front-end is running
+    client.settimeout(None)
+    return Subscription(client, receive)
+
+
+def file_stamp(filename: str) -> tuple[int, ...]:
+    """Modification time and size of the file (and of its write-ahead log, if any)."""
+    stamp: tuple[int, ...] = ()
+    for name in [filename, filename + "-wal"]:
+        if path.isfile(name):
+            info = os.stat(name)
+            stamp += (info.st_mtime_ns, info.st_size)
+    return stamp
+
+
+@dataclass
+class HotFile:
+    persistent: Graph
+    storage: Storage | JournalStorage
+    stamp: tuple[int, ...]
+    # Outputs of requests that don't change the tree, until it's changed
+    outputs: dict[str, str] = field(default_factory=dict)
+
+
+class Daemon:
+    def __init__(self, handlers: Mapping[str, Handler]) -> None:
+        self.handlers = handlers
+        self.files: dict[str, HotFile] = {}
+        self.executors: dict[str, ThreadPoolExecutor] = {}
+        # Connections of subscribers by file, with origins of their front-ends
+        self.subscribers: dict[str, dict[asyncio.StreamWriter, str]] = {}
+
+    async def start(self, address: str) -> asyncio.AbstractServer:
+        directory: str = path.dirname(path.abspath(address))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        assert _owned(directory), f"Directory {directory} belongs to another user"
+        if path.lexists(address):
+            assert _owned(address), f"Socket {address} belongs to another user"
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                try:
+                    probe.connect(address)
+                except ConnectionRefusedError:
+                    # Left by a daemon that was killed
+                    os.unlink(address)
+                else:
+                    raise AssertionError(f"Daemon is already running on {address}")
+        # Socket is created without access for others, so there's no moment
+        # when another user could connect to it
+        umask: int = os.umask(0o077)
+        try:
+            return await asyncio.start_unix_server(self._serve_client, address)
+        finally:
+            os.umask(umask)
+
+    async def _serve_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        line: bytes = await reader.readline()
+        if not line:
+            # E.g. another daemon checks whether this one is running
+            writer.close()
+            return
+        try:
+            message: dict[str, Any] = json.loads(line)
+            if message["command"] == "subscribe":
+                await self._keep_subscriber(message, reader, writer)
+                return
+            output: str = await self._respond(message)
+            response: dict[str, str] = {"output": output}
+        except Exception as e:
+            response = {"error": str(e) or type(e).__name__}
+        writer.write(json.dumps(response).encode() + b"\n")
+        try:
+            await writer.drain()
+        except ConnectionError:
+            # Client is gone, but its request is handled anyway
+            pass
+        writer.close()
+
+    async def _respond(self, message: dict[str, Any]) -> str:
+        filename: str = message["db"]
+        if message["command"] == "publish":
+            line: bytes = json.dumps(message["delta"]).encode() + b"\n"
+            for subscriber, origin in self.subscribers.get(filename, {}).items():
+                if origin != message["origin"]:
+                    # Not waiting for slow subscribers, their data is buffered
+                    subscriber.write(line)
+            return ""
+        if filename not in self.executors:
+            self.executors[filename] = ThreadPoolExecutor(max_workers=1)
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executors[filename], self.handle, message
+        )
+
+    async def _keep_subscriber(
+        self,
+        message: dict[str, Any],
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        subscribers = self.subscribers.setdefault(message["db"], {})
+        subscribers[writer] = message["origin"]
+        try:
+            # Subscribers send nothing more, so it's just a wait for disconnect
+            await reader.read()
+        finally:
+            subscribers.pop(writer)
+            writer.close()
+
+    def handle(self, message: dict[str, Any]) -> str:
+        filename: str = message["db"]
+        assert path.isabs(filename), f"Path must be absolute: {filename}"
+        assert path.isfile(filename), f"File {filename} is missing."
+        hot: HotFile | None = self.files.get(filename)
+        if hot is not None and hot.stamp != file_stamp(filename):
+            self.forget(filename)
+            hot = None
+        if hot is None:
+            stamp = file_stamp(filename)
+            tree = load(filename, profile=message.get("storage"))
+            hot = HotFile(
+                get_root(tree, AutoLink),
+                open_storage(filename, profile=message.get("storage")),
+                stamp,
+            )
+            hot.storage.watch(get_root(tree, Goals).revision)
+            self.files[filename] = hot
+        key: str = json.dumps([message["command"], message.get("options", {})])
+        if key in hot.outputs and not message.get("verify"):
+            return hot.outputs[key]
+        goals: Graph = Enumeration(view_layers(hot.persistent))
+        if message.get("verify"):
+            goals.verify()
+        output: str = self.handlers[message["command"]](
+            goals, message.get("options", {})
+        )
+        if message.get("save"):
+            rebased: bool = hot.storage.save(goals)
+            hot.stamp = file_stamp(filename)
+            hot.outputs.clear()
+            if rebased:
+                # Another process has saved its changes right before these ones
+                self.forget(filename)
+        elif drain_events(goals):
+            # Tree is changed in memory only (e.g. archived goals are shown),
+            # so it's loaded again next time
+            self.forget(filename)
+        else:
+            hot.outputs[key] = output
+        return output
+
+    def forget(self, filename: str) -> None:
+        if (hot := self.files.pop(filename, None)) is not None:
+            hot.storage.close()
+
+    def close(self) -> None:
+        for filename, executor in self.executors.items():
+            # Database connections could be closed only in threads that opened them
+            executor.submit(self.forget, filename)
+            executor.shutdown()
+
+
+def serve(address: str, handlers: Mapping[str, Handler]) -> None:
+    """Run the daemon until it's interrupted or terminated."""
+
+    async def run() -> None:
+        stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signal in [SIGINT, SIGTERM]:
+            loop.add_signal_handler(signal, stopped.set)
+        async with await daemon.start(address):
+            try:
+                await stopped.wait()
+            finally:
+                os.unlink(address)
+
+    daemon = Daemon(handlers)
+    try:
+        asyncio.run(run())
+    finally:
+        daemon.close()
@@ -1,7 +1,8 @@
 from collections import deque
-from dataclasses import dataclass, field
+from collections.abc import Iterator
+from dataclasses import dataclass, field, replace
 from enum import IntEnum
-from typing import Any, Optional
+from typing import Any, ClassVar, Optional
 
 
 class EdgeType(IntEnum):
@@ -86,6 +87,53 @@ class RenderResult:
         return self.rows[self.index[goal_id]]
 
 
+@dataclass(frozen=True)
+class QuerySpec:
+    """Rows that are needed by the caller of q(), so that lower layers could skip
+    building rows that would be thrown away anyway.
+
+    A row is needed when it's open (or `open_only` is not set), contains `pattern`
+    in its lowercase name and belongs to the zoomed subtree of the `subtree` goal
+    (when it's set; see ZoomView for what is visible there). Rows of `keep` ids and
+    root goals are always needed.
+
+    Layers may return more rows than needed, so callers still filter rows themselves.
+    Edges to skipped rows are skipped, too, and roots are only exact for needed rows."""
+
+    open_only: bool = False
+    pattern: str = ""
+    subtree: GoalId = 0
+    keep: frozenset[GoalId] = frozenset()
+
+    # When disabled, all layers query everything (used to compare results in tests)
+    push_down: ClassVar[bool] = True
+
+    def narrow(self, **changes: Any) -> "QuerySpec":
+        """Return the same spec with given restrictions."""
+        return replace(self, **changes) if QuerySpec.push_down else self
+
+    def accepts(self, goal_id: GoalId, name: str, is_open: bool) -> bool:
+        """Whether the row is needed. Subtree membership is checked separately."""
+        return goal_id in self.keep or (
+            (is_open or not self.open_only) and self.pattern in name.lower()
+        )
+
+
+EVERYTHING = QuerySpec()
+
+
+def selected_ids(goals: "Graph") -> frozenset[GoalId]:
+    """Ids of selected goals, which are always shown by view layers."""
+    return frozenset(
+        goal_id
+        for goal_id in (
+            goals.settings("selection"),
+            goals.settings("previous_selection"),
+        )
+        if isinstance(goal_id, int)
+    )
+
+
 class Graph:
     """Base interface definition"""
 
@@ -138,10 +186,17 @@ class Graph:
             return self.goaltree.events()
         raise NotImplementedError
 
-    def q(self) -> RenderResult:
-        """Run search query against content"""
+    def q(self, spec: QuerySpec = EVERYTHING) -> RenderResult:
+        """Run search query against content (see QuerySpec for the meaning of spec)"""
         raise NotImplementedError
 
+    def iter_rows(self, spec: QuerySpec = EVERYTHING) -> Iterator[RenderRow]:
+        """Rows of q(spec) in the same order: real goals ordered by id, fake ones last.
+        Layers that can decide on each row separately build rows one by one,
+        so that callers which need only first rows don't wait for all of them.
+        By default, the whole result of q() is built first."""
+        yield from self.q(spec).rows
+
     def error(self, message: str) -> None:
         """Show error message"""
         if self.__has_goaltree():
@@ -152,6 +207,23 @@ class Graph:
         if self.__has_goaltree():
             self.goaltree.verify()
 
+    def can_freeze(self) -> bool:
+        """Whether freeze() is supported by all layers of the graph."""
+        if self.__has_goaltree():
+            return self.goaltree.can_freeze()
+        return True
+
+    def freeze(self) -> "Graph":
+        """Read-only copy of the graph that is not changed along with it, so that
+        it could be queried in another thread while this one accepts commands.
+        It's cheap: layers copy only their own settings, goals are shared."""
+        # Not copy.copy(): it looks for methods that end up in __getattr__,
+        # while the copy has no goaltree yet
+        frozen: Graph = self.__class__.__new__(self.__class__)
+        frozen.__dict__.update(self.__dict__)
+        frozen.goaltree = self.goaltree.freeze() if self.__has_goaltree() else frozen
+        return frozen
+
 
 # == Command implementations ==
 
@@ -206,3 +278,21 @@ class Delete(Command):
     """Remove given or selected goal whether it exists. Do nothing in other case"""
 
     goal_id: int
+
+
+@dataclass(frozen=True)
+class Unarchive(Command):
+    """Bring archived subgoals of the given goal back into the goal tree.
+    When goal_id is 0, all archived goals are brought back"""
+
+    goal_id: int = 0
+
+
+@dataclass(frozen=True)
+class Sync(Command):
+    """Bring goals in line with another copy of the goal tree, where they have been
+    changed (and saved) already. Rows of changed and added goals are built by
+    persistent layers; removed goals are given by their ids. No events are produced"""
+
+    rows: tuple[RenderRow, ...]
+    removed: tuple[GoalId, ...] = ()
@@ -1,8 +1,16 @@
 import math
-from collections.abc import Iterable
+from collections import deque
+from collections.abc import Iterable, Iterator
 from dataclasses import replace
 
-from siebenapp.domain import Graph, GoalId, RenderResult, RenderRow
+from siebenapp.domain import (
+    EVERYTHING,
+    Graph,
+    GoalId,
+    QuerySpec,
+    RenderResult,
+    RenderRow,
+)
 from siebenapp.selectable_view import Select
 
 
@@ -13,6 +21,11 @@ class BidirectionalIndex:
         self.m = {g: i + 1 for i, g in enumerate(sorted(g for g in goals if g > 0))}
         self.length = len(self.m)
 
+    def append(self, goal_id: GoalId) -> None:
+        """Add the next goal. Goals must be added in ascending order."""
+        self.m[goal_id] = len(self.m) + 1
+        self.length = len(self.m)
+
     def forward(self, goal_id: GoalId) -> int:
         if goal_id < 0:
             return goal_id
@@ -35,6 +48,14 @@ class BidirectionalIndex:
         return BidirectionalIndex.NOT_FOUND
 
 
+def _renumber(row: RenderRow, index: BidirectionalIndex) -> RenderRow:
+    return replace(
+        row,
+        goal_id=index.forward(row.goal_id),
+        edges=[(index.forward(e[0]), e[1]) for e in row.edges],
+    )
+
+
 class Enumeration(Graph):
     def __init__(self, goaltree: Graph) -> None:
         super().__init__(goaltree)
@@ -46,16 +67,10 @@ class Enumeration(Graph):
             [r.goal_id for r in render_result.rows]
         )
 
-    def q(self) -> RenderResult:
+    def q(self, spec: QuerySpec = EVERYTHING) -> RenderResult:
+        # Numbers depend on all rows, so nothing could be skipped
         render_result, index = self._id_mapping()
-        rows: list[RenderRow] = [
-            replace(
-                row,
-                goal_id=index.forward(row.goal_id),
-                edges=[(index.forward(e[0]), e[1]) for e in row.edges],
-            )
-            for row in render_result.rows
-        ]
+        rows: list[RenderRow] = [_renumber(row, index) for row in render_result.rows]
         new_global_opts = {
             k: index.forward(v) for k, v in render_result.global_opts.items()
         }
@@ -66,6 +81,31 @@ class Enumeration(Graph):
             global_opts=new_global_opts,
         )
 
+    def iter_rows(self, spec: QuerySpec = EVERYTHING) -> Iterator[RenderRow]:
+        """Numbers depend on positions of goals among all rows. As rows are ordered
+        by goal id, a row is held back only until numbers of the row itself and
+        of all its edges are known. Numbering does not change anymore when there
+        are more than 900 goals, so this happens soon for any large tree."""
+        index = BidirectionalIndex([])
+        pending: deque[RenderRow] = deque()
+        last_id: GoalId = 0
+
+        def ready(row: RenderRow) -> bool:
+            return index.length > 900 and all(
+                e[0] < 0 or e[0] in index.m for e in row.edges
+            )
+
+        for row in self.goaltree.iter_rows():
+            if row.goal_id > 0:
+                assert row.goal_id > last_id, "Rows must be ordered by goal id"
+                last_id = row.goal_id
+                index.append(last_id)
+            pending.append(row)
+            while pending and ready(pending[0]):
+                yield _renumber(pending.popleft(), index)
+        for row in pending:
+            yield _renumber(row, index)
+
     def accept_Select(self, command: Select):
         render_result, index = self._id_mapping()
         goals: set[GoalId] = {row.goal_id for row in render_result.rows}
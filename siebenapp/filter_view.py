@@ -1,7 +1,17 @@
+from collections.abc import Iterator
 from dataclasses import dataclass, replace
 from typing import Any
 
-from siebenapp.domain import Graph, Command, RenderResult, RenderRow, GoalId
+from siebenapp.domain import (
+    Graph,
+    Command,
+    EVERYTHING,
+    QuerySpec,
+    RenderResult,
+    RenderRow,
+    GoalId,
+    selected_ids,
+)
 
 
 @dataclass(frozen=True)
@@ -28,10 +38,13 @@ class FilterView(Graph):
         super().reconfigure_from(origin)
         self.pattern = origin.settings("filter_pattern")
 
-    def q(self) -> RenderResult:
-        render_result = self.goaltree.q()
+    def q(self, spec: QuerySpec = EVERYTHING) -> RenderResult:
         if not self.pattern:
-            return render_result
+            return self.goaltree.q(spec)
+        # Roots are built below from accepted rows only, so other ones are not needed
+        render_result = self.goaltree.q(
+            spec.narrow(pattern=self.pattern, keep=spec.keep | selected_ids(self))
+        )
         accepted_ids: set[GoalId] = {
             row.goal_id
             for row in render_result.rows
@@ -65,3 +78,10 @@ class FilterView(Graph):
         linked_ids: set[GoalId] = {goal_id for r in rows for goal_id, _ in r.edges}
         new_roots: set[GoalId] = all_ids.difference(linked_ids)
         return replace(render_result, rows=rows, roots=new_roots)
+
+    def iter_rows(self, spec: QuerySpec = EVERYTHING) -> Iterator[RenderRow]:
+        if not self.pattern:
+            return self.goaltree.iter_rows(spec)
+        # Edges are kept only to matching rows, which may be built later.
+        # Anyway, only matching rows are built below
+        return super().iter_rows(spec)
@@ -1,5 +1,12 @@
 from collections import deque, defaultdict
-from collections.abc import Callable
+from collections.abc import (
+    Callable,
+    Iterable,
+    Iterator,
+    Mapping,
+    MutableMapping,
+    MutableSet,
+)
 from typing import Any
 
 from siebenapp.domain import (
@@ -12,14 +19,53 @@ from siebenapp.domain import (
     Add,
     Insert,
     Rename,
+    Unarchive,
+    Sync,
+    EVERYTHING,
     GoalId,
+    QuerySpec,
     RenderResult,
     RenderRow,
 )
+from siebenapp.tracked import (
+    FrozenAdjacency,
+    FrozenMapping,
+    FrozenSetView,
+    tracked_adjacency,
+    tracked_dict,
+    tracked_set,
+)
 
 GoalsData = list[tuple[int, str | None, bool]]
 EdgesData = list[tuple[int, int, EdgeType]]
 
+# Only open rows are built when at least this share of goals is closed
+NARROW_OPEN_FROM = 0.3
+
+# Loads goals and edges of the archived subtree by the id of its placeholder goal
+ArchiveLoader = Callable[[int], tuple[GoalsData, EdgesData]]
+
+
+def _blocker() -> EdgeType:
+    return EdgeType.BLOCKER
+
+
+def _edge_map() -> dict[int, EdgeType]:
+    return defaultdict(_blocker)
+
+
+_EDGE_TYPES: dict[int, EdgeType] = {int(t): t for t in EdgeType}
+
+
+def _fill_adjacency(
+    adjacency: dict[int, dict[int, EdgeType]],
+    sources: list[int],
+    targets: list[int],
+    types: list[EdgeType],
+) -> None:
+    for source, target, edge_type in zip(sources, targets, types):
+        adjacency[source][target] = edge_type
+
 
 class Goals(Graph):
     ROOT_ID = 1
@@ -28,17 +74,24 @@ class Goals(Graph):
         self, name: str, message_fn: Callable[[str], None] | None = None
     ) -> None:
         super().__init__()
-        self.goals: dict[int, str | None] = {}
-        self.edges: dict[tuple[int, int], EdgeType] = {}
-        self.edges_forward: dict[int, dict[int, EdgeType]] = defaultdict(
-            lambda: defaultdict(lambda: EdgeType.BLOCKER)
+        # Containers are declared by their abstract types, so that they could be
+        # replaced with ones that read goals from the database (see siebenapp.lazy)
+        self.goals: MutableMapping[int, str | None] = {}
+        self.edges: MutableMapping[tuple[int, int], EdgeType] = {}
+        self.edges_forward: Mapping[int, MutableMapping[int, EdgeType]] = defaultdict(
+            _edge_map
         )
-        self.edges_backward: dict[int, dict[int, EdgeType]] = defaultdict(
-            lambda: defaultdict(lambda: EdgeType.BLOCKER)
+        self.edges_backward: Mapping[int, MutableMapping[int, EdgeType]] = defaultdict(
+            _edge_map
         )
-        self.closed: set[int] = set()
+        self.closed: MutableSet[int] = set()
         self._events: deque = deque()
         self.message_fn: Callable[[str], None] | None = message_fn
+        # Placeholder goals of archived subtrees, with numbers of archived goals
+        self.archived: dict[int, int] = {}
+        self.archive_loader: ArchiveLoader | None = None
+        # Revision of the database that goals have been read at (see system.Storage)
+        self.revision: int | None = None
         self._add_no_link(name)
 
     def has_goal(self, goal_id: int) -> bool:
@@ -70,11 +123,35 @@ class Goals(Graph):
         return self._strict_parent(goal) or Goals.ROOT_ID
 
     def settings(self, key: str) -> Any:
+        if key == "archived":
+            return self.archived
         return Graph.NO_VALUE
 
     def events(self) -> deque:
         return self._events
 
+    def freeze(self) -> Graph:
+        # Containers are tracked since the first frozen copy, which takes O(goals)
+        # once; later copies share them and keep only old values of changed goals
+        self.goals = tracked_dict(self.goals)
+        self.edges = tracked_dict(self.edges)
+        self.edges_forward = tracked_adjacency(self.edges_forward)
+        self.edges_backward = tracked_adjacency(self.edges_backward)
+        self.closed = tracked_set(self.closed)
+        frozen = super().freeze()
+        assert isinstance(frozen, Goals)
+        frozen.goals = FrozenMapping(self.goals)
+        frozen.edges = FrozenMapping(self.edges)
+        frozen.edges_forward = FrozenAdjacency(self.edges_forward)
+        frozen.edges_backward = FrozenAdjacency(self.edges_backward)
+        frozen.closed = FrozenSetView(self.closed)
+        # There are few archived subtrees, and they could be loaded back
+        # only by the thread that owns the database connection
+        frozen.archived = dict(self.archived)
+        frozen.archive_loader = None
+        frozen._events = deque()
+        return frozen
+
     def accept_Add(self, command: Add) -> bool:
         add_to: int = command.add_to
         if self.is_closed(add_to):
@@ -85,31 +162,111 @@ class Goals(Graph):
         return True
 
     def _add_no_link(self, name: str) -> int:
-        next_id: int = max(list(self.goals.keys()) + [0]) + 1
+        # Goal ids are always contiguous, deleted goals are kept as holes
+        next_id: int = len(self.goals) + 1
         self.goals[next_id] = name
         self._events.append(("add", next_id, name, True))
         return next_id
 
-    def q(self) -> RenderResult:
-        rows: list[RenderRow] = []
-        for key, name in ((k, n) for k, n in self.goals.items() if n is not None):
-            edges: list[tuple[GoalId, EdgeType]] = sorted(
-                [(e.target, e.type) for e in self._forward_edges(key)]
+    def q(self, spec: QuerySpec = EVERYTHING) -> RenderResult:
+        return RenderResult(list(self.iter_rows(spec)), roots={Goals.ROOT_ID})
+
+    def iter_rows(self, spec: QuerySpec = EVERYTHING) -> Iterator[RenderRow]:
+        """Build rows needed by the spec one by one, with edges between them.
+        Checks of each row cost about as much as the rows of few closed goals,
+        so all rows are built when only open ones are needed, but most goals are open
+        (callers filter rows anyway, see QuerySpec)."""
+        if self._builds_all_rows(spec, len(self.closed), len(self.goals)):
+            for key, name in self.goals.items():
+                if name is not None:
+                    yield self._render_row(
+                        key,
+                        name,
+                        not self.is_closed(key),
+                        self._switchable(key),
+                        self.edges_forward[key].items(),
+                    )
+            return
+        subtree: set[int] | None = (
+            self._zoomed_subtree(spec.subtree) | spec.keep | {Goals.ROOT_ID}
+            if spec.subtree
+            else None
+        )
+
+        def is_needed(key: int) -> bool:
+            name: str | None = self.goals.get(key)
+            return (
+                (subtree is None or key in subtree)
+                and name is not None
+                and (
+                    key == Goals.ROOT_ID
+                    or spec.accepts(key, name, not self.is_closed(key))
+                )
             )
-            rows.append(
-                RenderRow(
-                    key,
+
+        for key in sorted(subtree) if subtree is not None else self.goals:
+            if is_needed(key):
+                name = self.goals[key]
+                assert name is not None
+                yield self._render_row(
                     key,
                     name,
                     not self.is_closed(key),
                     self._switchable(key),
-                    True,
-                    edges,
+                    (e for e in self.edges_forward[key].items() if is_needed(e[0])),
                 )
-            )
-        return RenderResult(
-            rows,
-            roots={Goals.ROOT_ID},
+
+    def rows_of(self, goal_ids: Iterable[int]) -> Iterator[RenderRow]:
+        """Rows of the given goals (deleted ones are skipped) with all their edges.
+        Switchability is not calculated, like in rows read by system.read_rows."""
+        for key in goal_ids:
+            if (name := self.goals.get(key)) is not None:
+                yield self._render_row(
+                    key,
+                    name,
+                    not self.is_closed(key),
+                    False,
+                    self.edges_forward[key].items(),
+                )
+
+    @staticmethod
+    def _builds_all_rows(spec: QuerySpec, closed: int, total: int) -> bool:
+        return spec == EVERYTHING or (
+            spec == QuerySpec(open_only=True, keep=spec.keep)
+            and closed < total * NARROW_OPEN_FROM
+        )
+
+    def _zoomed_subtree(self, root: int) -> set[int]:
+        """Goals that are visible when zoomed into the given one (as in ZoomView):
+        all its subgoals and goals they are linked to."""
+        visible: set[int] = {root}
+        edges_to_visit: set[tuple[int, EdgeType]] = set(
+            self.edges_forward[root].items()
+        )
+        while edges_to_visit:
+            goal_id, edge_type = edges_to_visit.pop()
+            visible.add(goal_id)
+            if edge_type == EdgeType.PARENT:
+                edges_to_visit.update(self.edges_forward[goal_id].items())
+        return visible
+
+    def _render_row(
+        self,
+        key: int,
+        name: str,
+        is_open: bool,
+        switchable: bool,
+        edges: Iterable[tuple[int, EdgeType]],
+    ) -> RenderRow:
+        return RenderRow(
+            key,
+            key,
+            name,
+            is_open,
+            switchable,
+            True,
+            sorted(edges),
+            {"Archived": str(self.archived[key])} if key in self.archived else {},
         )
 
     def _switchable(self, key: int) -> bool:
@@ -210,6 +367,8 @@ class Goals(Graph):
     def _delete_subtree(self, goal_id: int) -> None:
         parent: int = self.parent(goal_id)
         self.goals[goal_id] = None
+        # Archived goals are removed from the storage together with their placeholder
+        self.archived.pop(goal_id, None)
         self.closed.add(goal_id)
         forward_edges: list[Edge] = self._forward_edges(goal_id)
         next_to_remove: set[Edge] = {
@@ -219,12 +378,13 @@ class Goals(Graph):
             e for e in forward_edges if e.type != EdgeType.PARENT
         }
         for back_edge in self._back_edges(goal_id):
+            self.edges.pop((back_edge.source, goal_id))
             self.edges_forward[back_edge.source].pop(goal_id)
-        self.edges_forward[goal_id].clear()
         for forward_edge in forward_edges:
+            self.edges.pop((goal_id, forward_edge.target))
             self.edges_backward[forward_edge.target].pop(goal_id)
+        self.edges_forward[goal_id].clear()
         self.edges_backward[goal_id].clear()
-        self.edges = {k: v for k, v in self.edges.items() if goal_id not in k}
         for g in dangling_goals:
             if not self._back_edges(g.target):
                 self._create_new_link(parent, g.target, g.type)
@@ -233,6 +393,80 @@ class Goals(Graph):
                 self._delete_subtree(next_goal.target)
         self._events.append(("delete", goal_id))
 
+    def attach_archive(
+        self, archived: dict[int, int], last_id: int, loader: ArchiveLoader
+    ) -> None:
+        """Remember placeholders of archived subtrees and a way to load them back.
+        Ids of archived goals are reserved, so that new goals never reuse them."""
+        for goal_id in range(len(self.goals) + 1, last_id + 1):
+            self.goals[goal_id] = None
+            self.closed.add(goal_id)
+        self.archived = archived
+        self.archive_loader = loader
+
+    def accept_Unarchive(self, command: Unarchive) -> None:
+        roots: list[int] = (
+            list(self.archived) if command.goal_id == 0 else [command.goal_id]
+        )
+        for root in roots:
+            if root not in self.archived:
+                continue
+            assert self.archive_loader is not None
+            goals, edges = self.archive_loader(root)
+            for goal_id, name, is_open in goals:
+                self.goals[goal_id] = name
+                if is_open:
+                    self.closed.discard(goal_id)
+            for parent, child, link_type in edges:
+                edge_type: EdgeType = _EDGE_TYPES[link_type]
+                self.edges[parent, child] = edge_type
+                self.edges_forward[parent][child] = edge_type
+                self.edges_backward[child][parent] = edge_type
+            self.archived.pop(root)
+            self._events.append(("unarchive", root))
+
+    def accept_Sync(self, command: Sync) -> None:
+        for goal_id in command.removed:
+            self.goals[goal_id] = None
+            self.closed.add(goal_id)
+            self.archived.pop(goal_id, None)
+            self._replace_forward_edges(goal_id, [])
+            # Rows of parents may be left unchanged, when they are not given
+            for source in list(self.edges_backward[goal_id]):
+                self.edges.pop((source, goal_id))
+                self.edges_forward[source].pop(goal_id)
+            self.edges_backward[goal_id].clear()
+        for row in command.rows:
+            goal_id = row.raw_id
+            # Goals that were added and deleted since the last sync are kept as holes
+            for hole in range(len(self.goals) + 1, goal_id):
+                self.goals[hole] = None
+                self.closed.add(hole)
+            self.goals[goal_id] = row.name
+            if row.is_open:
+                self.closed.discard(goal_id)
+            else:
+                self.closed.add(goal_id)
+            if "Archived" in row.attrs:
+                self.archived[goal_id] = int(row.attrs["Archived"])
+            else:
+                self.archived.pop(goal_id, None)
+        # Edges are linked when all their goals exist
+        for row in command.rows:
+            self._replace_forward_edges(row.raw_id, row.edges)
+
+    def _replace_forward_edges(
+        self, goal_id: int, edges: Iterable[tuple[int, EdgeType]]
+    ) -> None:
+        for target in list(self.edges_forward[goal_id]):
+            self.edges.pop((goal_id, target))
+            self.edges_backward[target].pop(goal_id)
+        self.edges_forward[goal_id].clear()
+        for target, edge_type in edges:
+            self.edges[goal_id, target] = edge_type
+            self.edges_forward[goal_id][target] = edge_type
+            self.edges_backward[target][goal_id] = edge_type
+
     def accept_ToggleLink(self, command: ToggleLink) -> None:
         if (lower := command.lower) == (upper := command.upper):
             self.error("Goal can't be linked to itself")
@@ -385,26 +619,64 @@ class Goals(Graph):
 
     @staticmethod
     def build(
-        goals: GoalsData,
-        edges: EdgesData,
+        goals: Iterable[tuple[int, str | None, bool]],
+        edges: Iterable[tuple[int, int, int]],
         message_fn: Callable[[str], None] | None = None,
+        verify: bool = True,
     ) -> "Goals":
+        """Build goal tree from raw data in a single pass over goals and edges.
+        Both could be given as database cursors, so rows are not copied into lists.
+        Verification could be skipped when data is already known to be correct."""
         result: Goals = Goals("", message_fn)
         result._events.clear()
-        goals_dict: dict[int, str | None] = {g[0]: g[1] for g in goals}
-        result.goals = {
-            i: goals_dict.get(i) for i in range(1, max(goals_dict.keys()) + 1)
-        }
-
-        result.closed = {g[0] for g in goals if not g[2]}.union(
-            {k for k, v in result.goals.items() if v is None}
-        )
-
+        names: dict[int, str | None] = {}
+        closed: set[int] = set()
+        for goal_id, name, is_open in goals:
+            names[goal_id] = name
+            if not is_open:
+                closed.add(goal_id)
+        # Deleted goals are kept as (closed) holes, so that their ids are never reused
+        result.goals = {i: names.get(i) for i in range(1, max(names.keys()) + 1)}
+        if len(names) < len(result.goals):
+            closed.update(k for k, v in result.goals.items() if v is None)
+        result.closed = closed
+
+        all_edges = result.edges
+        forward = result.edges_forward
+        backward = result.edges_backward
         for parent, child, link_type in edges:
-            result.edges[parent, child] = EdgeType(link_type)
-            result.edges_forward[parent][child] = EdgeType(link_type)
-            result.edges_backward[child][parent] = EdgeType(link_type)
-        result.verify()
+            edge_type: EdgeType = _EDGE_TYPES[link_type]
+            all_edges[parent, child] = edge_type
+            forward[parent][child] = edge_type
+            backward[child][parent] = edge_type
+        if verify:
+            result.verify()
+        return result
+
+    @staticmethod
+    def build_packed(
+        names: list[str | None],
+        closed: set[int],
+        parents: list[int],
+        children: list[int],
+        types: list[int],
+        message_fn: Callable[[str], None] | None = None,
+    ) -> "Goals":
+        """Build goal tree from packed columns without verification.
+        Names are ordered by goal id (None for deleted goals), edges are given
+        as three columns: parents, children and edge types."""
+        result: Goals = Goals("", message_fn)
+        result._events.clear()
+        result.goals = dict(zip(range(1, len(names) + 1), names))
+        result.closed = closed
+        edge_types: list[EdgeType] = list(map(_EDGE_TYPES.__getitem__, types))
+        result.edges = dict(zip(zip(parents, children), edge_types))
+        forward: dict[int, dict[int, EdgeType]] = defaultdict(_edge_map)
+        backward: dict[int, dict[int, EdgeType]] = defaultdict(_edge_map)
+        _fill_adjacency(forward, parents, children, edge_types)
+        _fill_adjacency(backward, children, parents, edge_types)
+        result.edges_forward = forward
+        result.edges_backward = backward
         return result
 
     @staticmethod
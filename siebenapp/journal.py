@@ -0,0 +1,296 @@
+"""Append-only journal of goal tree events: an alternative to the SQLite database,
+used for files with the JOURNAL_EXTENSION (see system.open_storage).
+
+Journal starts with a header, followed by records. Each record is a batch of events
+written by a single save: payload length, CRC32 of the payload and the payload itself.
+A record is written with a single write() call, so a crash may only leave a torn
+record at the very end of the file; such record is ignored (and overwritten later).
+
+When the journal grows large, it's compacted in background: all its records are
+replayed and replaced with a single record that adds all goals, edges and autolinks.
+Records appended during compaction are copied after it.
+"""
+
+import os
+from collections import defaultdict
+from collections.abc import Iterator
+from os import replace
+from struct import Struct
+from threading import Thread
+from typing import Any, BinaryIO
+from zlib import crc32
+
+JOURNAL_EXTENSION = ".journal"
+
+MAGIC = b"SIEBJRNL"
+FORMAT_VERSION = 1
+# magic, format version
+HEADER = Struct("<8sI")
+# payload length, CRC32 of the payload
+RECORD = Struct("<II")
+INT = Struct("<q")
+LENGTH = Struct("<I")
+# Length of a missing string (i.e. a name of the deleted goal)
+NO_STRING = 0xFFFFFFFF
+
+# Journal is compacted when it becomes larger than this size,
+# and twice larger than its last compacted state
+COMPACT_FROM = 4 << 20
+
+# Fields of each event kind: i -- int, b -- bool, s -- string (or None).
+# Kinds are encoded by their position in this dict, so new ones must be added to the end.
+FIELDS: dict[str, str] = {
+    "add": "isb",
+    "toggle_close": "bi",
+    "rename": "si",
+    "link": "iii",
+    "unlink": "iii",
+    "delete": "i",
+    "add_autolink": "is",
+    "remove_autolink": "i",
+    # Journals have no archive, so this event changes nothing there
+    "unarchive": "i",
+}
+KINDS: list[str] = list(FIELDS)
+KIND_CODES: dict[str, int] = {kind: code for code, kind in enumerate(KINDS)}
+
+Event = tuple[Any, ...]
+
+
+def is_journal(filename: str) -> bool:
+    return filename.endswith(JOURNAL_EXTENSION)
+
+
+def encode_events(events: list[Event]) -> bytes:
+    result: bytearray = bytearray()
+    for event in events:
+        kind: str = event[0]
+        result.append(KIND_CODES[kind])
+        for field, value in zip(FIELDS[kind], event[1:]):
+            if field == "i":
+                result += INT.pack(value)
+            elif field == "b":
+                result.append(1 if value else 0)
+            elif value is None:
+                result += LENGTH.pack(NO_STRING)
+            else:
+                data: bytes = value.encode("utf-8")
+                result += LENGTH.pack(len(data))
+                result += data
+    return bytes(result)
+
+
+def decode_events(payload: bytes) -> list[Event]:
+    events: list[Event] = []
+    pos: int = 0
+    while pos < len(payload):
+        kind: str = KINDS[payload[pos]]
+        pos += 1
+        event: list[Any] = [kind]
+        for field in FIELDS[kind]:
+            if field == "i":
+                event.append(INT.unpack_from(payload, pos)[0])
+                pos += INT.size
+            elif field == "b":
+                event.append(payload[pos] == 1)
+                pos += 1
+            else:
+                (length,) = LENGTH.unpack_from(payload, pos)
+                pos += LENGTH.size
+                if length == NO_STRING:
+                    event.append(None)
+                else:
+                    event.append(str(payload[pos : pos + length], "utf-8"))
+                    pos += length
+        events.append(tuple(event))
+    return events
+
+
+def make_record(events: list[Event]) -> bytes:
+    payload: bytes = encode_events(events)
+    return RECORD.pack(len(payload), crc32(payload)) + payload
+
+
+def _records(data: bytes) -> Iterator[tuple[bytes, int]]:
+    """Yield payloads of all complete records together with their end offsets.
+    Iteration stops at the first torn (or otherwise broken) record."""
+    pos: int = HEADER.size
+    while pos + RECORD.size <= len(data):
+        length, checksum = RECORD.unpack_from(data, pos)
+        start: int = pos + RECORD.size
+        payload: bytes = data[start : start + length]
+        if length == 0 or len(payload) < length or crc32(payload) != checksum:
+            return
+        pos = start + length
+        yield payload, pos
+
+
+def _read(filename: str, limit: int = -1) -> bytes:
+    with open(filename, "rb") as f:
+        data: bytes = f.read(limit)
+    if len(data) < HEADER.size or HEADER.unpack_from(data) != (MAGIC, FORMAT_VERSION):
+        raise ValueError(f"{filename} is not a goal journal")
+    return data
+
+
+class JournalState:
+    """Tables of the goal database, restored by replaying events in memory.
+    Events are applied exactly like the SQL statements in system.UPDATE_ACTIONS."""
+
+    def __init__(self) -> None:
+        self.goals: dict[int, tuple[str | None, bool]] = {}
+        self.edges: dict[tuple[int, int, int], None] = {}
+        self.autolink: dict[int, str] = {}
+        # Edges of each goal, so that they are removed together with it
+        self.goal_edges: defaultdict[int, set[tuple[int, int, int]]] = defaultdict(set)
+
+    def apply(self, events: list[Event]) -> None:
+        for event in events:
+            kind: str = event[0]
+            if kind == "add":
+                self.goals[event[1]] = (event[2], event[3])
+            elif kind == "rename":
+                if event[2] in self.goals:
+                    self.goals[event[2]] = (event[1], self.goals[event[2]][1])
+            elif kind == "toggle_close":
+                if event[2] in self.goals:
+                    self.goals[event[2]] = (self.goals[event[2]][0], event[1])
+            elif kind == "link":
+                key = (event[1], event[2], event[3])
+                self.edges[key] = None
+                self.goal_edges[event[1]].add(key)
+                self.goal_edges[event[2]].add(key)
+            elif kind == "unlink":
+                self._unlink((event[1], event[2], event[3]))
+            elif kind == "delete":
+                self.goals.pop(event[1], None)
+                for key in list(self.goal_edges.pop(event[1], ())):
+                    self._unlink(key)
+            elif kind == "add_autolink":
+                self.autolink[event[1]] = event[2]
+            elif kind == "remove_autolink":
+                self.autolink.pop(event[1], None)
+
+    def _unlink(self, key: tuple[int, int, int]) -> None:
+        self.edges.pop(key, None)
+        for goal_id in key[:2]:
+            if goal_id in self.goal_edges:
+                self.goal_edges[goal_id].discard(key)
+
+    def events(self) -> list[Event]:
+        """Return events that restore the same state from scratch."""
+        return (
+            [
+                ("add", goal_id, name, is_open)
+                for goal_id, (name, is_open) in sorted(self.goals.items())
+            ]
+            + [("link", *key) for key in self.edges]
+            + [("add_autolink", goal_id, kw) for goal_id, kw in self.autolink.items()]
+        )
+
+
+def read_journal(filename: str, limit: int = -1) -> JournalState:
+    """Replay all complete records of the journal (or its first `limit` bytes)."""
+    state = JournalState()
+    for payload, _ in _records(_read(filename, limit)):
+        state.apply(decode_events(payload))
+    return state
+
+
+def create_journal(filename: str, events: list[Event]) -> None:
+    """Atomically create a new journal with a single record."""
+    with open(f"{filename}.tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION) + make_record(events))
+        f.flush()
+        os.fsync(f.fileno())
+    replace(f"{filename}.tmp", filename)
+
+
+class Compaction:
+    """Replay the first `length` bytes of the journal in a background thread
+    and write them as a single record into a temporary file.
+    Journal itself is not changed until `Journal` applies the result."""
+
+    def __init__(self, filename: str, length: int) -> None:
+        self.filename = filename
+        self.length = length
+        self.target = f"{filename}.compact"
+        self.base_size: int = 0
+        self.error: Exception | None = None
+        self.thread = Thread(target=self._run, name="sieben-compaction", daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        try:
+            state: JournalState = read_journal(self.filename, self.length)
+            record: bytes = make_record(state.events())
+            with open(self.target, "wb") as f:
+                f.write(HEADER.pack(MAGIC, FORMAT_VERSION) + record)
+            self.base_size = len(record)
+        except Exception as e:
+            self.error = e
+
+
+class Journal:
+    """Open journal file that accepts new records.
+    A torn record left by a crash is cut off before anything is appended.
+    With `sync`, every record is flushed to disk before `append` returns."""
+
+    def __init__(
+        self, filename: str, sync: bool = True, compact_from: int = COMPACT_FROM
+    ) -> None:
+        self.filename = filename
+        self.sync = sync
+        self.compact_from = compact_from
+        self.compaction: Compaction | None = None
+        self.base_size: int = 0
+        self.size: int = HEADER.size
+        for i, (_, end) in enumerate(_records(_read(filename))):
+            if i == 0:
+                self.base_size = end - HEADER.size
+            self.size = end
+        self.file: BinaryIO = open(filename, "r+b")
+        self.file.truncate(self.size)
+        self.file.seek(self.size)
+
+    def append(self, events: list[Event]) -> None:
+        record: bytes = make_record(events)
+        self.file.write(record)
+        self.file.flush()
+        if self.sync:
+            os.fsync(self.file.fileno())
+        self.size += len(record)
+        if self.compaction is not None:
+            if not self.compaction.thread.is_alive():
+                self._finish_compaction()
+        elif self.size >= max(self.compact_from, 2 * self.base_size):
+            self.compaction = Compaction(self.filename, self.size)
+
+    def _finish_compaction(self) -> None:
+        compaction, self.compaction = self.compaction, None
+        assert compaction is not None
+        compaction.thread.join()
+        if compaction.error is not None:
+            raise compaction.error
+        with open(compaction.target, "ab") as f:
+            self.file.seek(compaction.length)
+            f.write(self.file.read())
+            f.flush()
+            os.fsync(f.fileno())
+            size: int = f.tell()
+        self.file.close()
+        replace(compaction.target, self.filename)
+        self.file = open(self.filename, "r+b")
+        self.file.seek(size)
+        self.size = size
+        self.base_size = compaction.base_size
+
+    def close(self, wait: bool = True) -> None:
+        """Close the journal. Running compaction is either completed or abandoned
+        (journal stays valid in both cases)."""
+        if self.compaction is not None:
+            if wait:
+                self._finish_compaction()
+            else:
+                self.compaction = None
+        self.file.close()
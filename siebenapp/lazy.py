@@ -0,0 +1,531 @@
+"""Goal tree that reads goals from the database on demand.
+
+LazyGoals has the same API as Goals, but it never loads the whole database into
+memory. Goal rows and edges of each goal are read by goal id and kept in bounded
+LRU caches; q() and verify() stream all rows in the order of goal ids.
+All changes are made by the Goals code itself and saved through the same event queue.
+Changed rows are kept in memory (and never evicted) until they are saved
+(see LazyGoals.unpin), so the database is only read here.
+When another process changes the database, caches are dropped (see LazyGoals.refresh).
+Frozen copies read the database file through a connection of their own
+(see LazySnapshot), so layouts of big trees are made in background too.
+"""
+
+import sqlite3
+from collections import OrderedDict
+from contextlib import contextmanager
+from collections.abc import (
+    Callable,
+    ItemsView,
+    Iterable,
+    Iterator,
+    Mapping,
+    MutableMapping,
+    MutableSet,
+)
+from itertools import groupby
+from operator import itemgetter
+from pathlib import Path
+from typing import Any, TypeVar
+from weakref import finalize
+
+from siebenapp.domain import (
+    EVERYTHING,
+    EdgeType,
+    Graph,
+    QuerySpec,
+    RenderResult,
+    RenderRow,
+)
+from siebenapp.goaltree import Goals
+
+# Default number of goals (and separately, adjacency lists) kept in each cache
+CACHE_SIZE = 10000
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class LRU(OrderedDict[int, V]):
+    """Dict that keeps at most `capacity` items, least recently used ones are dropped."""
+
+    def __init__(self, capacity: int) -> None:
+        super().__init__()
+        self.capacity = capacity
+
+    def get_or_load(self, key: int, loader: Callable[[int], V]) -> V:
+        if key in self:
+            self.move_to_end(key)
+            return self[key]
+        value: V = loader(key)
+        self[key] = value
+        if len(self) > self.capacity:
+            self.popitem(last=False)
+        return value
+
+
+def ordered_lookup(rows: Iterator[tuple[int, V]]) -> Callable[[int, V], V]:
+    """Look up values of rows ordered by their keys.
+    Keys must be requested in the same (ascending) order, rows are read only once."""
+    current: tuple[int, V] | None = next(rows, None)
+
+    def lookup(key: int, default: V) -> V:
+        nonlocal current
+        while current is not None and current[0] < key:
+            current = next(rows, None)
+        return current[1] if current is not None and current[0] == key else default
+
+    return lookup
+
+
+class StreamedItems(ItemsView[K, V]):
+    """Items of a mapping that are read from the database in a single query,
+    rather than key by key."""
+
+    def __init__(
+        self, mapping: Mapping[K, V], stream: Callable[[], Iterator[tuple[K, V]]]
+    ) -> None:
+        super().__init__(mapping)
+        self.stream = stream
+
+    def __iter__(self) -> Iterator[tuple[K, V]]:
+        return self.stream()
+
+
+class GoalRows:
+    """Rows of the goals table: recently used ones and changed ones.
+    A missing row is a deleted goal, i.e. a closed one without name."""
+
+    def __init__(self, connection: sqlite3.Connection, cache_size: int) -> None:
+        self.connection = connection
+        self.cache: LRU[tuple[str | None, bool]] = LRU(cache_size)
+        self.names: dict[int, str | None] = {}
+        self.states: dict[int, bool] = {}
+        (last_id,) = connection.execute("select max(goal_id) from goals").fetchone()
+        self.last_id: int = last_id or 0
+
+    def _select(self, goal_id: int) -> tuple[str | None, bool]:
+        row = self.connection.execute(
+            "select name, open from goals where goal_id=?", (goal_id,)
+        ).fetchone()
+        return (row[0], bool(row[1])) if row is not None else (None, False)
+
+    def name(self, goal_id: int) -> str | None:
+        if goal_id in self.names:
+            return self.names[goal_id]
+        return self.cache.get_or_load(goal_id, self._select)[0]
+
+    def is_open(self, goal_id: int) -> bool:
+        if goal_id in self.states:
+            return self.states[goal_id]
+        return self.cache.get_or_load(goal_id, self._select)[1]
+
+    def rows(self) -> Iterator[tuple[int, str | None, bool]]:
+        """Stream all goals (including deleted ones) ordered by id."""
+        stored = ordered_lookup(
+            (goal_id, (name, bool(is_open)))
+            for goal_id, name, is_open in self.connection.execute(
+                "select goal_id, name, open from goals order by goal_id"
+            )
+        )
+        deleted: tuple[str | None, bool] = (None, False)
+        for goal_id in range(1, self.last_id + 1):
+            name, is_open = stored(goal_id, deleted)
+            yield (
+                goal_id,
+                self.names.get(goal_id, name),
+                self.states.get(goal_id, is_open),
+            )
+
+    def unpin(self) -> None:
+        # Cached rows may have been read before the change
+        for goal_id in self.names.keys() | self.states.keys():
+            self.cache.pop(goal_id, None)
+        self.names.clear()
+        self.states.clear()
+
+    def refresh(self) -> None:
+        self.unpin()
+        self.cache.clear()
+        (last_id,) = self.connection.execute(
+            "select max(goal_id) from goals"
+        ).fetchone()
+        self.last_id = last_id or 0
+
+
+class LazyNames(MutableMapping[int, str | None]):
+    """Names of goals by their ids (None for deleted goals), as in Goals.goals."""
+
+    def __init__(self, rows: GoalRows) -> None:
+        self.rows = rows
+
+    def __getitem__(self, goal_id: int) -> str | None:
+        if not 0 < goal_id <= self.rows.last_id:
+            raise KeyError(goal_id)
+        return self.rows.name(goal_id)
+
+    def __setitem__(self, goal_id: int, name: str | None) -> None:
+        if goal_id > self.rows.last_id:
+            # New goals are open until they are explicitly closed
+            self.rows.states[goal_id] = True
+            self.rows.last_id = goal_id
+        self.rows.names[goal_id] = name
+
+    def __delitem__(self, goal_id: int) -> None:
+        raise NotImplementedError("Deleted goals are kept as holes")
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(1, self.rows.last_id + 1))
+
+    def __len__(self) -> int:
+        return self.rows.last_id
+
+    def items(self) -> ItemsView[int, str | None]:
+        return StreamedItems(
+            self, lambda: ((g, name) for g, name, _ in self.rows.rows())
+        )
+
+
+class LazyClosed(MutableSet[int]):
+    """Ids of closed goals, as in Goals.closed."""
+
+    def __init__(self, rows: GoalRows) -> None:
+        self.rows = rows
+
+    def __contains__(self, goal_id: object) -> bool:
+        return (
+            isinstance(goal_id, int)
+            and 0 < goal_id <= self.rows.last_id
+            and not self.rows.is_open(goal_id)
+        )
+
+    def add(self, goal_id: int) -> None:
+        self.rows.states[goal_id] = False
+
+    def discard(self, goal_id: int) -> None:
+        if goal_id in self:
+            self.rows.states[goal_id] = True
+
+    def __iter__(self) -> Iterator[int]:
+        return (g for g, _, is_open in self.rows.rows() if not is_open)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class Links(dict[int, EdgeType]):
+    """Edges of a single goal. Once changed, they are pinned in memory until saved.
+    Goals never keeps these dicts between calls, so a stale (already evicted) copy
+    is never changed."""
+
+    def __init__(
+        self,
+        owner: "LazyAdjacency",
+        goal_id: int,
+        links: Iterable[tuple[int, EdgeType]],
+    ) -> None:
+        super().__init__(links)
+        self.owner = owner
+        self.goal_id = goal_id
+
+    def __setitem__(self, key: int, value: EdgeType) -> None:
+        self.owner.pin(self)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key: int) -> None:
+        self.owner.pin(self)
+        super().__delitem__(key)
+
+    def pop(self, key: int, *default: Any) -> Any:
+        self.owner.pin(self)
+        return super().pop(key, *default)
+
+    def clear(self) -> None:
+        self.owner.pin(self)
+        super().clear()
+
+
+class LazyAdjacency(Mapping[int, MutableMapping[int, EdgeType]]):
+    """Edges of each goal by its id, as in Goals.edges_forward and Goals.edges_backward.
+    `column` is the side of edges the goal is on (parent or child)."""
+
+    def __init__(
+        self,
+        connection: sqlite3.Connection,
+        column: str,
+        other: str,
+        cache_size: int,
+    ) -> None:
+        self.connection = connection
+        self.select = f"select {other}, reltype from edges where {column}=?"
+        self.select_all = (
+            f"select {column}, {other}, reltype from edges order by {column}"
+        )
+        self.cache: LRU[Links] = LRU(cache_size)
+        self.pinned: dict[int, Links] = {}
+
+    def _load(self, goal_id: int) -> Links:
+        return Links(
+            self,
+            goal_id,
+            (
+                (other, EdgeType(reltype))
+                for other, reltype in self.connection.execute(self.select, (goal_id,))
+            ),
+        )
+
+    def pin(self, links: Links) -> None:
+        self.pinned[links.goal_id] = links
+        self.cache.pop(links.goal_id, None)
+
+    def unpin(self) -> None:
+        # Pinned edges are never cached, so they are read again on demand
+        self.pinned.clear()
+
+    def refresh(self) -> None:
+        self.unpin()
+        self.cache.clear()
+
+    def __getitem__(self, goal_id: int) -> Links:
+        if (links := self.pinned.get(goal_id)) is not None:
+            return links
+        return self.cache.get_or_load(goal_id, self._load)
+
+    def _stored(self) -> Iterator[tuple[int, list[tuple[int, EdgeType]]]]:
+        for goal_id, group in groupby(
+            self.connection.execute(self.select_all), itemgetter(0)
+        ):
+            yield goal_id, [(other, EdgeType(reltype)) for _, other, reltype in group]
+
+    def ordered(self) -> Callable[[int], Iterable[tuple[int, EdgeType]]]:
+        """Return edges of goals requested in the ascending order of their ids."""
+        stored = ordered_lookup(self._stored())
+
+        def edges(goal_id: int) -> Iterable[tuple[int, EdgeType]]:
+            if (links := self.pinned.get(goal_id)) is not None:
+                return links.items()
+            return stored(goal_id, [])
+
+        return edges
+
+    def _stream(self) -> Iterator[tuple[int, MutableMapping[int, EdgeType]]]:
+        for goal_id, links in self._stored():
+            if goal_id not in self.pinned:
+                yield goal_id, Links(self, goal_id, links)
+        yield from self.pinned.items()
+
+    def items(self) -> ItemsView[int, MutableMapping[int, EdgeType]]:
+        return StreamedItems(self, self._stream)
+
+    def __iter__(self) -> Iterator[int]:
+        return (goal_id for goal_id, _ in self._stream())
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class LazyEdges(MutableMapping[tuple[int, int], EdgeType]):
+    """All edges by (parent, child) keys, as in Goals.edges.
+    It's a view of forward edges: Goals changes both of them at once,
+    so changes made here are ignored."""
+
+    def __init__(self, forward: LazyAdjacency) -> None:
+        self.forward = forward
+
+    def __getitem__(self, key: tuple[int, int]) -> EdgeType:
+        return self.forward[key[0]][key[1]]
+
+    def __setitem__(self, key: tuple[int, int], value: EdgeType) -> None:
+        pass
+
+    def __delitem__(self, key: tuple[int, int]) -> None:
+        if key[1] not in self.forward[key[0]]:
+            raise KeyError(key)
+
+    def _stream(self) -> Iterator[tuple[tuple[int, int], EdgeType]]:
+        for parent, links in self.forward.items():
+            for child, edge_type in links.items():
+                yield (parent, child), edge_type
+
+    def items(self) -> ItemsView[tuple[int, int], EdgeType]:
+        return StreamedItems(self, self._stream)
+
+    def __iter__(self) -> Iterator[tuple[int, int]]:
+        return (key for key, _ in self._stream())
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._stream())
+
+
+class LazyGoals(Goals):
+    """Goals of the database that are read on demand (see the module docstring).
+    Connection must stay open while the goal tree is used."""
+
+    def __init__(
+        self,
+        connection: sqlite3.Connection,
+        message_fn: Callable[[str], None] | None = None,
+        cache_size: int = CACHE_SIZE,
+    ) -> None:
+        super().__init__("", message_fn)
+        self._events.clear()
+        self.rows = GoalRows(connection, cache_size)
+        self.forward = LazyAdjacency(connection, "parent", "child", cache_size)
+        self.backward = LazyAdjacency(connection, "child", "parent", cache_size)
+        self.goals = LazyNames(self.rows)
+        self.closed = LazyClosed(self.rows)
+        self.edges = LazyEdges(self.forward)
+        self.edges_forward = self.forward
+        self.edges_backward = self.backward
+        # Path of the database file (empty for in-memory databases)
+        self.filename: str = next(
+            file
+            for _, name, file in connection.execute("pragma database_list")
+            if name == "main"
+        )
+
+    def can_freeze(self) -> bool:
+        # Other threads read goals through a connection of their own
+        return bool(self.filename)
+
+    def freeze(self) -> Graph:
+        assert self.can_freeze(), "In-memory database can't be read by other threads"
+        # Connection is opened here, but it's used only by the thread that gets the copy
+        connection = sqlite3.connect(
+            f"{Path(self.filename).as_uri()}?mode=ro", uri=True, check_same_thread=False
+        )
+        return LazySnapshot(self, connection)
+
+    def unpin(self) -> None:
+        """Forget changed rows once they are saved into the database:
+        from now on they are read from it again, like all other ones."""
+        self.rows.unpin()
+        self.forward.unpin()
+        self.backward.unpin()
+
+    @contextmanager
+    def consistent_reads(self) -> Iterator[None]:
+        """Read goals from the same state of the database until the block ends,
+        even when other processes change it meanwhile (otherwise e.g. a new goal
+        could get an id of a goal that's just added by them). The block must end
+        before changes are saved, because the database can't be changed while
+        it's read (unless it's in WAL mode)."""
+        connection: sqlite3.Connection = self.rows.connection
+        connection.execute("begin")
+        try:
+            # The state is fixed by the first read, not by the "begin" itself
+            connection.execute("select max(goal_id) from goals").fetchone()
+            yield
+        finally:
+            connection.commit()
+
+    def refresh(self) -> None:
+        """Forget everything that has been read from the database, because another
+        process has changed it. Changed rows are forgotten too, so they must be saved
+        (or rebased) before."""
+        self.rows.refresh()
+        self.forward.refresh()
+        self.backward.refresh()
+
+    def iter_rows(self, spec: QuerySpec = EVERYTHING) -> Iterator[RenderRow]:
+        """Stream goals and their edges ordered by goal id (with changes applied).
+        States of all goals are collected first, so that switchability of each goal
+        does not need random reads; caches are not filled by this method.
+        Zoomed subtrees are usually small, so they are read goal by goal instead."""
+        if spec.subtree:
+            yield from super().iter_rows(spec)
+            return
+        states: bytearray = bytearray(self.rows.last_id + 1)
+        needed: bytearray = bytearray(self.rows.last_id + 1)
+        closed: int = 0
+        for goal_id, name, is_open in self.rows.rows():
+            states[goal_id] = is_open
+            closed += not is_open
+            needed[goal_id] = name is not None and (
+                goal_id == Goals.ROOT_ID or spec.accepts(goal_id, name, is_open)
+            )
+        if self._builds_all_rows(spec, closed, self.rows.last_id):
+            for goal_id, name, _ in self.rows.rows():
+                needed[goal_id] = name is not None
+        forward = self.forward.ordered()
+        backward = self.backward.ordered()
+        blocked: dict[int, bool] = {}
+        for goal_id, name, is_open in self.rows.rows():
+            if not needed[goal_id]:
+                continue
+            assert name is not None
+            edges: Iterable[tuple[int, EdgeType]] = forward(goal_id)
+            back_edges: Iterable[tuple[int, EdgeType]] = backward(goal_id)
+            if is_open:
+                parent: int | None = next(
+                    (s for s, t in back_edges if t == EdgeType.PARENT), None
+                )
+                switchable: bool = all(
+                    not states[target]
+                    for target, edge_type in edges
+                    if edge_type != EdgeType.RELATION
+                ) and not (
+                    parent is not None and self._blocks_subgoals(parent, blocked)
+                )
+            else:
+                switchable = all(states[source] for source, _ in back_edges)
+            yield self._render_row(
+                goal_id,
+                name,
+                is_open,
+                switchable,
+                (edge for edge in edges if needed[edge[0]]),
+            )
+
+    def _blocks_subgoals(self, goal_id: int, known: dict[int, bool]) -> bool:
+        """Whether subgoals of the goal are blocked by open blockers of the goal itself
+        or of its ancestors (see Goals._blocked_by_parent).
+        Results are remembered for the whole chain of ancestors."""
+        chain: list[int] = []
+        while goal_id not in known:
+            chain.append(goal_id)
+            if (parent := self._strict_parent(goal_id)) is None:
+                break
+            goal_id = parent
+        result: bool = known.get(goal_id, False)
+        for goal_id in reversed(chain):
+            result = result or any(
+                e.type == EdgeType.BLOCKER
+                and not self.is_closed(e.target)
+                and not self._is_direct_subgoal(goal_id, e.target)
+                for e in self._forward_edges(goal_id)
+            )
+            known[goal_id] = result
+        return result
+
+
+class LazySnapshot(LazyGoals):
+    """Read-only copy of lazy goals that could be queried by another thread
+    (see LazyGoals.freeze). Changes that were not saved yet are copied, all other
+    goals are read through the connection of the copy. Each query reads a single
+    state of the database, so, unlike other frozen copies, it may show goals
+    that have been saved after the copy was made (but never a part of them)."""
+
+    def __init__(self, origin: LazyGoals, connection: sqlite3.Connection) -> None:
+        super().__init__(connection, origin.message_fn, origin.rows.cache.capacity)
+        self.known_last_id: int = origin.rows.last_id
+        self.rows.names = dict(origin.rows.names)
+        self.rows.states = dict(origin.rows.states)
+        for adjacency, source in [
+            (self.forward, origin.forward),
+            (self.backward, origin.backward),
+        ]:
+            for goal_id, links in source.pinned.items():
+                adjacency.pinned[goal_id] = Links(adjacency, goal_id, links.items())
+        self.archived = dict(origin.archived)
+        self.revision = origin.revision
+        # Layouts drop copies as soon as they are done, the connection goes with them
+        finalize(self, connection.close)
+
+    def q(self, spec: QuerySpec = EVERYTHING) -> RenderResult:
+        with self.consistent_reads():
+            (last_id,) = self.rows.connection.execute(
+                "select max(goal_id) from goals"
+            ).fetchone()
+            self.rows.last_id = max(self.known_last_id, last_id or 0)
+            return super().q(spec)
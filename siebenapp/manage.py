@@ -1,50 +1,134 @@
 from argparse import ArgumentParser, Namespace
+from collections.abc import Mapping
+from contextlib import closing
 from html import escape
 from operator import attrgetter
 from os import path
-
-from siebenapp.cli import IO, ConsoleIO
-from siebenapp.domain import EdgeType, Graph, RenderRow, GoalId, RenderResult
+from typing import Any
+
+from siebenapp.archive import archive_subtrees
+from siebenapp.cli import IO, ConsoleIO, build_actions, by_position, format_rows
+from siebenapp.daemon import SOCKET_ENV, Handler, request, serve, socket_path
+from siebenapp.domain import (
+    EdgeType,
+    Graph,
+    RenderRow,
+    GoalId,
+    RenderResult,
+    Unarchive,
+)
 from siebenapp.goaltree import Goals, GoalsData, EdgesData
+from siebenapp.journal import is_journal
 from siebenapp.layers import get_root, persistent_layers, all_layers
 from siebenapp.open_view import ToggleOpenView
 from siebenapp.progress_view import ToggleProgress
+from siebenapp.render import Renderer
 from siebenapp.switchable_view import ToggleSwitchableView
-from siebenapp.system import load, save, split_long
+from siebenapp.system import (
+    connect,
+    load,
+    run_migrations,
+    save,
+    split_long,
+    PROFILES,
+    PROFILE_ENV,
+    SAFE,
+)
 
 
 def print_dot(args: Namespace, io: IO) -> None:
-    tree = load(args.db)
-    if args.n:
-        tree.accept(ToggleOpenView())
-    if args.p:
-        tree.accept(ToggleProgress())
-    if args.t:
-        tree.accept(ToggleSwitchableView())
-    io.write(dot_export(tree))
+    _run(args, io, "dot", {"n": args.n, "p": args.p, "t": args.t})
 
 
 def print_md(args: Namespace, io: IO) -> None:
-    tree = load(args.db)
-    if args.n:
+    _run(args, io, "md", {"n": args.n, "p": args.p, "t": args.t})
+
+
+def execute(args: Namespace, io: IO) -> None:
+    _run(args, io, "exec", {"commands": args.commands}, changes=True)
+
+
+def _run(
+    args: Namespace,
+    io: IO,
+    command: str,
+    options: dict[str, Any],
+    changes: bool = False,
+) -> None:
+    """Handle the command by a running daemon, or load the file directly
+    when there is no daemon."""
+    output: str | None = None
+    if not args.direct and path.isfile(args.db):
+        message: dict[str, Any] = {
+            "command": command,
+            "db": path.abspath(args.db),
+            "storage": args.storage,
+            "verify": args.verify,
+            "options": options,
+            "save": changes,
+        }
+        output = request(socket_path(args.socket), message)
+    if output is None:
+        tree = load(args.db, profile=args.storage, verify=args.verify)
+        output = HANDLERS[command](tree, options)
+        if changes:
+            save(tree, args.db, args.storage)
+    io.write(output)
+
+
+def _with_view_options(tree: Graph, options: Mapping[str, Any]) -> Graph:
+    if options["n"]:
         tree.accept(ToggleOpenView())
-    if args.p:
+    if options["p"]:
         tree.accept(ToggleProgress())
-    if args.t:
+    if options["t"]:
         tree.accept(ToggleSwitchableView())
-    io.write(markdown_export(tree))
+    return tree
+
+
+def _exec_commands(tree: Graph, options: Mapping[str, Any]) -> str:
+    for command in options["commands"]:
+        tree.accept_all(*build_actions(command, tree))
+    render_result = Renderer(tree, 100).build()
+    return "\n".join(format_rows(render_result, by_position(render_result)))
+
+
+HANDLERS: Mapping[str, Handler] = {
+    "dot": lambda tree, options: dot_export(_with_view_options(tree, options)),
+    "md": lambda tree, options: markdown_export(_with_view_options(tree, options)),
+    "exec": _exec_commands,
+}
+
+
+def serve_files(args: Namespace, io: IO) -> None:
+    serve(socket_path(args.socket), HANDLERS)
 
 
 def migrate(args: Namespace, io: IO) -> None:
-    goals = load(args.db)
-    save(goals, args.db)
+    goals = load(args.db, profile=args.storage, verify=args.verify)
+    save(goals, args.db, args.storage)
+
+
+def archive(args: Namespace, io: IO) -> None:
+    assert path.exists(args.db), f"File {args.db} is missing."
+    assert not is_journal(args.db), "Only database files could be archived."
+    with closing(connect(args.db, args.storage)) as connection:
+        run_migrations(connection)
+        archived = archive_subtrees(connection, args.older_than, args.goal_id or None)
+    for goal_id in args.goal_id:
+        if goal_id not in archived:
+            io.write(f"Goal {goal_id} can't be archived")
+    io.write(f"Archived subtrees: {len(archived)}")
 
 
 def extract(args: Namespace, io: IO) -> None:
-    tree = load(args.source_db).goaltree.goaltree
+    source = load(args.source_db, profile=args.storage, verify=args.verify)
+    # Archived goals are extracted too
+    source.accept(Unarchive())
+    tree = source.goaltree.goaltree
     assert not path.exists(args.target_db), f"File {args.target_db} already exists!"
     result = extract_subtree(tree, args.goal_id)
-    save(result, args.target_db)
+    save(result, args.target_db, args.storage)
 
 
 def merge(args: Namespace, io: IO) -> None:
@@ -59,21 +143,23 @@ def merge(args: Namespace, io: IO) -> None:
     merged_db = Goals("Merged")
     delta = 1
     for source_db in sources:
-        source_root = get_root(load(source_db), Goals)
-        merged_db.goals |= {
-            goal_id + delta: name for goal_id, name in source_root.goals.items()
-        }
-        merged_db.edges |= {
-            (edge[0] + delta, edge[1] + delta): edge_type
+        source = load(source_db, profile=args.storage, verify=args.verify)
+        source.accept(Unarchive())
+        source_root = get_root(source, Goals)
+        merged_db.goals.update(
+            (goal_id + delta, name) for goal_id, name in source_root.goals.items()
+        )
+        merged_db.edges.update(
+            ((edge[0] + delta, edge[1] + delta), edge_type)
             for edge, edge_type in source_root.edges.items()
-        }
+        )
         merged_db.edges[Goals.ROOT_ID, min(source_root.goals.keys()) + delta] = (
             EdgeType.PARENT
         )
-        merged_db.closed.update({goal_id + delta for goal_id in source_root.closed})
+        merged_db.closed |= {goal_id + delta for goal_id in source_root.closed}
         delta = max(merged_db.goals.keys())
 
-    save(all_layers(merged_db), args.target_db)
+    save(all_layers(merged_db), args.target_db, args.storage)
 
 
 def _flag(parser: ArgumentParser, key: str, description: str) -> None:
@@ -82,6 +168,30 @@ def _flag(parser: ArgumentParser, key: str, description: str) -> None:
 
 def main(argv: list[str] | None = None, io: IO | None = None) -> None:
     parser = ArgumentParser()
+    parser.add_argument(
+        "--storage",
+        choices=list(PROFILES),
+        default=None,
+        help=f"Storage profile (default: ${PROFILE_ENV} or {SAFE})",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        default=False,
+        help="Fully verify goal tree on load, even when the file is known to be correct",
+    )
+    parser.add_argument(
+        "--socket",
+        default=None,
+        help=f"Socket of the daemon (default: ${SOCKET_ENV} or a file in a private "
+        "directory of the user)",
+    )
+    parser.add_argument(
+        "--direct",
+        action="store_true",
+        default=False,
+        help="Load the file directly, even when the daemon is running",
+    )
     subparsers = parser.add_subparsers(title="commands")
 
     parser_dot = subparsers.add_parser("dot")
@@ -98,6 +208,26 @@ def main(argv: list[str] | None = None, io: IO | None = None) -> None:
     parser_dot.add_argument("db", help="An existing file with goaltree.")
     parser_dot.set_defaults(func=print_md)
 
+    parser_exec = subparsers.add_parser(
+        "exec",
+        help="Run commands on the goal tree, save changes and print the tree.",
+    )
+    parser_exec.add_argument("db", help="A file with goaltree.")
+    parser_exec.add_argument(
+        "commands",
+        nargs="+",
+        help="Commands in the same format as in clieben (e.g. 'a New goal', '12', 'c'). "
+        "Each run starts with the root goal selected.",
+    )
+    parser_exec.set_defaults(func=execute)
+
+    parser_serve = subparsers.add_parser(
+        "serve",
+        help="Run a daemon that keeps goal trees in memory. While it's running, "
+        "dot, md and exec commands are handled by the daemon.",
+    )
+    parser_serve.set_defaults(func=serve_files)
+
     parser_migrate = subparsers.add_parser("migrate")
     parser_migrate.add_argument("db", help="An existing file with goaltree.")
     parser_migrate.set_defaults(func=migrate)
@@ -136,6 +266,30 @@ def main(argv: list[str] | None = None, io: IO | None = None) -> None:
     )
     parser_merge.set_defaults(func=merge)
 
+    parser_archive = subparsers.add_parser(
+        "archive",
+        help="Move fully closed subtrees out of the goal tree. "
+        "Each of them is replaced with its top goal. "
+        "Archived goals are brought back when closed goals are shown, "
+        "or when their top goal is zoomed.",
+    )
+    parser_archive.add_argument("db", help="An existing file with goaltree.")
+    parser_archive.add_argument(
+        "goal_id",
+        type=int,
+        nargs="*",
+        help="Top goals of subtrees to archive (default: all subtrees that could be "
+        "archived).",
+    )
+    parser_archive.add_argument(
+        "--older-than",
+        type=float,
+        default=0,
+        metavar="DAYS",
+        help="Archive only subtrees that have been closed for more than DAYS days.",
+    )
+    parser_archive.set_defaults(func=archive)
+
     args = parser.parse_args(argv)
     io = io or ConsoleIO("> ")
     if "func" in dir(args):
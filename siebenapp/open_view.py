@@ -1,13 +1,19 @@
+from collections.abc import Iterator
 from dataclasses import dataclass, replace
 from typing import Any
 
 from siebenapp.domain import (
     Command,
+    EVERYTHING,
     Graph,
+    QuerySpec,
     RenderResult,
     GoalId,
     RenderRow,
+    Unarchive,
+    selected_ids,
 )
+from siebenapp.goaltree import Goals
 
 
 @dataclass(frozen=True)
@@ -25,6 +31,9 @@ class OpenView(Graph):
 
     def accept_ToggleOpenView(self, command: ToggleOpenView):
         self._open = not self._open
+        if not self._open:
+            # Closed goals become visible, including archived ones
+            self.goaltree.accept(Unarchive())
 
     def settings(self, key: str) -> Any:
         if key == "filter_open":
@@ -36,10 +45,12 @@ class OpenView(Graph):
         if not origin.settings("filter_open"):
             self.accept(ToggleOpenView())
 
-    def q(self) -> RenderResult:
-        render_result = self.goaltree.q()
+    def q(self, spec: QuerySpec = EVERYTHING) -> RenderResult:
         if not self._open:
-            return render_result
+            return self.goaltree.q(spec)
+        render_result = self.goaltree.q(
+            spec.narrow(open_only=True, keep=spec.keep | selected_ids(self))
+        )
         visible_rows: dict[GoalId, RenderRow] = {
             row.goal_id: row
             for row in render_result.rows
@@ -59,3 +70,28 @@ class OpenView(Graph):
         return replace(
             render_result, rows=rows, roots=render_result.roots.union(dangling)
         )
+
+    def iter_rows(self, spec: QuerySpec = EVERYTHING) -> Iterator[RenderRow]:
+        if not self._open:
+            return self.goaltree.iter_rows(spec)
+        if self.settings("zoom_root") != Goals.ROOT_ID:
+            # Roots of the zoomed view are known only when all its rows are built
+            return super().iter_rows(spec)
+        return self._iter_open_rows(spec)
+
+    def _iter_open_rows(self, spec: QuerySpec) -> Iterator[RenderRow]:
+        # Without zoom, the root goal is the only root. Edges always lead to real
+        # goals, so it's enough to check their state instead of waiting for their rows
+        shown: frozenset[GoalId] = selected_ids(self) | {Goals.ROOT_ID}
+        for row in self.goaltree.iter_rows(
+            spec.narrow(open_only=True, keep=spec.keep | selected_ids(self))
+        ):
+            if row.is_open or row.goal_id in shown:
+                yield replace(
+                    row,
+                    edges=[
+                        e
+                        for e in row.edges
+                        if e[0] in shown or not self.goaltree.is_closed(e[0])
+                    ],
+                )
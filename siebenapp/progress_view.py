@@ -1,7 +1,17 @@
+from collections.abc import Iterator
 from dataclasses import dataclass, replace
 from typing import Any
 
-from siebenapp.domain import Graph, Command, EdgeType, GoalId, RenderResult, RenderRow
+from siebenapp.domain import (
+    Graph,
+    Command,
+    EVERYTHING,
+    EdgeType,
+    GoalId,
+    QuerySpec,
+    RenderResult,
+    RenderRow,
+)
 
 
 @dataclass(frozen=True)
@@ -35,23 +45,27 @@ class ProgressView(Graph):
         super().reconfigure_from(origin)
         self.show_progress = origin.settings("filter_progress")
 
-    def q(self) -> RenderResult:
-        render_result = self.goaltree.q()
+    def q(self, spec: QuerySpec = EVERYTHING) -> RenderResult:
         if not self.show_progress:
-            return render_result
+            return self.goaltree.q(spec)
+        # Progress is counted over all subgoals, so every row is needed
+        render_result = self.goaltree.q()
         progress_cache: dict[GoalId, tuple[int, int]] = {}
+        # Archived goals are not rendered, but they are counted (all of them are closed)
+        archived: dict[GoalId, int] = self.goaltree.settings("archived")
         rows = render_result.rows
         queue: list[RenderRow] = list(rows)
         while queue:
             row = queue.pop(0)
             children = [x[0] for x in row.edges if x[1] == EdgeType.PARENT]
-            open_count = 0 if row.is_open else 1
+            archived_count = archived.get(row.goal_id, 0)
+            open_count = (0 if row.is_open else 1) + archived_count
             if not children:
-                progress_cache[row.goal_id] = (open_count, 1)
+                progress_cache[row.goal_id] = (open_count, 1 + archived_count)
             elif all(g in progress_cache for g in children):
                 progress_cache[row.goal_id] = (
                     sum(progress_cache[x][0] for x in children) + open_count,
-                    sum(progress_cache[x][1] for x in children) + 1,
+                    sum(progress_cache[x][1] for x in children) + 1 + archived_count,
                 )
             else:
                 queue.append(row)
@@ -69,3 +83,8 @@ class ProgressView(Graph):
         ]
 
         return replace(render_result, rows=result_rows)
+
+    def iter_rows(self, spec: QuerySpec = EVERYTHING) -> Iterator[RenderRow]:
+        if self.show_progress:
+            return super().iter_rows(spec)
+        return self.goaltree.iter_rows(spec)
@@ -1,11 +1,18 @@
 from collections import defaultdict
-from dataclasses import dataclass, replace
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field, replace
+from statistics import median, quantiles
 from typing import Any, Optional, Protocol
 
-from siebenapp.domain import Graph, EdgeType, GoalId, RenderResult, Command
-from siebenapp.selectable_view import OPTION_SELECT, OPTION_PREV_SELECT
+from siebenapp.components import split_components, layout_components
+from siebenapp.domain import (
+    Graph,
+    EdgeType,
+    GoalId,
+    RenderResult,
+    RenderRow,
+)
 from siebenapp.render_next import full_render
-from siebenapp.system import save
 
 # Layer is a row of GoalIds, possibly with holes (marked with None)
 # E.g.: [17, None, 5]
@@ -58,8 +65,8 @@ def safe_average(items: list[int]) -> int:
 class Renderer:
     DEFAULT_WIDTH = 4
 
-    def __init__(self, goals: Graph, width_limit=DEFAULT_WIDTH) -> None:
-        self.render_result = goals.q()
+    def __init__(self, goals: Graph | RenderResult, width_limit=DEFAULT_WIDTH) -> None:
+        self.render_result = goals if isinstance(goals, RenderResult) else goals.q()
         self.width_limit = width_limit
         self.rows = self.render_result.rows
         self.node_opts: dict[GoalId, Any] = {row.goal_id: {} for row in self.rows}
@@ -83,6 +90,15 @@ class Renderer:
         self.result_edge_options: dict[GoalId, tuple[int, int, int]] = {}
 
     def build(self) -> RenderResult:
+        components = split_components(self.render_result)
+        if len(components) > 1:
+            return layout_components(
+                self.render_result,
+                components,
+                self.width_limit,
+                _layout_component,
+                FAKE_ID_START,
+            )
         self.split_by_layers()
         self.reorder()
         self.update_graph()
@@ -248,6 +264,10 @@ class Renderer:
         return result
 
 
+def _layout_component(render_result: RenderResult, width_limit: int) -> RenderResult:
+    return Renderer(render_result, width_limit).build()
+
+
 def goal_key(tup: tuple[GoalId, int]) -> tuple[int, int]:
     """Sort goals by position first and by id second (transform str ids into ints)"""
     goal_id, goal_pos = tup
@@ -255,7 +275,11 @@ def goal_key(tup: tuple[GoalId, int]) -> tuple[int, int]:
 
 
 def middle_point(left: Point, right: Point, numerator: int, denominator: int) -> Point:
-    return left + (right - left) * numerator / denominator
+    # Same as `left + (right - left) * numerator / denominator`, without temporary points
+    return Point(
+        left.x + int(int((right.x - left.x) * numerator) / denominator),
+        left.y + int(int((right.y - left.y) * numerator) / denominator),
+    )
 
 
 def render_lines(
@@ -309,51 +333,153 @@ def render_lines(
     return lines
 
 
-class GoalsHolder:
-    def __init__(self, goals: Graph, filename: str, classic: bool = True):
-        self.goals = goals
-        self.filename = filename
-        self.previous: RenderResult = RenderResult([])
-        self.classic = classic
-
-    def accept(self, *actions: Command) -> None:
-        if actions:
-            self.goals.accept_all(*actions)
-        save(self.goals, self.filename)
-
-    def render(self, width: int) -> tuple[RenderResult, list[GoalId]]:
-        """Render tree with a given width and return two values:
-        1. Render result as is.
-        2. A list of changed rows in case of _partial_ update; empty list otherwise.
-        """
-        result: RenderResult = (
-            Renderer(self.goals, width).build()
-            if self.classic
-            else full_render(self.goals, width)
+# Flat line coordinates: [x1, y1, x2, y2, x1, y1, x2, y2, ...]
+FlatLines = dict[EdgeType, list[int]]
+
+
+def flat_lines(lines: list[tuple[EdgeType, Point, Point, str]]) -> FlatLines:
+    """Group lines by edge type into flat coordinate arrays, suitable for batch drawing."""
+    result: FlatLines = {}
+    for edge_type, start, end, _ in lines:
+        result.setdefault(edge_type, []).extend((start.x, start.y, end.x, end.y))
+    return result
+
+
+class LinesCache:
+    """Keep edge lines for the last render result and geometry revision.
+    Geometry revision should be changed by a caller on any layout change."""
+
+    def __init__(self) -> None:
+        self.render_result: RenderResult | None = None
+        self.revision: int = -1
+        self.lines: FlatLines = {}
+
+    def get(
+        self, gp: GeometryProvider, render_result: RenderResult, revision: int
+    ) -> FlatLines:
+        if render_result is not self.render_result or revision != self.revision:
+            self.lines = flat_lines(render_lines(gp, render_result))
+            self.render_result = render_result
+            self.revision = revision
+        return self.lines
+
+
+@dataclass(frozen=True)
+class RenderDelta:
+    """Row-level difference between two render results (see diff_results)."""
+
+    changed: list[GoalId]
+    added: list[GoalId]
+    removed: list[GoalId]
+    # New versions of changed and added rows, in the order of the new result
+    rows: list[RenderRow]
+    global_opts: dict[str, Any]
+
+    def has_rows(self) -> bool:
+        return bool(self.changed or self.added or self.removed)
+
+
+def diff_results(old: RenderResult, new: RenderResult) -> RenderDelta:
+    """Find rows that are changed, added or removed in the new result.
+    A row is changed when its content or its layout (node_opts) is changed."""
+    changed: list[GoalId] = []
+    added: list[GoalId] = []
+    rows: list[RenderRow] = []
+    for row in new.rows:
+        goal_id: GoalId = row.goal_id
+        if goal_id not in old.index:
+            added.append(goal_id)
+        elif row != old.by_id(goal_id) or new.node_opts.get(
+            goal_id
+        ) != old.node_opts.get(goal_id):
+            changed.append(goal_id)
+        else:
+            continue
+        rows.append(row)
+    removed: list[GoalId] = [r.goal_id for r in old.rows if r.goal_id not in new.index]
+    return RenderDelta(changed, added, removed, rows, new.global_opts)
+
+
+def encode_delta(delta: RenderDelta) -> dict[str, Any]:
+    """Convert delta into JSON-compatible data."""
+    return asdict(delta)
+
+
+def decode_delta(data: dict[str, Any]) -> RenderDelta:
+    rows: list[RenderRow] = [
+        RenderRow(**(row | {"edges": [(g, EdgeType(t)) for g, t in row["edges"]]}))
+        for row in data["rows"]
+    ]
+    return RenderDelta(
+        data["changed"], data["added"], data["removed"], rows, data["global_opts"]
+    )
+
+
+def build_layout(goals: Graph, width: int, classic: bool = True) -> RenderResult:
+    return Renderer(goals, width).build() if classic else full_render(goals, width)
+
+
+@dataclass
+class RenderStats:
+    """Counters of rendering in a front-end."""
+
+    # Layouts that have been shown, and ones that were superseded by newer layouts
+    shown: int = 0
+    superseded: int = 0
+    # Refreshes that were merged into a pending one, so they cost no layout at all
+    avoided: int = 0
+    # Seconds from a command to the first paint of its result
+    first_paint: list[float] = field(default_factory=list)
+
+    def summary(self) -> str:
+        lines: list[str] = [
+            f"Layouts shown: {self.shown}, superseded: {self.superseded}, "
+            f"renders avoided: {self.avoided}"
+        ]
+        if len(self.first_paint) > 1:
+            p95: float = quantiles(self.first_paint, n=20, method="inclusive")[-1]
+            lines.append(
+                f"Time to first paint: median {median(self.first_paint) * 1000:.1f} ms, "
+                f"95% {p95 * 1000:.1f} ms, max {max(self.first_paint) * 1000:.1f} ms "
+                f"({len(self.first_paint)} paints)"
+            )
+        return "\n".join(lines)
+
+
+class LayoutWorker:
+    """Builds layouts of frozen goal trees in a background thread (see Graph.freeze),
+    so that the thread that accepts commands is not blocked by big trees.
+
+    Only the newest layout is shown: a job that's superseded by a newer one
+    is cancelled, or its result is dropped when it's already started.
+    Trees that can't be frozen (see Graph.can_freeze) are laid out right away.
+    """
+
+    def __init__(self, stats: RenderStats) -> None:
+        self.stats = stats
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending: Future[RenderResult] | None = None
+
+    def submit(self, goals: Graph, width: int, classic: bool = True) -> None:
+        if self.pending is not None:
+            self.pending.cancel()
+            self.stats.superseded += 1
+        if not goals.can_freeze():
+            self.pending = Future()
+            self.pending.set_result(build_layout(goals, width, classic))
+            return
+        self.pending = self.executor.submit(
+            build_layout, goals.freeze(), width, classic
         )
-        delta = self._calculate_delta(result)
-        self.previous = result
-        return result, delta
-
-    def _calculate_delta(self, new_result: RenderResult) -> list[GoalId]:
-        if len(self.previous.rows) == len(new_result.rows):
-            for old_row in self.previous.rows:
-                new_row = new_result.by_id(old_row.goal_id)
-                if old_row != new_row:
-                    # eager exit on any change in rows
-                    return []
-            result: list[GoalId] = []
-            if (
-                self.previous.global_opts[OPTION_SELECT]
-                != new_result.global_opts[OPTION_SELECT]
-            ):
-                result.append(self.previous.global_opts[OPTION_SELECT])
-                result.append(new_result.global_opts[OPTION_SELECT])
-            if (
-                self.previous.global_opts[OPTION_PREV_SELECT]
-                != new_result.global_opts[OPTION_PREV_SELECT]
-            ):
-                result.append(self.previous.global_opts[OPTION_PREV_SELECT])
-                result.append(new_result.global_opts[OPTION_PREV_SELECT])
-            return result
-        return []
+
+    def take(self) -> RenderResult | None:
+        """The newest layout, once it's built. Errors of the job are raised here."""
+        if self.pending is None or not self.pending.done():
+            return None
+        future, self.pending = self.pending, None
+        self.stats.shown += 1
+        return future.result()
+
+    def close(self) -> None:
+        self.pending = None
+        self.executor.shutdown(cancel_futures=True)
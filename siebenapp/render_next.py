@@ -1,10 +1,23 @@
 from dataclasses import dataclass, replace
 from functools import partial
 from typing import Any
-from collections.abc import Callable
 
+from siebenapp.components import split_components, layout_components
 from siebenapp.domain import RenderResult, GoalId, Graph
 
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore
+
+# Horizontal adjustment is repeated with a halved force on each iteration,
+# until nodes stop moving (see CONVERGENCE_LIMIT) or this budget is over
+HORIZONTAL_ITERATIONS = 16
+# Stop horizontal adjustment when no node moves further than this value
+CONVERGENCE_LIMIT = 1e-3
+# Use vectorized horizontal adjustment (if NumPy is available) starting from this number of rows
+VECTORIZE_FROM = 200
+
 
 @dataclass
 class RenderStep:
@@ -14,25 +27,12 @@ class RenderStep:
     previous: dict[GoalId, list[GoalId]]
 
 
-def add_if_not(m: dict, m1: dict) -> dict:
-    """Merge two dictionaries _without_ overwriting already existing values."""
-    nm = dict(m)
-    for k, v in m1.items():
-        if nm.get(k, None) is None:
-            nm[k] = v
-    return nm
-
-
 def find_previous(rr: RenderResult) -> dict[GoalId, list[GoalId]]:
     """Add previous nodes (parent, blocked, etc) for every node."""
-    result: dict[GoalId, list[GoalId]] = {g: [] for g in rr.roots}
-    to_visit: set[GoalId] = set(rr.roots)
-    while to_visit:
-        g = to_visit.pop()
-        connections = [e[0] for e in rr.by_id(g).edges]
-        for g1 in connections:
-            to_visit.add(g1)
-            result[g1] = result.get(g1, []) + [g]
+    result: dict[GoalId, list[GoalId]] = {row.goal_id: [] for row in rr.rows}
+    for row in rr.rows:
+        for target, _ in row.edges:
+            result[target].append(row.goal_id)
     return result
 
 
@@ -55,53 +55,61 @@ def uniform_locations(width: int, num: int) -> list[int]:
     return result
 
 
-def tube(width: int, step: RenderStep) -> RenderStep:
-    """Node placing algorithm that uses a "tube" with a fixed width."""
-    new_layer: list[GoalId] = []
-    already_added: set[GoalId] = {g for l in step.layers for g in l}
-    for goal_id in step.roots:
-        if len(new_layer) >= width:
-            break
-        if all(g in already_added for g in step.previous[goal_id]):
-            new_layer.append(goal_id)
-    new_roots: list[GoalId] = step.roots[len(new_layer) :] + [
-        e[0] for gid in new_layer for e in step.rr.by_id(gid).edges
-    ]
-    locs = uniform_locations(width, len(new_layer))
-    new_opts: dict[GoalId, dict] = {
-        goal_id: add_if_not(
-            opts,
-            {
-                "row": len(step.layers) if goal_id in new_layer else None,
-                "col": (
-                    locs[new_layer.index(goal_id)] if goal_id in new_layer else None
-                ),
-            },
-        )
-        for goal_id, opts in step.rr.node_opts.items()
-    }
-    new_layers = step.layers + [new_layer]
-    already_added.update({g for l in new_layers for g in l})
-    filtered_roots: list[GoalId] = []
-    for g in new_roots:
-        if g not in already_added:
-            filtered_roots.append(g)
-            already_added.add(g)
-
-    return RenderStep(
-        replace(step.rr, node_opts=new_opts),
-        filtered_roots,
-        new_layers,
-        step.previous,
-    )
-
-
-def build_with(fn: Callable[[RenderStep], RenderStep], rr: RenderResult) -> RenderStep:
-    """Invoke node placing algorithm in a loop while there are nodes to place."""
-    step = RenderStep(rr, list(rr.roots), [], find_previous(rr))
-    while step.roots:
-        step = fn(step)
-    return step
+class Tube:
+    """Node placing algorithm that uses a "tube" with a fixed width.
+
+    Goals are placed layer by layer. Only newly placed goals get their row/col
+    values, and already placed goals are tracked in a single persistent set."""
+
+    def __init__(self, width: int, rr: RenderResult) -> None:
+        self.width = width
+        self.rr = rr
+        self.previous: dict[GoalId, list[GoalId]] = find_previous(rr)
+        self.node_opts: dict[GoalId, dict] = {
+            goal_id: dict(opts) for goal_id, opts in rr.node_opts.items()
+        }
+        self.roots: list[GoalId] = list(rr.roots)
+        self.layers: list[list[GoalId]] = []
+        self.placed: set[GoalId] = set()
+
+    def build(self) -> "Tube":
+        """Place nodes layer by layer while there are nodes to place."""
+        while self.roots:
+            self.step()
+        return self
+
+    def step(self) -> None:
+        """Place a single new layer of nodes."""
+        new_layer: list[GoalId] = []
+        for goal_id in self.roots:
+            if len(new_layer) >= self.width:
+                break
+            if all(g in self.placed for g in self.previous[goal_id]):
+                new_layer.append(goal_id)
+        new_roots: list[GoalId] = self.roots[len(new_layer) :] + [
+            e[0] for gid in new_layer for e in self.rr.by_id(gid).edges
+        ]
+        row: int = len(self.layers)
+        for goal_id, col in zip(
+            new_layer, uniform_locations(self.width, len(new_layer))
+        ):
+            self.node_opts[goal_id] |= {"row": row, "col": col}
+        self.layers.append(new_layer)
+        self.placed.update(new_layer)
+        filtered_roots: list[GoalId] = []
+        queued: set[GoalId] = set()
+        for g in new_roots:
+            if g not in self.placed and g not in queued:
+                filtered_roots.append(g)
+                queued.add(g)
+        self.roots = filtered_roots
+
+    def result(self) -> RenderResult:
+        return replace(self.rr, node_opts=self.node_opts)
+
+    def snapshot(self) -> RenderStep:
+        """Make a snapshot of the current state (only needed for logging)."""
+        return RenderStep(self.result(), list(self.roots), self.layers, self.previous)
 
 
 def avg(vals: list) -> float:
@@ -130,9 +138,11 @@ def calc_shift(rr: RenderResult) -> dict[GoalId, float]:
     return result
 
 
-def adjust_horizontal(rr: RenderResult, mult: float) -> RenderResult:
+def adjust_horizontal(
+    rr: RenderResult, mult: float, deltas: dict[GoalId, float] | None = None
+) -> RenderResult:
     """Move nodes in the horizontal dimension according to the force of the given multiplier."""
-    deltas = calc_shift(rr)
+    deltas = deltas if deltas is not None else calc_shift(rr)
     new_opts = {
         goal_id: opts | {"col": opts["col"] + (mult * deltas[goal_id])}
         for goal_id, opts in rr.node_opts.items()
@@ -182,14 +192,93 @@ def revert_rows(rr: RenderResult) -> RenderResult:
     return replace(rr, node_opts=node_opts)
 
 
+def shift_columns(
+    rr: RenderResult, iterations: int, listener: list[tuple[str, Any]] | None = None
+) -> RenderResult:
+    """Repeat horizontal adjustment until convergence or until the iteration budget is over."""
+    for i in range(iterations):
+        mult: float = 0.5**i
+        deltas = calc_shift(rr)
+        if mult * max((abs(d) for d in deltas.values()), default=0) < CONVERGENCE_LIMIT:
+            break
+        rr = adjust_horizontal(rr, mult, deltas)
+        __log(listener, f"Horizontal adjustment {i + 1}", rr)
+    return rr
+
+
+class ColumnArrays:
+    """Columns and symmetric adjacency (in CSR form: neighbours of the i-th node are
+    indices[indptr[i]:indptr[i + 1]]) of a render result, stored as NumPy arrays
+    for the vectorized horizontal adjustment."""
+
+    def __init__(self, rr: RenderResult) -> None:
+        self.goal_ids: list[GoalId] = [row.goal_id for row in rr.rows]
+        size: int = len(self.goal_ids)
+        position: dict[GoalId, int] = {g: i for i, g in enumerate(self.goal_ids)}
+        pairs: list[tuple[int, int]] = [
+            (position[row.goal_id], position[e[0]])
+            for row in rr.rows
+            for e in row.edges
+        ]
+        keys = np.unique(
+            np.array(
+                [a * size + b for a, b in pairs] + [b * size + a for a, b in pairs],
+                dtype=np.int64,
+            )
+        )
+        self.indices = keys % size
+        self.degree = np.bincount(keys // size, minlength=size)
+        self.indptr = np.concatenate(([0], np.cumsum(self.degree)))
+        # reduceat can't sum empty rows, so only rows with neighbours are reduced
+        self.connected = self.degree > 0
+        self.cols = np.array(
+            [rr.node_opts[g]["col"] for g in self.goal_ids], dtype=np.float64
+        )
+
+    def shift(self):
+        """Vectorized equivalent of calc_shift."""
+        result = np.zeros_like(self.cols)
+        if not self.indices.size:
+            return result
+        deltas = self.cols[self.indices] - np.repeat(self.cols, self.degree)
+        sums = np.add.reduceat(deltas, self.indptr[:-1][self.connected])
+        result[self.connected] = sums / self.degree[self.connected]
+        return result
+
+    def result(self, rr: RenderResult) -> RenderResult:
+        new_opts = {
+            goal_id: rr.node_opts[goal_id] | {"col": col}
+            for goal_id, col in zip(self.goal_ids, self.cols.tolist())
+        }
+        return replace(rr, node_opts=new_opts)
+
+
+def shift_columns_vectorized(
+    rr: RenderResult, iterations: int, listener: list[tuple[str, Any]] | None = None
+) -> RenderResult:
+    """Same as shift_columns, but all node forces are calculated at once with NumPy."""
+    arrays = ColumnArrays(rr)
+    for i in range(iterations):
+        movement = 0.5**i * arrays.shift()
+        if not movement.size or np.abs(movement).max() < CONVERGENCE_LIMIT:
+            break
+        arrays.cols += movement
+        if listener is not None:
+            __log(listener, f"Horizontal adjustment {i + 1}", arrays.result(rr))
+    return arrays.result(rr)
+
+
 def tweak_horizontal(
-    rr: RenderResult, width: int, listener: list[tuple[str, Any]] | None = None
+    rr: RenderResult,
+    width: int,
+    listener: list[tuple[str, Any]] | None = None,
+    iterations: int = HORIZONTAL_ITERATIONS,
 ) -> RenderResult:
     """Improve horizontal node placement on all layers."""
-    r1 = adjust_horizontal(rr, 1.0)
-    __log(listener, "Horizontal adjustment 1", r1)
-    r2 = adjust_horizontal(r1, 0.5)
-    __log(listener, "Horizontal adjustment 2", r2)
+    if np is not None and len(rr.rows) >= VECTORIZE_FROM:
+        r2 = shift_columns_vectorized(rr, iterations, listener)
+    else:
+        r2 = shift_columns(rr, iterations, listener)
     r3 = normalize_cols(r2, width)
     __log(listener, "Normalized columns", r3)
     return r3
@@ -204,16 +293,37 @@ def add_edges(rr: RenderResult) -> RenderResult:
 
 
 def full_render(
-    g: Graph, width: int, listener: list[tuple[str, Any]] | None = None
+    g: Graph,
+    width: int,
+    listener: list[tuple[str, Any]] | None = None,
+    iterations: int = HORIZONTAL_ITERATIONS,
 ) -> RenderResult:
     """Main entrance point for the rendering process."""
     r0: RenderResult = g.q()
+    components = split_components(r0)
+    if len(components) > 1:
+        result = layout_components(
+            r0, components, width, partial(render_component, iterations=iterations)
+        )
+        __log(listener, "Merged components", result)
+        return result
+    return render_component(r0, width, listener, iterations)
+
+
+def render_component(
+    r0: RenderResult,
+    width: int,
+    listener: list[tuple[str, Any]] | None = None,
+    iterations: int = HORIZONTAL_ITERATIONS,
+) -> RenderResult:
+    """Render a single connected component."""
     r0.node_opts = {row.goal_id: {} for row in r0.rows}
-    r1: RenderStep = build_with(partial(tube, width), r0)
-    __log(listener, "Graph", r1)
-    r2: RenderResult = revert_rows(r1.rr)
+    r1: Tube = Tube(width, r0).build()
+    if listener is not None:
+        __log(listener, "Graph", r1.snapshot())
+    r2: RenderResult = revert_rows(r1.result())
     __log(listener, "Invert rows", r2)
-    r3: RenderResult = tweak_horizontal(r2, width, listener)
+    r3: RenderResult = tweak_horizontal(r2, width, listener, iterations)
     r4: RenderResult = add_edges(r3)
     __log(listener, "Final result", r4)
     return r4
@@ -1,3 +1,4 @@
+from collections.abc import Iterator
 from dataclasses import replace, dataclass
 from typing import Any
 
@@ -5,9 +6,14 @@ from siebenapp.domain import (
     Graph,
     ToggleClose,
     Delete,
+    Sync,
     Command,
+    EVERYTHING,
+    QuerySpec,
     RenderResult,
+    RenderRow,
 )
+from siebenapp.goaltree import Goals
 
 SelectableData = list[tuple[str, int]]
 
@@ -33,7 +39,9 @@ class SelectableView(Graph):
     def __init__(self, goals: Graph, data: SelectableData | None = None):
         super().__init__(goals)
         selection_dict: dict[str, int] = dict(data or [])
-        original_root = int(list(goals.q().roots)[0])
+        # Selection layer always wraps persistent layers, so there's no need to build
+        # the whole render result just to find the root goal
+        original_root: int = Goals.ROOT_ID
         self.selection: int = selection_dict.get("selection", original_root)
         self.previous_selection: int = selection_dict.get(
             "previous_selection", original_root
@@ -67,14 +75,22 @@ class SelectableView(Graph):
             self.accept_Select(Select(parent))
             self.accept_HoldSelect(HoldSelect())
 
+    def accept_Sync(self, command: Sync) -> None:
+        self.goaltree.accept(command)
+        if not self.goaltree.has_goal(self.selection):
+            self.accept_Select(Select(Goals.ROOT_ID))
+        if not self.goaltree.has_goal(self.previous_selection):
+            self.previous_selection = self.selection
+            self._events.append(("hold_select", self.selection))
+
     def _command_approved(self, command: Command) -> bool:
         events_before: int = len(self.events())
         self.goaltree.accept(command)
         events_after: int = len(self.events())
         return events_after > events_before
 
-    def q(self) -> RenderResult:
-        rr = self.goaltree.q()
+    def q(self, spec: QuerySpec = EVERYTHING) -> RenderResult:
+        rr = self.goaltree.q(spec)
         return replace(
             rr,
             global_opts=rr.global_opts
@@ -84,6 +100,9 @@ class SelectableView(Graph):
             },
         )
 
+    def iter_rows(self, spec: QuerySpec = EVERYTHING) -> Iterator[RenderRow]:
+        return self.goaltree.iter_rows(spec)
+
     def settings(self, key: str) -> Any:
         selection_settings = {
             "selection": self.selection,
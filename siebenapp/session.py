@@ -0,0 +1,242 @@
+"""Storage session of a single front-end: its goal tree, the database it's saved into,
+and changes shared with other front-ends of the same file (see GoalsHolder)."""
+
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from os import getpid, path
+from queue import SimpleQueue
+from typing import Any
+
+from siebenapp.autolink import AutoLink
+from siebenapp.daemon import Subscription, request, subscribe
+from siebenapp.domain import (
+    Command,
+    GoalId,
+    Graph,
+    QuerySpec,
+    RenderResult,
+    RenderRow,
+    Sync,
+)
+from siebenapp.goaltree import Goals
+from siebenapp.journal import is_journal
+from siebenapp.layers import get_root
+from siebenapp.lazy import LazyGoals
+from siebenapp.render import (
+    RenderDelta,
+    build_layout,
+    decode_delta,
+    diff_results,
+    encode_delta,
+)
+from siebenapp.selectable_view import OPTION_PREV_SELECT, OPTION_SELECT
+from siebenapp.snapshot import update_snapshot
+from siebenapp.system import (
+    ASYNC,
+    SYNC,
+    UPDATE_ACTIONS,
+    Event,
+    compact_events,
+    event_goals,
+    open_storage,
+)
+
+Listener = Callable[[RenderDelta], None]
+
+
+class GoalsHolder:
+    """Goal tree of a single front-end, together with its storage.
+
+    After each command, changes of persistent rows are published to subscribers
+    as a RenderDelta. Only persistent rows are published, because view state
+    (selection, zoom, filter and so on) is own for each front-end (see ADR 0008).
+    Other front-ends of the same file apply these deltas instead of loading
+    the file again. When a socket of the daemon is given to share changes,
+    deltas are sent to (and received from) front-ends of other processes.
+
+    Processes that don't share their changes may still save them into the same
+    file. Such changes are found by the storage and applied the same way:
+    only rows that differ from the goal tree are changed (see reload).
+    When both processes save at once, the storage rebases changes of the latter
+    onto the former ones, reporting those that can't be merged.
+    """
+
+    def __init__(
+        self,
+        goals: Graph,
+        filename: str,
+        classic: bool = True,
+        durability: str = SYNC,
+        profile: str | None = None,
+        snapshot: bool = False,
+        share: str | None = None,
+        notify: Callable[[], None] | None = None,
+    ):
+        self.goals = goals
+        self.filename = filename
+        self.storage = open_storage(filename, durability, profile)
+        # Journals are replayed on load and never use snapshots
+        self.snapshot = snapshot and not is_journal(filename)
+        self.previous: RenderResult = RenderResult([])
+        self.classic = classic
+        self.listeners: list[Listener] = []
+        # Deltas from other processes, waiting to be applied on the caller's thread
+        self.inbox: SimpleQueue[RenderDelta] = SimpleQueue()
+        self.origin: str = f"{getpid()}-{id(self)}"
+        self.subscription: Subscription | None = None
+        # Deltas are sent to the daemon in background, so that commands don't wait
+        self.sender: ThreadPoolExecutor | None = None
+        if share is not None:
+            self.subscription = subscribe(
+                share,
+                path.abspath(filename),
+                self.origin,
+                partial(self._enqueue, notify),
+            )
+            if self.subscription is not None:
+                self.sender = ThreadPoolExecutor(max_workers=1)
+                self.subscribe(partial(self._send, share))
+        self.storage.watch(get_root(goals, Goals).revision)
+
+    def accept(self, *actions: Command) -> None:
+        if actions:
+            root: Goals = get_root(self.goals, Goals)
+            reads = (
+                root.consistent_reads()
+                if isinstance(root, LazyGoals)
+                else nullcontext()
+            )
+            with reads:
+                # Commands must see goals saved by others, e.g. new goals can't reuse their ids
+                self.reload()
+                self.goals.accept_all(*actions)
+        # Changed goals are known from events, which are gone once they are saved
+        changed: list[Event] = self._pending_changes()
+        rebased: bool = self.storage.save(self.goals)
+        if changed and self.listeners:
+            self._publish(changed)
+        if rebased:
+            # Others have saved their goals right before, so own ones were rebased
+            self.reload()
+
+    def subscribe(self, listener: Listener) -> None:
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener: Listener) -> None:
+        self.listeners.remove(listener)
+
+    def apply(self, delta: RenderDelta) -> None:
+        """Patch the goal tree with changes made by another front-end."""
+        self._sync(Sync(tuple(delta.rows), tuple(delta.removed)))
+
+    def _sync(self, command: Sync) -> None:
+        # Changes of others make no events, so they are not published again
+        self.goals.accept(command)
+
+    def receive(self) -> bool:
+        """Apply deltas received from other processes. Return whether there were any."""
+        received: bool = False
+        while not self.inbox.empty():
+            self.apply(self.inbox.get())
+            received = True
+        return received
+
+    def reload(self) -> bool:
+        """Apply changes that other processes have saved into the file since the
+        previous check. Return whether there were any. Only changed goals are read,
+        and the check itself is cheap, so it could be made before each render."""
+        if (changes := self.storage.read_changes()) is None:
+            return False
+        if isinstance(root := get_root(self.goals, Goals), LazyGoals):
+            # Rows that have been read before the change may be cached
+            root.refresh()
+        self._sync(changes)
+        return True
+
+    def _pending_changes(self) -> list[Event]:
+        return compact_events(
+            [event for event in self.goals.events() if event[0] in UPDATE_ACTIONS]
+        )
+
+    def _publish(self, events: list[Event]) -> None:
+        """Publish rows of goals changed by the given events.
+        Rows are built only for these goals, so the cost doesn't depend on the size
+        of the tree (it's not even read when goals are lazy)."""
+        changed: set[int] = event_goals(events)
+        added: set[int] = {event[1] for event in events if event[0] == "add"}
+        goals: Goals = get_root(self.goals, Goals)
+        for event in events:
+            if event[0] == "unarchive":
+                # Goals of the archived subtree are brought back along with its top
+                changed.update(
+                    row.goal_id for row in goals.iter_rows(QuerySpec(subtree=event[1]))
+                )
+        rows: list[RenderRow] = list(
+            get_root(self.goals, AutoLink).rows_of(sorted(changed))
+        )
+        present: set[GoalId] = {row.goal_id for row in rows}
+        delta = RenderDelta(
+            changed=[row.goal_id for row in rows if row.goal_id not in added],
+            added=[row.goal_id for row in rows if row.goal_id in added],
+            removed=sorted(changed - present),
+            rows=rows,
+            global_opts={},
+        )
+        for listener in list(self.listeners):
+            listener(delta)
+
+    def _send(self, share: str, delta: RenderDelta) -> None:
+        message: dict[str, Any] = {
+            "command": "publish",
+            "db": path.abspath(self.filename),
+            "origin": self.origin,
+            "delta": encode_delta(delta),
+        }
+        assert self.sender is not None
+        self.sender.submit(request, share, message)
+
+    def _enqueue(self, notify: Callable[[], None] | None, data: dict[str, Any]) -> None:
+        self.inbox.put(decode_delta(data))
+        if notify is not None:
+            notify()
+
+    def close(self, quitting: bool = False) -> None:
+        if self.sender is not None:
+            # Deltas that wait to be sent are sent first
+            self.sender.shutdown()
+            self.sender = None
+        if self.subscription is not None:
+            self.subscription.close()
+            self.subscription = None
+        self.storage.close(quitting)
+        # Snapshot must match the database, so it's not updated when writes may be lost
+        if self.snapshot and not (quitting and self.storage.durability == ASYNC):
+            update_snapshot(self.goals, self.filename)
+
+    def render(self, width: int) -> tuple[RenderResult, list[GoalId]]:
+        """Render tree with a given width and return two values:
+        1. Render result as is.
+        2. A list of changed rows in case of _partial_ update; empty list otherwise.
+        """
+        return self.show(build_layout(self.goals, width, self.classic))
+
+    def show(self, result: RenderResult) -> tuple[RenderResult, list[GoalId]]:
+        """The same as render(), for a result that's built elsewhere
+        (e.g. by LayoutWorker)."""
+        delta = self._calculate_delta(result)
+        self.previous = result
+        return result, delta
+
+    def _calculate_delta(self, new_result: RenderResult) -> list[GoalId]:
+        """Ids of rows that should be drawn again, when only selection is changed;
+        empty list when the whole tree should be drawn again."""
+        if diff_results(self.previous, new_result).has_rows():
+            return []
+        result: list[GoalId] = []
+        for option in [OPTION_SELECT, OPTION_PREV_SELECT]:
+            if self.previous.global_opts[option] != new_result.global_opts[option]:
+                result.append(self.previous.global_opts[option])
+                result.append(new_result.global_opts[option])
+        return result
@@ -0,0 +1,184 @@
+"""Binary snapshot of a goal database, stored next to it in a <db>.snap file.
+
+Snapshot contains everything needed to restore persistent layers (Goals and AutoLink)
+without parsing database rows. It is valid only while the database content stays
+the same, so the snapshot keeps a hash of the database file (and its write-ahead log).
+"""
+
+import mmap
+import sys
+from collections.abc import Callable
+from array import array
+from hashlib import blake2b
+from os import path, replace
+from struct import Struct
+
+from siebenapp.autolink import AutoLink, AutoLinkData
+from siebenapp.domain import Graph
+from siebenapp.goaltree import Goals
+from siebenapp.layers import get_root
+
+MAGIC = b"SIEBSNAP"
+FORMAT_VERSION = 1
+# magic, format version, byte order, database digest, number of sections
+HEADER = Struct("<8sIc32sI")
+SECTION = Struct("<Q")
+SECTIONS_COUNT = 10
+
+# Goal states
+DELETED, OPEN, CLOSED = 0, 1, 2
+
+
+def snapshot_name(filename: str) -> str:
+    return f"{filename}.snap"
+
+
+def db_digest(filename: str) -> bytes:
+    digest = blake2b(digest_size=32)
+    for name in [filename, f"{filename}-wal"]:
+        if path.isfile(name):
+            with open(name, "rb") as f:
+                while chunk := f.read(1 << 20):
+                    digest.update(chunk)
+    return digest.digest()
+
+
+def _pack_strings(strings: list[str]) -> tuple[array, bytes]:
+    offsets: array = array("I", [0])
+    blob: bytearray = bytearray()
+    for s in strings:
+        blob += s.encode("utf-8")
+        offsets.append(len(blob))
+    return offsets, bytes(blob)
+
+
+def _unpack_strings(offsets: list[int], blob: memoryview) -> list[str]:
+    return [str(blob[a:b], "utf-8") for a, b in zip(offsets, offsets[1:])]
+
+
+def write_snapshot(goals: Graph, filename: str) -> None:
+    """Save persistent layers of the given goal tree into a snapshot of the database.
+    Goal tree must be in sync with the database, i.e. all its changes must be saved.
+    Trees with archived subtrees are never saved, because archived goals are loaded
+    from the database on demand."""
+    root_goals: Goals = get_root(goals, Goals)
+    if root_goals.archived:
+        return
+    goals_export, edges_export = Goals.export(root_goals)
+    autolink_export: AutoLinkData = AutoLink.export(get_root(goals, AutoLink))
+
+    max_id: int = max((g[0] for g in goals_export), default=0)
+    states: bytearray = bytearray(max_id)
+    name_index: array = array("i", [-1] * max_id)
+    names: dict[str, int] = {}
+    for goal_id, name, is_open in goals_export:
+        if name is None:
+            continue
+        states[goal_id - 1] = OPEN if is_open else CLOSED
+        # Equal names are stored only once
+        name_index[goal_id - 1] = names.setdefault(name, len(names))
+    name_offsets, name_blob = _pack_strings(list(names))
+    edges = sorted(edges_export)
+    kw_offsets, kw_blob = _pack_strings([kw for _, kw in autolink_export])
+
+    sections: list[bytes] = [
+        bytes(states),
+        name_index.tobytes(),
+        name_offsets.tobytes(),
+        name_blob,
+        array("i", [e[0] for e in edges]).tobytes(),
+        array("i", [e[1] for e in edges]).tobytes(),
+        bytes(e[2] for e in edges),
+        array("i", [goal_id for goal_id, _ in autolink_export]).tobytes(),
+        kw_offsets.tobytes(),
+        kw_blob,
+    ]
+    target: str = snapshot_name(filename)
+    with open(f"{target}.tmp", "wb") as f:
+        byte_order: bytes = sys.byteorder[0].encode()
+        f.write(
+            HEADER.pack(
+                MAGIC, FORMAT_VERSION, byte_order, db_digest(filename), len(sections)
+            )
+        )
+        for section in sections:
+            f.write(SECTION.pack(len(section)))
+            f.write(section)
+            # keep all sections aligned
+            f.write(b"\0" * (-len(section) % 8))
+    replace(f"{target}.tmp", target)
+
+
+def update_snapshot(goals: Graph, filename: str) -> None:
+    """Rewrite snapshot only when it does not match the database anymore."""
+    if path.isfile(filename) and not is_snapshot_valid(filename):
+        write_snapshot(goals, filename)
+
+
+def is_snapshot_valid(filename: str) -> bool:
+    target: str = snapshot_name(filename)
+    if not path.isfile(target):
+        return False
+    with open(target, "rb") as f:
+        header: bytes = f.read(HEADER.size)
+    return _header_is_valid(header, filename)
+
+
+def _header_is_valid(header: bytes, filename: str) -> bool:
+    if len(header) < HEADER.size:
+        return False
+    magic, version, byte_order, digest, count = HEADER.unpack(header)
+    return (
+        magic == MAGIC
+        and version == FORMAT_VERSION
+        and byte_order == sys.byteorder[0].encode()
+        and count == SECTIONS_COUNT
+        and digest == db_digest(filename)
+    )
+
+
+def read_snapshot(
+    filename: str, message_fn: Callable[[str], None] | None = None
+) -> tuple[Goals, AutoLinkData] | None:
+    """Restore goals and autolink data from the snapshot of the database,
+    or return None when there is no valid snapshot."""
+    target: str = snapshot_name(filename)
+    if not path.isfile(target) or path.getsize(target) < HEADER.size:
+        return None
+    with (
+        open(target, "rb") as f,
+        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm,
+    ):
+        if not _header_is_valid(mm[: HEADER.size], filename):
+            return None
+        with memoryview(mm) as view:
+            raw: list[memoryview] = []
+            pos: int = HEADER.size
+            for _ in range(SECTIONS_COUNT):
+                (length,) = SECTION.unpack_from(mm, pos)
+                pos += SECTION.size
+                raw.append(view[pos : pos + length])
+                pos += length + (-length % 8)
+            states: bytes = raw[0].tobytes()
+            name_index: list[int] = raw[1].cast("i").tolist()
+            # the last item is used for deleted goals (with index -1)
+            names: list[str | None] = [
+                *_unpack_strings(raw[2].cast("I").tolist(), raw[3]),
+                None,
+            ]
+            parents: list[int] = raw[4].cast("i").tolist()
+            children: list[int] = raw[5].cast("i").tolist()
+            types: list[int] = list(raw[6].tobytes())
+            autolink_goals: list[int] = raw[7].cast("i").tolist()
+            keywords: list[str] = _unpack_strings(raw[8].cast("I").tolist(), raw[9])
+            for section in raw:
+                section.release()
+    goals: Goals = Goals.build_packed(
+        list(map(names.__getitem__, name_index)),
+        {i for i, state in enumerate(states, start=1) if state != OPEN},
+        parents,
+        children,
+        types,
+        message_fn,
+    )
+    return goals, list(zip(autolink_goals, keywords))
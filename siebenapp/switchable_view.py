@@ -1,7 +1,18 @@
+from collections.abc import Iterator
 from dataclasses import dataclass, replace
 from typing import Any
 
-from siebenapp.domain import Command, Graph, RenderResult, RenderRow
+from siebenapp.domain import (
+    Command,
+    EVERYTHING,
+    Graph,
+    QuerySpec,
+    RenderResult,
+    GoalId,
+    RenderRow,
+    selected_ids,
+)
+from siebenapp.goaltree import Goals
 
 
 @dataclass(frozen=True)
@@ -30,8 +41,8 @@ class SwitchableView(Graph):
         if origin.settings("filter_switchable"):
             self.accept(ToggleSwitchableView())
 
-    def q(self) -> RenderResult:
-        render_result = self.goaltree.q()
+    def q(self, spec: QuerySpec = EVERYTHING) -> RenderResult:
+        render_result = self.goaltree.q(spec)
         if not self._only_switchable:
             return render_result
         rows: list[RenderRow] = [
@@ -40,3 +51,16 @@ class SwitchableView(Graph):
             if row.is_switchable or row.goal_id in render_result.global_opts.values()
         ]
         return replace(render_result, rows=rows, roots={r.goal_id for r in rows})
+
+    def iter_rows(self, spec: QuerySpec = EVERYTHING) -> Iterator[RenderRow]:
+        if not self._only_switchable:
+            return self.goaltree.iter_rows(spec)
+        if self.settings("zoom_root") != Goals.ROOT_ID:
+            # Zoom replaces the selected root goal with a fake one
+            return super().iter_rows(spec)
+        shown: frozenset[GoalId] = selected_ids(self)
+        return (
+            replace(row, edges=[])
+            for row in self.goaltree.iter_rows(spec)
+            if row.is_switchable or row.goal_id in shown
+        )
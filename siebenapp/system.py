@@ -1,12 +1,25 @@
 import sqlite3
-from collections.abc import Callable
-from os import path
+from collections import defaultdict
+from collections.abc import Callable, Iterable
+from contextlib import closing
+from functools import partial
+from itertools import groupby
+from operator import itemgetter
+from os import environ, path
+from queue import Empty, Full, Queue
+from threading import Thread
+from time import monotonic
+from typing import Any
 
+from siebenapp.archive import archive_subtrees, read_archive
 from siebenapp.autolink import AutoLink, AutoLinkData
-from siebenapp.domain import Graph
+from siebenapp.domain import EdgeType, Graph, RenderRow, Sync
 from siebenapp.enumeration import Enumeration
-from siebenapp.goaltree import Goals
+from siebenapp.goaltree import Goals, GoalsData, EdgesData
 from siebenapp.layers import all_layers, get_root
+from siebenapp.journal import Journal, create_journal, is_journal, read_journal
+from siebenapp.lazy import LazyGoals
+from siebenapp.snapshot import read_snapshot
 
 MIGRATIONS = [
     # 0
@@ -124,23 +137,506 @@ MIGRATIONS = [
     ["drop table zoom"],
     # 11: clean settings table but do not delete it yet
     ["delete from settings where name in ('selection', 'previous_selection')"],
+    # 12: child-side lookups (like deletion of a goal) should not scan all edges
+    ["create index edges_child on edges(child)"],
+    # 13: archive of closed subtrees (see siebenapp.archive)
+    [
+        """create table archive_goals (
+            root integer not null,
+            goal_id integer not null,
+            name text,
+            open boolean
+        )""",
+        "create index archive_goals_root on archive_goals(root)",
+        """create table archive_edges (
+            root integer not null,
+            parent integer not null,
+            child integer not null,
+            reltype integer not null
+        )""",
+        "create index archive_edges_root on archive_edges(root)",
+        """create table archived (
+            goal_id integer primary key,
+            goals integer not null,
+            foreign key(goal_id) references goals(goal_id)
+        )""",
+        # Closing time of goals (in days), needed to archive old subtrees only.
+        # It's maintained by triggers, so that event writers don't care about it.
+        """create table closed_at (
+            goal_id integer primary key,
+            at real not null,
+            foreign key(goal_id) references goals(goal_id)
+        )""",
+        "insert into closed_at select goal_id, julianday('now') from goals where not open",
+        """create trigger goal_added_closed after insert on goals when not new.open
+           begin
+             insert or replace into closed_at values (new.goal_id, julianday('now'));
+           end""",
+        """create trigger goal_closed after update of open on goals when not new.open
+           begin
+             insert or replace into closed_at values (new.goal_id, julianday('now'));
+           end""",
+        """create trigger goal_reopened after update of open on goals when new.open
+           begin
+             delete from closed_at where goal_id=new.goal_id;
+           end""",
+        """create trigger goal_deleted after delete on goals
+           begin
+             delete from closed_at where goal_id=old.goal_id;
+           end""",
+    ],
+    # 14: revision of the database, increased by every batch of events,
+    # and the last revision that has changed each goal (see Storage)
+    [
+        "create table revision (value integer not null)",
+        "insert into revision values (0)",
+        """create table goal_revisions (
+            goal_id integer primary key,
+            revision integer not null
+        )""",
+        "create index goal_revisions_revision on goal_revisions(revision)",
+    ],
 ]
 
 
-def save(goals: Graph, filename: str) -> None:
-    if path.isfile(filename):
-        connection = sqlite3.connect(filename)
-        run_migrations(connection)
-        save_updates(goals, connection)
-    else:
-        connection = sqlite3.connect(filename)
-        save_connection(goals, connection)
+# SQL statements for each kind of persistent event
+UPDATE_ACTIONS: dict[str, list[str]] = {
+    "add": ["insert into goals values (?,?,?)"],
+    "toggle_close": ["update goals set open=? where goal_id=?"],
+    "rename": ["update goals set name=? where goal_id=?"],
+    "link": ["insert into edges values (?,?,?)"],
+    "unlink": ["delete from edges where parent=? and child=? and reltype=?"],
+    "delete": [
+        "delete from goals where goal_id=?",
+        "delete from edges where child=?",
+        "delete from edges where parent=?",
+        "delete from archive_goals where root=?",
+        "delete from archive_edges where root=?",
+        "delete from archived where goal_id=?",
+    ],
+    "add_autolink": ["insert into autolink values (?, ?)"],
+    "remove_autolink": ["delete from autolink where goal=?"],
+    "unarchive": [
+        "insert into goals select goal_id, name, open from archive_goals where root=?",
+        "insert into edges select parent, child, reltype from archive_edges where root=?",
+        "delete from archive_goals where root=?",
+        "delete from archive_edges where root=?",
+        "delete from archived where goal_id=?",
+    ],
+}
+
+# Positions of goal ids in persistent events of each kind
+EVENT_GOALS: dict[str, tuple[int, ...]] = {
+    "add": (1,),
+    "toggle_close": (2,),
+    "rename": (2,),
+    "link": (1, 2),
+    "unlink": (1, 2),
+    "delete": (1,),
+    "add_autolink": (1,),
+    "remove_autolink": (1,),
+    "unarchive": (1,),
+}
+
+
+# Storage profiles: pragmas applied to every connection.
+# * safe: SQLite defaults (rollback journal, full fsync on every commit);
+# * fast: write-ahead log, so that readers do not block the writer (and vice versa),
+#   fewer fsyncs (a power loss may roll back the last commits, but never corrupts data),
+#   larger page cache and memory-mapped reads.
+SAFE = "safe"
+FAST = "fast"
+PROFILES: dict[str, list[str]] = {
+    SAFE: [],
+    FAST: [
+        "pragma journal_mode=WAL",
+        "pragma synchronous=NORMAL",
+        "pragma cache_size=-16384",
+        "pragma mmap_size=268435456",
+    ],
+}
+# Environment variable with the storage profile name, used when no profile is given explicitly
+PROFILE_ENV = "SIEBEN_STORAGE"
+
+
+def connect(filename: str, profile: str | None = None) -> sqlite3.Connection:
+    profile = profile or environ.get(PROFILE_ENV) or SAFE
+    assert profile in PROFILES, f"Unknown storage profile: {profile}"
+    connection = sqlite3.connect(filename)
+    for pragma in PROFILES[profile]:
+        connection.execute(pragma)
+    return connection
+
+
+# A single persistent change, as stored in the event queue of a goal tree
+Event = tuple[Any, ...]
+
+# Durability modes of Storage:
+# * sync: every save is written and committed before returning;
+# * async: saves are written by a background thread, pending writes may be lost on exit
+#   (but they are always flushed when another file is opened);
+# * async+flush-on-quit: the same, but application also waits for pending writes on exit.
+SYNC = "sync"
+ASYNC = "async"
+ASYNC_FLUSH_ON_QUIT = "async+flush-on-quit"
+DURABILITY_MODES = [SYNC, ASYNC, ASYNC_FLUSH_ON_QUIT]
+
+# Background writer commits not more often than once per this interval (in seconds)
+FLUSH_INTERVAL = 0.2
+# Maximal amount of saves waiting for the background writer; further saves are blocked
+WRITE_QUEUE_SIZE = 1000
+
+
+class WriteBehind:
+    """Background thread that writes events into the database.
+    Events received during the flush interval are written in a single transaction.
+    When there were no commits recently (i.e. writer is idle), events are written at once.
+    Writer has its own connection, because sqlite3 connections can't be shared between threads.
+    Goal tree doesn't see changes of other processes until everything is written, so they
+    can't be rebased: writer stops with an error when the database has been changed by others.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        interval: float = FLUSH_INTERVAL,
+        queue_size: int = WRITE_QUEUE_SIZE,
+        profile: str | None = None,
+        revision: int | None = None,
+    ) -> None:
+        self.filename = filename
+        self.profile = profile
+        self.interval = interval
+        # Revision of the database that the goal tree matches (when it's known)
+        self.revision = revision
+        self.queue: Queue[list[Event] | None] = Queue(maxsize=queue_size)
+        self.error: Exception | None = None
+        self.commits: int = 0
+        self.thread = Thread(target=self._run, name="sieben-writer", daemon=True)
+        self.thread.start()
+
+    def put(self, events: list[Event]) -> None:
+        self._put(events)
+
+    def close(self, wait: bool) -> None:
+        """Stop writer after all pending events are written.
+        When wait is False, writing continues in background, and errors of the writer
+        are not reported."""
+        try:
+            self._put(None)
+        except Exception:
+            if wait:
+                raise
+            return
+        if wait:
+            self.thread.join()
+            self._check()
+
+    def _put(self, item: list[Event] | None) -> None:
+        # A writer that has failed doesn't take anything from the queue anymore,
+        # so a full queue is checked again and again instead of waiting forever
+        while True:
+            self._check()
+            try:
+                self.queue.put(item, timeout=self.interval)
+                return
+            except Full:
+                if not self.thread.is_alive():
+                    raise RuntimeError("Background writer has stopped")
+
+    def _check(self) -> None:
+        if self.error is not None:
+            raise self.error
+
+    def _run(self) -> None:
+        try:
+            with closing(connect(self.filename, self.profile)) as connection:
+                run_migrations(connection)
+                mark_verified(connection)
+                connection.commit()
+                last_commit: float = 0.0
+                stopped: bool = False
+                while not stopped:
+                    batch = self.queue.get()
+                    if batch is None:
+                        break
+                    pending: list[Event] = list(batch)
+                    deadline: float = last_commit + self.interval
+                    while True:
+                        timeout: float = deadline - monotonic()
+                        try:
+                            batch = (
+                                self.queue.get(timeout=timeout)
+                                if timeout > 0
+                                else self.queue.get_nowait()
+                            )
+                        except Empty:
+                            break
+                        if batch is None:
+                            stopped = True
+                            break
+                        pending.extend(batch)
+                    self._write(pending, connection)
+                    self.commits += 1
+                    last_commit = monotonic()
+        except Exception as e:
+            self.error = e
+
+    def _write(self, events: list[Event], connection: sqlite3.Connection) -> None:
+        # Other writers wait until the revision is checked and the events are written
+        connection.execute("begin immediate")
+        revision: int = read_revision(connection)
+        if self.revision not in {None, revision}:
+            connection.rollback()
+            raise RuntimeError(
+                f"{self.filename} has been changed by another process: "
+                "use sync durability for files that are opened more than once"
+            )
+        write_events(events, connection)
+        self.revision = revision + 1
+
+
+class Storage:
+    """Long-lived session to a goal database.
+    Connection is opened (and migrations are applied) only once, on the first save.
+    sqlite3 keeps prepared statements cached per connection, so they are reused too.
+    In async modes, writes are handed to a WriteBehind thread instead
+    (so rows changed in lazy goal trees are kept in memory, see LazyGoals.unpin)."""
+
+    def __init__(
+        self, filename: str, durability: str = SYNC, profile: str | None = None
+    ) -> None:
+        assert durability in DURABILITY_MODES, f"Unknown durability: {durability}"
+        self.filename = filename
+        self.durability = durability
+        self.profile = profile
+        self.connection: sqlite3.Connection | None = None
+        self.migrated: bool = False
+        self.writer: WriteBehind | None = None
+        # Revision of the database that the goal tree matches (when it's known)
+        self.revision: int | None = None
+        # Goals with own changes that could not be written because of a conflict
+        self.discarded: set[int] = set()
+        # Changed by SQLite on every commit of other connections (None when unknown)
+        self.data_version: int | None = None
+
+    def save(self, goals: Graph) -> bool:
+        """Write changes of the goal tree. Return whether they have been rebased
+        onto changes of other writers, so the goal tree must be reloaded."""
+        if (
+            self.connection is None
+            and self.writer is None
+            and not path.isfile(self.filename)
+        ):
+            connection = connect(self.filename, self.profile)
+            save_connection(goals, connection)
+            self.revision = read_revision(connection)
+            if self.durability == SYNC:
+                self.connection = connection
+                self.migrated = True
+            else:
+                connection.close()
+            return False
+        events: list[Event] = drain_events(goals)
+        if not events:
+            # Only view-level changes: nothing to write, database is not touched at all
+            return False
+        if self.durability == SYNC:
+            connection = self._connect()
+            if not self.migrated:
+                run_migrations(connection)
+                mark_verified(connection)
+                self.migrated = True
+                connection.commit()
+            # Other writers wait until the revision is checked and the events are written
+            connection.execute("begin immediate")
+            try:
+                revision: int = read_revision(connection)
+                if self.revision in {None, revision}:
+                    write_events(events, connection)
+                    self.revision = revision + 1
+                    if isinstance(root := get_root(goals, Goals), LazyGoals):
+                        # Database has the same rows now, so they may be evicted
+                        root.unpin()
+                    return False
+                else:
+                    # Goal tree stays at its revision: changes of others are read
+                    # later, together with own ones as they have been rebased
+                    self._write_rebased(events, goals, connection)
+                    self.data_version = None
+                    if isinstance(root := get_root(goals, Goals), LazyGoals):
+                        # Own rows are written under other ids (or discarded),
+                        # and rows of others may be cached
+                        root.refresh()
+                    return True
+            except Exception:
+                # Otherwise the database stays locked for other writers
+                connection.rollback()
+                raise
+        else:
+            if self.writer is None:
+                self.writer = WriteBehind(
+                    self.filename, profile=self.profile, revision=self.revision
+                )
+            self.writer.put(events)
+            return False
+
+    def _write_rebased(
+        self, events: list[Event], goals: Graph, connection: sqlite3.Connection
+    ) -> None:
+        """Write events that have been made on an outdated goal tree.
+        When the result is not a valid tree, all of them are discarded."""
+        rebased, errors, stale = rebase_events(events, connection)
+        apply_events(rebased, connection)
+        try:
+            read_goals(connection).verify()
+        except AssertionError:
+            connection.rollback()
+            self.discarded.update(event_goals(events))
+            errors = ["Changes conflict with ones saved by another process"]
+        else:
+            connection.commit()
+            # Goal tree still has them under own ids, so they are read once again
+            self.discarded.update(stale)
+        for error in errors:
+            goals.error(error)
+
+    def watch(self, revision: int | None) -> None:
+        """Look for changes of other writers since the given revision of the database
+        (when it's unknown, since the current one)."""
+        self.revision = revision
+        self.data_version = None
+        if revision is None:
+            self.read_changes()
+
+    def read_changes(self) -> Sync | None:
+        """Return goals changed by other writers (and own ones that have been rebased
+        or discarded) since the revision of the goal tree; None when there are none.
+        Only the sync mode is checked: in async modes pending writes make
+        the database lag behind the goal tree."""
+        if self.durability != SYNC or not path.isfile(self.filename):
+            return None
+        connection = self._connect()
+        # Nothing is committed by others since the last check (own commits
+        # don't change data version), so there's no need for a transaction
+        (data_version,) = connection.execute("pragma data_version").fetchone()
+        if data_version == self.data_version and not self.discarded:
+            return None
+        self.data_version = data_version
+        # Revision and goals are read in a single transaction, so that they match
+        connection.execute("begin")
+        try:
+            revision: int = read_revision(connection)
+            since: int | None = self.revision
+            self.revision = revision
+            if since in {None, revision} and not self.discarded:
+                return None
+            changed: set[int] = self.discarded | {
+                goal_id
+                for (goal_id,) in connection.execute(
+                    "select goal_id from goal_revisions where revision > ?", (since,)
+                )
+            }
+            self.discarded = set()
+            return read_rows(connection, changed)
+        finally:
+            connection.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            self.connection = connect(self.filename, self.profile)
+        return self.connection
+
+    def close(self, quitting: bool = False) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+            self.migrated = False
+        if self.writer is not None:
+            writer, self.writer = self.writer, None
+            writer.close(wait=not quitting or self.durability == ASYNC_FLUSH_ON_QUIT)
+
+
+class JournalStorage:
+    """Session to a goal journal (see siebenapp.journal): every save appends
+    compacted events as a single record. Profiles do not apply to journals.
+    In async modes records are not fsync'ed, so they survive a crash of the app,
+    but may be lost when the whole system goes down."""
+
+    def __init__(
+        self, filename: str, durability: str = SYNC, profile: str | None = None
+    ) -> None:
+        assert durability in DURABILITY_MODES, f"Unknown durability: {durability}"
+        self.filename = filename
+        self.durability = durability
+        self.profile = profile
+        self.journal: Journal | None = None
+
+    def save(self, goals: Graph) -> bool:
+        """Changes of other processes are not detected, so nothing is rebased."""
+        if self.journal is None and not path.isfile(self.filename):
+            drain_events(goals)
+            create_journal(self.filename, export_events(goals))
+            return False
+        events: list[Event] = drain_events(goals)
+        if events:
+            if self.journal is None:
+                self.journal = Journal(self.filename, sync=self.durability == SYNC)
+            self.journal.append(compact_events(events))
+        return False
+
+    def watch(self, revision: int | None) -> None:
+        pass
 
-    connection.close()
+    def read_changes(self) -> Sync | None:
+        """Changes of journals by other processes are not detected."""
+        return None
+
+    def close(self, quitting: bool = False) -> None:
+        if self.journal is not None:
+            journal, self.journal = self.journal, None
+            journal.close(wait=not quitting or self.durability != ASYNC)
+
+
+def open_storage(
+    filename: str, durability: str = SYNC, profile: str | None = None
+) -> Storage | JournalStorage:
+    """Choose storage backend by the file extension."""
+    if is_journal(filename):
+        return JournalStorage(filename, durability, profile)
+    return Storage(filename, durability, profile)
+
+
+def drain_events(goals: Graph) -> list[Event]:
+    """Take all events from the goal tree, leaving only those that must be written
+    into the database. Other events (like "select" or "zoom") only change view state
+    and are never saved (see ADR 0008)."""
+    queue = goals.events()
+    events: list[Event] = [event for event in queue if event[0] in UPDATE_ACTIONS]
+    queue.clear()
+    return events
+
+
+def save(goals: Graph, filename: str, profile: str | None = None) -> None:
+    storage = open_storage(filename, profile=profile)
+    storage.save(goals)
+    storage.close()
+
+
+def export_events(goals: Graph) -> list[Event]:
+    """Return events that create persistent layers of the given tree from scratch."""
+    goals_export, edges_export = Goals.export(get_root(goals, Goals))
+    autolink_export: AutoLinkData = AutoLink.export(get_root(goals, AutoLink))
+    return (
+        [("add", *row) for row in goals_export]
+        + [("link", *row) for row in edges_export]
+        + [("add_autolink", *row) for row in autolink_export]
+    )
 
 
 def save_connection(goals: Graph, connection) -> None:
     run_migrations(connection)
+    mark_verified(connection)
     root_goals: Goals = get_root(goals, Goals)
     goals_export, edges_export = Goals.export(root_goals)
     autolink_goals: AutoLink = get_root(goals, AutoLink)
@@ -154,50 +650,402 @@ def save_connection(goals: Graph, connection) -> None:
 
 
 def save_updates(goals: Graph, connection: sqlite3.Connection) -> None:
-    actions = {
-        "add": ["insert into goals values (?,?,?)"],
-        "toggle_close": ["update goals set open=? where goal_id=?"],
-        "rename": ["update goals set name=? where goal_id=?"],
-        "link": ["insert into edges values (?,?,?)"],
-        "unlink": ["delete from edges where parent=? and child=? and reltype=?"],
-        "delete": [
-            "delete from goals where goal_id=?",
-            "delete from edges where child=?",
-            "delete from edges where parent=?",
-        ],
-        "add_autolink": ["insert into autolink values (?, ?)"],
-        "remove_autolink": ["delete from autolink where goal=?"],
-    }
-    cur = connection.cursor()
-    while goals.events():
-        event = goals.events().popleft()
-        if event[0] in actions:
-            for query in actions[event[0]]:
-                if "?" in query:
-                    cur.execute(query, event[1:])
-                else:
-                    cur.execute(query)
+    write_events(drain_events(goals), connection)
+
+
+def write_events(events: list[Event], connection: sqlite3.Connection) -> None:
+    """Write events in a single transaction."""
+    apply_events(events, connection)
     connection.commit()
 
 
-def load(filename: str, message_fn: Callable[[str], None] | None = None) -> Enumeration:
+def apply_events(events: list[Event], connection: sqlite3.Connection) -> None:
+    """Execute statements of events without commit, using one executemany call
+    per statement for each run of events of the same kind.
+    Every such batch is a new revision of the database, and goals changed by it
+    are marked with this revision."""
+    cur = connection.cursor()
+    cur.execute("update revision set value = value + 1")
+    compacted: list[Event] = compact_events(events)
+    changed: set[int] = event_goals(compacted)
+    for kind, group in groupby(compacted, key=itemgetter(0)):
+        params: list[Event] = [event[1:] for event in group]
+        if kind == "unarchive":
+            # Goals are brought back from the archive, which is cleared right after
+            changed.update(
+                goal_id
+                for (goal_id,) in cur.execute(
+                    "select goal_id from archive_goals where root in (%s)"
+                    % ",".join("?" * len(params)),
+                    [root for (root,) in params],
+                )
+            )
+        for query in UPDATE_ACTIONS[kind]:
+            cur.executemany(query, params)
+    mark_changed(changed, connection)
+
+
+def event_goals(events: list[Event]) -> set[int]:
+    return {event[position] for event in events for position in EVENT_GOALS[event[0]]}
+
+
+def mark_changed(goal_ids: Iterable[int], connection: sqlite3.Connection) -> None:
+    """Mark goals as changed by the current revision of the database."""
+    connection.executemany(
+        "insert or replace into goal_revisions select ?, value from revision",
+        [(goal_id,) for goal_id in goal_ids],
+    )
+
+
+def read_revision(connection: sqlite3.Connection) -> int:
+    (revision,) = connection.execute("select value from revision").fetchone()
+    return revision
+
+
+# Maximal number of ids in a single query (SQLite may be built with a limit of 999)
+IDS_PER_QUERY = 500
+
+
+def read_rows(connection: sqlite3.Connection, goal_ids: Iterable[int]) -> Sync | None:
+    """Read the given goals as rows of persistent layers; goals that don't exist
+    are removed. Switchability of goals is not known here, but Sync doesn't need it."""
+    ids: list[int] = sorted(goal_ids)
+    if not ids:
+        return None
+    names: dict[int, tuple[str, bool]] = {}
+    edges: dict[int, list[tuple[int, EdgeType]]] = defaultdict(list)
+    attrs: dict[int, dict[str, str]] = defaultdict(dict)
+    for first in range(0, len(ids), IDS_PER_QUERY):
+        chunk: list[int] = ids[first : first + IDS_PER_QUERY]
+        marks: str = ",".join("?" * len(chunk))
+        for goal_id, name, is_open in connection.execute(
+            f"select goal_id, name, open from goals where goal_id in ({marks})", chunk
+        ):
+            names[goal_id] = (name, bool(is_open))
+        for parent, child, reltype in connection.execute(
+            f"select parent, child, reltype from edges where parent in ({marks})", chunk
+        ):
+            edges[parent].append((child, EdgeType(reltype)))
+        for goal_id, keyword in connection.execute(
+            f"select goal, keyword from autolink where goal in ({marks})", chunk
+        ):
+            attrs[goal_id]["Autolink"] = keyword
+        for goal_id, count in connection.execute(
+            f"select goal_id, goals from archived where goal_id in ({marks})", chunk
+        ):
+            attrs[goal_id]["Archived"] = str(count)
+    return Sync(
+        tuple(
+            RenderRow(
+                goal_id,
+                goal_id,
+                name,
+                is_open,
+                False,
+                True,
+                edges[goal_id],
+                attrs[goal_id],
+            )
+            for goal_id, (name, is_open) in names.items()
+        ),
+        tuple(goal_id for goal_id in ids if goal_id not in names),
+    )
+
+
+def rebase_events(
+    events: list[Event], connection: sqlite3.Connection
+) -> tuple[list[Event], list[str], set[int]]:
+    """Adapt events made on an outdated goal tree to the database changed
+    by other writers. Return events to write, explanations of dropped ones, and
+    ids of new goals which the goal tree has under ids that aren't theirs anymore.
+
+    New goals get ids that are free in the database, and events that refer to them
+    are changed accordingly. Events about goals that don't exist anymore can't
+    be merged, so they are dropped, together with new goals that can't be
+    linked to their parents. Links and keywords replace ones of other writers.
+    """
+    existing: set[int] = {g for (g,) in connection.execute("select goal_id from goals")}
+    (last_id,) = connection.execute(
+        "select max(goal_id) from (select goal_id from goals "
+        "union all select goal_id from archive_goals)"
+    ).fetchone()
+    next_id: int = (last_id or 0) + 1
+    new_ids: dict[int, int] = {}
+    # Ids of new goals in the goal tree, by ids that are written instead
+    local_ids: dict[int, int] = {}
+    # Positions of "add" events of new goals in the result, and new goals dropped from it
+    added_at: dict[int, int] = {}
+    dropped: set[int] = set()
+    result: list[Event | None] = []
+    errors: list[str] = []
+
+    def missing(*goal_ids: int) -> bool:
+        gone: list[int] = [g for g in goal_ids if g not in existing]
+        for goal_id in gone:
+            message = f"Goal {goal_id} has been deleted by another process"
+            if goal_id not in dropped and message not in errors:
+                errors.append(message)
+        return bool(gone)
+
+    for event in events:
+        kind: str = event[0]
+        if kind == "add":
+            goal_id: int = event[1]
+            if goal_id < next_id:
+                new_ids[goal_id] = next_id
+            goal_id = new_ids.get(goal_id, goal_id)
+            local_ids[goal_id] = event[1]
+            next_id = max(next_id, goal_id + 1)
+            existing.add(goal_id)
+            added_at[goal_id] = len(result)
+            result.append(("add", goal_id, *event[2:]))
+            continue
+        changed: list[Any] = list(event)
+        for position in EVENT_GOALS[kind]:
+            changed[position] = new_ids.get(event[position], event[position])
+        event = tuple(changed)
+        if kind in {"unlink", "remove_autolink", "unarchive"}:
+            # Nothing is broken when there's nothing to remove or to bring back
+            if kind == "unarchive":
+                existing.update(
+                    g
+                    for (g,) in connection.execute(
+                        "select goal_id from archive_goals where root=?", (event[1],)
+                    )
+                )
+            result.append(event)
+        elif kind == "delete":
+            if event[1] in existing:
+                existing.discard(event[1])
+                result.append(event)
+        elif kind == "link":
+            parent, child, edge_type = event[1:]
+            if missing(parent, child):
+                if child in added_at and edge_type == EdgeType.PARENT:
+                    # New goal can't be reached from the root goal without its parent
+                    result[added_at.pop(child)] = None
+                    existing.discard(child)
+                    dropped.add(child)
+                    errors.append(
+                        f"New goal {local_ids[child]} has been dropped: "
+                        "its parent has been deleted by another process"
+                    )
+                continue
+            for (old_type,) in connection.execute(
+                "select reltype from edges where parent=? and child=?", (parent, child)
+            ):
+                result.append(("unlink", parent, child, old_type))
+            result.append(event)
+        elif not missing(*(event[position] for position in EVENT_GOALS[kind])):
+            if kind == "add_autolink":
+                result.append(("remove_autolink", event[1]))
+            result.append(event)
+    stale: set[int] = {local_ids[g] for g in dropped} | new_ids.keys()
+    return [event for event in result if event is not None], errors, stale
+
+
+def compact_events(events: list[Event]) -> list[Event]:
+    """Fold a sequence of events into an equivalent one without redundant changes:
+    added goal gets its final name and state, linked and unlinked edge disappears,
+    only the last toggle_close is kept, and so on.
+    Resulting events are ordered by kind, so that archived goals are brought back
+    first (they could be changed later in the same batch), and deletions go next."""
+    added: dict[int, list[Any]] = {}
+    renamed: dict[int, str] = {}
+    closed: dict[int, bool] = {}
+    deleted: list[int] = []
+    unarchived: list[int] = []
+    gone: set[int] = set()
+    # True for a new edge, False for a removed one
+    edges: dict[tuple[int, int, int], bool] = {}
+    # Whether an old autolink must be removed, and a new keyword (if any)
+    autolinks: dict[int, tuple[bool, str | None]] = {}
+    for event in events:
+        kind: str = event[0]
+        if kind == "add":
+            added[event[1]] = [event[2], event[3]]
+        elif kind == "rename":
+            if event[2] in added:
+                added[event[2]][0] = event[1]
+            else:
+                renamed[event[2]] = event[1]
+        elif kind == "toggle_close":
+            if event[2] in added:
+                added[event[2]][1] = event[1]
+            else:
+                closed[event[2]] = event[1]
+        elif kind in ("link", "unlink"):
+            key = (event[1], event[2], event[3])
+            if key in edges:
+                # link + unlink (or vice versa) of the same edge changes nothing
+                edges.pop(key)
+            else:
+                edges[key] = kind == "link"
+        elif kind == "delete":
+            goal_id: int = event[1]
+            gone.add(goal_id)
+            renamed.pop(goal_id, None)
+            closed.pop(goal_id, None)
+            if added.pop(goal_id, None) is None:
+                deleted.append(goal_id)
+        elif kind == "remove_autolink":
+            if autolinks.get(event[1], (True, None))[0]:
+                autolinks[event[1]] = (True, None)
+            else:
+                # autolink has been added in the same batch
+                autolinks.pop(event[1])
+        elif kind == "add_autolink":
+            autolinks[event[1]] = (autolinks.get(event[1], (False, None))[0], event[2])
+        elif kind == "unarchive":
+            unarchived.append(event[1])
+    # Edges of deleted goals are removed together with goals
+    alive_edges: list[tuple[tuple[int, int, int], bool]] = [
+        (key, is_new)
+        for key, is_new in edges.items()
+        if key[0] not in gone and key[1] not in gone
+    ]
+    return (
+        [("unarchive", goal_id) for goal_id in unarchived]
+        + [("delete", goal_id) for goal_id in deleted]
+        + [("unlink", *key) for key, is_new in alive_edges if not is_new]
+        + [
+            ("add", goal_id, name, is_open)
+            for goal_id, (name, is_open) in added.items()
+        ]
+        + [("rename", name, goal_id) for goal_id, name in renamed.items()]
+        + [("toggle_close", is_open, goal_id) for goal_id, is_open in closed.items()]
+        + [("link", *key) for key, is_new in alive_edges if is_new]
+        + [
+            ("remove_autolink", goal_id)
+            for goal_id, (remove, _) in autolinks.items()
+            if remove
+        ]
+        + [
+            ("add_autolink", goal_id, keyword)
+            for goal_id, (_, keyword) in autolinks.items()
+            if keyword is not None
+        ]
+    )
+
+
+def load(
+    filename: str,
+    message_fn: Callable[[str], None] | None = None,
+    profile: str | None = None,
+    verify: bool = False,
+    snapshot: bool = False,
+    archive_after: float | None = None,
+    lazy: bool = False,
+) -> Enumeration:
+    """Load goal tree from the given file (or create a new one when file is missing).
+    Full verification is skipped for files that were saved by this version of the app,
+    unless it's explicitly requested.
+    When snapshot is enabled and there is a valid one, database is not read at all.
+    Journals (see siebenapp.journal) are replayed and never use snapshots.
+    With archive_after, subtrees closed more than given number of days ago
+    are archived first (see siebenapp.archive); snapshot is not used then.
+    With lazy, goals of the database are read on demand (see siebenapp.lazy),
+    so the database connection stays open while the goal tree is used."""
     autolink_data: AutoLinkData = []
-    if path.isfile(filename):
-        connection = sqlite3.connect(filename)
+    restored = (
+        read_snapshot(filename, message_fn)
+        if snapshot
+        and archive_after is None
+        and not lazy
+        and path.isfile(filename)
+        and not is_journal(filename)
+        else None
+    )
+    if restored is not None:
+        goals, autolink_data = restored
+    elif path.isfile(filename) and is_journal(filename):
+        state = read_journal(filename)
+        goals = Goals.build(
+            ((goal_id, *row) for goal_id, row in state.goals.items()),
+            state.edges,
+            message_fn,
+            verify=False,
+        )
+        autolink_data = list(state.autolink.items())
+    elif path.isfile(filename):
+        connection = connect(filename, profile)
         run_migrations(connection)
-        cur = connection.cursor()
-        names = list(cur.execute("select * from goals"))
-        edges = list(cur.execute("select parent, child, reltype from edges"))
-        autolink_data = list(cur.execute("select * from autolink"))
-        cur.close()
-        goals = Goals.build(names, edges, message_fn)
+        verify = verify or not is_verified(connection)
+        if archive_after is not None:
+            archive_subtrees(connection, archive_after)
+        # Revision is read first: goals could only be newer than it, but never older
+        revision: int = read_revision(connection)
+        goals = (
+            LazyGoals(connection, message_fn)
+            if lazy
+            else read_goals(connection, message_fn)
+        )
+        goals.revision = revision
+        autolink_data = list(connection.execute("select * from autolink"))
+        attach_archived(goals, connection, filename, profile)
+        if not lazy:
+            connection.close()
     else:
         goals = Goals("Rename me", message_fn)
+        verify = True
     result = Enumeration(all_layers(goals, autolink_data))
-    result.verify()
+    if verify:
+        result.verify()
     return result
 
 
+def read_goals(
+    connection: sqlite3.Connection, message_fn: Callable[[str], None] | None = None
+) -> Goals:
+    return Goals.build(
+        connection.execute("select goal_id, name, open from goals"),
+        connection.execute("select parent, child, reltype from edges"),
+        message_fn,
+        verify=False,
+    )
+
+
+def attach_archived(
+    goals: Goals, connection: sqlite3.Connection, filename: str, profile: str | None
+) -> None:
+    # Archive is attached even when it's empty: other writers may fill it later
+    (last_id,) = connection.execute("select max(goal_id) from archive_goals").fetchone()
+    goals.attach_archive(
+        dict(connection.execute("select * from archived")),
+        last_id or 0,
+        partial(load_archive, filename, profile),
+    )
+
+
+def load_archive(
+    filename: str, profile: str | None, root: int
+) -> tuple[GoalsData, EdgesData]:
+    with closing(connect(filename, profile)) as connection:
+        return read_archive(connection, root)
+
+
+# Name of the setting that marks files saved by this version of the app.
+# Its value is the schema version, so that any further migration resets it.
+VERIFIED = "verified"
+
+
+def mark_verified(connection: sqlite3.Connection) -> None:
+    """Note that the database contains data written by the app itself.
+    Such data is known to be correct, so it does not need full verification on load."""
+    connection.execute("delete from settings where name=?", (VERIFIED,))
+    connection.execute(
+        "insert into settings (name, goal) values (?, ?)",
+        (VERIFIED, len(MIGRATIONS) - 1),
+    )
+
+
+def is_verified(connection: sqlite3.Connection) -> bool:
+    row = connection.execute(
+        "select goal from settings where name=?", (VERIFIED,)
+    ).fetchone()
+    return row is not None and row[0] == len(MIGRATIONS) - 1
+
+
 def run_migrations(
     conn: sqlite3.Connection, migrations_to_run: list[list[str]] | None = None
 ) -> None:
@@ -0,0 +1,313 @@
+"""Containers of goal trees that could be frozen in O(1) (see Graph.freeze).
+
+A tracked container is a plain dict (or set) that remembers old values of changed
+keys in each frozen view taken from it. Views are not copies: they read the live
+container and look for old values of changed keys first. So a view is taken
+in O(1), each change costs O(1) per view, and reads of the live container are
+made by dict itself and are as fast as ever. Views that are gone cost nothing.
+
+Views could be read from another thread while the live container is changed
+by its own one: the old value is remembered before a key is changed, and a view
+reads the live value before looking for the old one, so it never sees a new value
+without the old one. This relies on single dict and set operations being atomic.
+"""
+
+from collections.abc import Iterable, Iterator, Mapping, MutableMapping, MutableSet
+from typing import Any, NoReturn, TypeVar
+from weakref import ref
+
+from siebenapp.domain import EdgeType
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+# Old "value" of keys that were missing before the change
+_MISSING: Any = object()
+
+# Views of a tracked container by their ids. A view is dropped as soon as it's gone
+# (in whatever thread that happens), so they are iterated over a copy
+Views = dict[int, ref]
+
+
+def _watch(views: Views, view: Any) -> None:
+    key: int = id(view)
+    views[key] = ref(view, lambda _: views.pop(key, None))
+
+
+def _alive(views: Views) -> Iterator[Any]:
+    for view_ref in list(views.values()):
+        if (view := view_ref()) is not None:
+            yield view
+
+
+class _TrackingDict(dict[K, V]):
+    """Dict that calls _changing(key) before every change of the key."""
+
+    __slots__ = ()
+
+    def _changing(self, key: K) -> None:
+        raise NotImplementedError
+
+    def __setitem__(self, key: K, value: V) -> None:
+        self._changing(key)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key: K) -> None:
+        self._changing(key)
+        super().__delitem__(key)
+
+    def pop(self, key: K, *default: Any) -> Any:  # type: ignore[override]
+        if key in self:
+            self._changing(key)
+        return super().pop(key, *default)
+
+    def popitem(self) -> tuple[K, V]:
+        if not self:
+            raise KeyError("popitem(): dictionary is empty")
+        key: K = next(reversed(self))
+        return key, self.pop(key)
+
+    def setdefault(self, key: K, default: Any = None) -> Any:
+        if key not in self:
+            self._changing(key)
+        return super().setdefault(key, default)
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __ior__(self, other: Any) -> Any:  # type: ignore[misc]
+        self.update(other)
+        return self
+
+    def clear(self) -> None:
+        for key in list(self):
+            self._changing(key)
+        super().clear()
+
+
+class TrackedDict(_TrackingDict[K, V]):
+    __slots__ = ("views",)
+
+    def __init__(self, *args: Any) -> None:
+        super().__init__(*args)
+        self.views: Views = {}
+
+    def _changing(self, key: K) -> None:
+        for view in _alive(self.views):
+            if key not in view.old:
+                view.old[key] = self._saved(key)
+
+    def _saved(self, key: K) -> Any:
+        return self.get(key, _MISSING)
+
+
+class _Edges(_TrackingDict[int, EdgeType]):
+    """Edges of a single goal. Its whole old copy is remembered by the adjacency
+    it belongs to, as goals have few edges."""
+
+    __slots__ = ("owner", "key")
+
+    def __init__(self, owner: "TrackedAdjacency", key: int, *args: Any) -> None:
+        super().__init__(*args)
+        self.owner = owner
+        self.key = key
+
+    def _changing(self, key: int) -> None:
+        self.owner._changing(self.key)
+
+    def __missing__(self, key: int) -> EdgeType:
+        # The same as defaultdict(_blocker) of Goals
+        self[key] = EdgeType.BLOCKER
+        return EdgeType.BLOCKER
+
+
+class TrackedAdjacency(TrackedDict[int, MutableMapping[int, EdgeType]]):
+    """Edges of all goals by goal id (the same as defaultdict(_edge_map) of Goals)."""
+
+    __slots__ = ()
+
+    def __init__(self, data: Iterable[tuple[int, MutableMapping[int, EdgeType]]]):
+        super().__init__()
+        for key, edges in data:
+            dict.__setitem__(self, key, _Edges(self, key, edges))
+
+    def __missing__(self, key: int) -> MutableMapping[int, EdgeType]:
+        edges = self[key] = _Edges(self, key)
+        return edges
+
+    def _saved(self, key: int) -> Any:
+        edges = self.get(key)
+        return _MISSING if edges is None else dict(edges)
+
+
+class TrackedSet(set[K]):
+    __slots__ = ("views",)
+
+    def __init__(self, *args: Any) -> None:
+        super().__init__(*args)
+        self.views: Views = {}
+
+    def _changing(self, keys: Iterable[K]) -> None:
+        for view in _alive(self.views):
+            for key in keys:
+                if key not in view.old:
+                    view.old[key] = key in self
+
+    def add(self, key: K) -> None:
+        self._changing([key])
+        super().add(key)
+
+    def discard(self, key: Any) -> None:
+        self._changing([key])
+        super().discard(key)
+
+    def remove(self, key: K) -> None:
+        self._changing([key])
+        super().remove(key)
+
+    def pop(self) -> K:
+        if not self:
+            raise KeyError("pop from an empty set")
+        key: K = next(iter(self))
+        self.remove(key)
+        return key
+
+    def clear(self) -> None:
+        self._changing(list(self))
+        super().clear()
+
+    def update(self, *others: Iterable[K]) -> None:
+        for other in others:
+            for key in other:
+                self.add(key)
+
+    def difference_update(self, *others: Iterable[Any]) -> None:
+        for other in others:
+            for key in other:
+                self.discard(key)
+
+    def intersection_update(self, *others: Iterable[Any]) -> None:
+        self.difference_update(set(self).difference(set(self).intersection(*others)))
+
+    def symmetric_difference_update(self, other: Iterable[K]) -> None:
+        for key in set(other):
+            if key in self:
+                self.discard(key)
+            else:
+                self.add(key)
+
+    def __ior__(self, other: Any) -> Any:  # type: ignore[misc]
+        self.update(other)
+        return self
+
+    def __isub__(self, other: Any) -> Any:  # type: ignore[misc]
+        self.difference_update(other)
+        return self
+
+    def __iand__(self, other: Any) -> Any:  # type: ignore[misc]
+        self.intersection_update(other)
+        return self
+
+    def __ixor__(self, other: Any) -> Any:  # type: ignore[misc]
+        self.symmetric_difference_update(other)
+        return self
+
+
+def _frozen_keys(live: Iterable[K], old: dict[K, Any], missing: Any) -> Iterator[K]:
+    # Live keys are listed before old values are copied: a key that's added since
+    # then is not listed, and one that's added before has its old value copied
+    keys: list[K] = list(live)
+    old = old.copy()
+    listed: set[K] = set(keys)
+    yield from (k for k in keys if old.get(k) is not missing)
+    yield from (k for k, v in old.items() if v is not missing and k not in listed)
+
+
+def _read_only(*args: Any) -> NoReturn:
+    raise TypeError("Frozen goals could not be changed")
+
+
+class FrozenMapping(MutableMapping[K, V]):
+    """Tracked dict as it was when the view was taken."""
+
+    def __init__(self, live: TrackedDict[K, V]) -> None:
+        self.live = live
+        # Old values of keys changed since then
+        self.old: dict[K, Any] = {}
+        _watch(live.views, self)
+
+    __setitem__ = __delitem__ = _read_only
+
+    def _value(self, key: Any) -> Any:
+        value: Any = self.live.get(key, _MISSING)
+        return self.old.get(key, value)
+
+    def __getitem__(self, key: K) -> V:
+        if (value := self._value(key)) is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: K, default: Any = None) -> Any:
+        value = self._value(key)
+        return default if value is _MISSING else value
+
+    def __contains__(self, key: object) -> bool:
+        return self._value(key) is not _MISSING
+
+    def __iter__(self) -> Iterator[K]:
+        return _frozen_keys(self.live, self.old, _MISSING)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class FrozenAdjacency(FrozenMapping[int, MutableMapping[int, EdgeType]]):
+    """Tracked adjacency as it was when the view was taken.
+    Edges of each goal are copied on read, and they are empty for unknown goals."""
+
+    def _value(self, key: Any) -> Any:
+        edges = self.live.get(key)
+        value: Any = _MISSING if edges is None else dict(edges)
+        return self.old.get(key, value)
+
+    def __getitem__(self, key: int) -> MutableMapping[int, EdgeType]:
+        return self.get(key, {})
+
+
+class FrozenSetView(MutableSet[K]):
+    """Tracked set as it was when the view was taken."""
+
+    def __init__(self, live: TrackedSet[K]) -> None:
+        self.live = live
+        # Whether keys changed since then were there
+        self.old: dict[Any, bool] = {}
+        _watch(live.views, self)
+
+    add = discard = _read_only
+
+    def __contains__(self, key: object) -> bool:
+        present: bool = key in self.live
+        return self.old.get(key, present)
+
+    def __iter__(self) -> Iterator[K]:
+        return _frozen_keys(self.live, self.old, False)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+def tracked_dict(data: MutableMapping[K, V]) -> TrackedDict[K, V]:
+    return data if isinstance(data, TrackedDict) else TrackedDict(data)
+
+
+def tracked_set(data: MutableSet[K]) -> TrackedSet[K]:
+    return data if isinstance(data, TrackedSet) else TrackedSet(data)
+
+
+def tracked_adjacency(
+    data: Mapping[int, MutableMapping[int, EdgeType]],
+) -> TrackedAdjacency:
+    return (
+        data if isinstance(data, TrackedAdjacency) else TrackedAdjacency(data.items())
+    )
@@ -1,15 +1,22 @@
+from collections.abc import Iterator
 from dataclasses import dataclass, replace
+from typing import Any
 
 from siebenapp.domain import (
     Graph,
     EdgeType,
     Command,
+    EVERYTHING,
+    QuerySpec,
     ToggleClose,
     Delete,
     GoalId,
     RenderResult,
     RenderRow,
+    Unarchive,
+    Sync,
     blocker,
+    selected_ids,
 )
 from siebenapp.goaltree import Goals
 
@@ -41,6 +48,8 @@ class ZoomView(Graph):
             self.events().append(("unzoom", last_zoom))
         elif target not in self.zoom_root:
             # try to zoom
+            if target in self.settings("archived"):
+                self.goaltree.accept(Unarchive(target))
             render_result = self.goaltree.q()
             visible_goals = self._build_visible_goals(render_result)
             if target in visible_goals:
@@ -49,10 +58,28 @@ class ZoomView(Graph):
             else:
                 self.error("Zooming outside of current zoom root is not allowed!")
 
-    def q(self) -> RenderResult:
-        render_result = self.goaltree.q()
+    def settings(self, key: str) -> Any:
+        if key == "zoom_root":
+            return self.zoom_root[-1]
+        return self.goaltree.settings(key)
+
+    def iter_rows(self, spec: QuerySpec = EVERYTHING) -> Iterator[RenderRow]:
+        if self.zoom_root == [Goals.ROOT_ID]:
+            return self.goaltree.iter_rows(spec)
+        # Zoomed subtrees are usually small, and their roots depend on all rows
+        return super().iter_rows(spec)
+
+    def q(self, spec: QuerySpec = EVERYTHING) -> RenderResult:
         if self.zoom_root == [Goals.ROOT_ID]:
-            return render_result
+            return self.goaltree.q(spec)
+        # Roots are built from all visible rows, so restrictions of callers
+        # can't be passed down; only the zoomed subtree is needed
+        render_result = self.goaltree.q(
+            EVERYTHING.narrow(
+                subtree=self.zoom_root[-1],
+                keep=selected_ids(self) | {Goals.ROOT_ID},
+            )
+        )
         origin_root: RenderRow = render_result.by_id(list(render_result.roots)[0])
         assert origin_root.goal_id == Goals.ROOT_ID
         visible_goals = (
@@ -118,6 +145,18 @@ class ZoomView(Graph):
             last_zoom = self.zoom_root.pop(-1)
             self.events().append(("unzoom", last_zoom))
 
+    def accept_Sync(self, command: Sync) -> None:
+        self.goaltree.accept(command)
+        while not self.goaltree.has_goal(self.zoom_root[-1]):
+            last_zoom = self.zoom_root.pop(-1)
+            self.events().append(("unzoom", last_zoom))
+
+    def freeze(self) -> Graph:
+        frozen = super().freeze()
+        assert isinstance(frozen, ZoomView)
+        frozen.zoom_root = list(self.zoom_root)
+        return frozen
+
     def _build_visible_goals(self, render_result: RenderResult) -> set[GoalId]:
         current_zoom_root = self.zoom_root[-1]
         if current_zoom_root == Goals.ROOT_ID:
@@ -0,0 +1,12 @@
+import pytest
+
+from siebenapp.domain import QuerySpec
+
+
+@pytest.fixture(params=[True, False], ids=["push-down", "full-query"])
+def push_down(request):
+    """Run view tests both with and without passing query specs down the layers:
+    results must be the same."""
+    QuerySpec.push_down = request.param
+    yield request.param
+    QuerySpec.push_down = True
@@ -42,3 +42,18 @@ def build_goaltree(*goal_prototypes, message_fn=None) -> Goals:
         edges,
         message_fn,
     )
+
+
+def diamond_ladder(rungs: int) -> Goals:
+    """Build a chain of "diamonds": every step splits into two goals which are joined
+    again at the next step. Right-side goals get the highest ids, so they are
+    visited after their join point in a naive traversal."""
+    right_start = 2 * rungs + 2
+    prototypes = []
+    for i in range(rungs):
+        top, left, bottom, right = 2 * i + 1, 2 * i + 2, 2 * i + 3, right_start + i
+        prototypes.append(open_(top, f"Top {i}", [left, right]))
+        prototypes.append(open_(left, f"Left {i}", [bottom]))
+        prototypes.append(open_(right, f"Right {i}", blockers=[bottom]))
+    prototypes.append(open_(2 * rungs + 1, "Bottom"))
+    return build_goaltree(*prototypes)
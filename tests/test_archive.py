@@ -0,0 +1,201 @@
+import sqlite3
+from contextlib import closing
+from tempfile import NamedTemporaryFile
+
+from siebenapp.archive import archive_subtrees, find_archivable
+from siebenapp.domain import Add, Delete, EdgeType, Rename, ToggleLink
+from siebenapp.goaltree import Goals
+from siebenapp.layers import all_layers, get_root
+from siebenapp.manage import main
+from siebenapp.open_view import ToggleOpenView
+from siebenapp.progress_view import ToggleProgress
+from siebenapp.session import GoalsHolder
+from siebenapp.system import connect, load, run_migrations, save
+from siebenapp.zoom_view import ToggleZoom
+from tests.dsl import build_goaltree, open_, clos_
+from tests.test_cli import DummyIO
+
+
+def sample_file() -> str:
+    g = build_goaltree(
+        open_(1, "Root", [2, 5, 8]),
+        clos_(2, "Done", [3, 4]),
+        clos_(3, "Done 3"),
+        clos_(4, "Done 4"),
+        clos_(5, "Done, but blocks", [6]),
+        clos_(6, "Done 6"),
+        open_(8, "In progress", [9], blockers=[6]),
+        clos_(9, "Done 9", [10]),
+        clos_(10, "Done 10"),
+    )
+    file_name = NamedTemporaryFile().name
+    save(all_layers(g), file_name)
+    return file_name
+
+
+def archive(file_name: str, older_than: float = 0, roots=None) -> list[int]:
+    with closing(connect(file_name)) as connection:
+        run_migrations(connection)
+        return archive_subtrees(connection, older_than, roots)
+
+
+def names(file_name: str, table: str = "goals") -> list[str]:
+    with closing(sqlite3.connect(file_name)) as connection:
+        return [
+            n
+            for (n,) in connection.execute(f"select name from {table}")
+            if n is not None
+        ]
+
+
+def test_only_closed_subtrees_without_outer_links_are_archived() -> None:
+    file_name = sample_file()
+    assert sorted(archive(file_name)) == [2, 9]
+    assert sorted(names(file_name)) == [
+        "Done",
+        "Done 6",
+        "Done 9",
+        "Done, but blocks",
+        "In progress",
+        "Root",
+    ]
+    assert sorted(names(file_name, "archive_goals")) == ["Done 10", "Done 3", "Done 4"]
+
+
+def test_placeholder_shows_the_number_of_archived_goals() -> None:
+    file_name = sample_file()
+    archive(file_name)
+    goals = load(file_name, verify=True)
+    goals.accept(ToggleOpenView())
+    assert "Archived" not in goals.q().by_id(1).attrs
+    root = get_root(load(file_name, verify=True), Goals)
+    assert root.q().by_id(9).attrs == {"Archived": "1"}
+    assert root.q().by_id(2).attrs == {"Archived": "2"}
+
+
+def test_progress_is_not_changed_by_archive() -> None:
+    file_name = sample_file()
+    before = load(file_name)
+    before.accept(ToggleProgress())
+    archive(file_name)
+    after = load(file_name)
+    after.accept(ToggleProgress())
+    assert after.q().by_id(1).attrs == before.q().by_id(1).attrs
+    assert after.q().by_id(1).attrs["Progress"] == "77% (7/9)"
+
+
+def test_show_closed_goals_brings_archived_ones_back() -> None:
+    file_name = sample_file()
+    expected = load(file_name)
+    expected.accept(ToggleOpenView())
+    archive(file_name)
+    holder = GoalsHolder(load(file_name), file_name)
+    holder.accept(ToggleOpenView())
+    assert holder.goals.q() == expected.q()
+    holder.accept(Rename("Renamed", 3))
+    holder.close()
+    assert not names(file_name, "archive_goals")
+    assert "Renamed" in names(file_name)
+    load(file_name, verify=True)
+
+
+def test_zoom_into_placeholder_brings_its_goals_back() -> None:
+    file_name = sample_file()
+    archive(file_name)
+    goals = load(file_name)
+    goals.accept(ToggleZoom(9))
+    assert list(goals.events())[-2:] == [("unarchive", 9), ("zoom", 2, 9)]
+    assert goals.settings("archived") == {2: 2}
+    assert get_root(goals, Goals).q().by_id(9).edges == [(10, EdgeType.PARENT)]
+
+
+def test_new_goals_do_not_reuse_archived_ids() -> None:
+    file_name = sample_file()
+    archive(file_name)
+    holder = GoalsHolder(load(file_name), file_name)
+    holder.accept(Add("New", 8))
+    holder.close()
+    with closing(sqlite3.connect(file_name)) as connection:
+        assert connection.execute(
+            "select goal_id from goals where name='New'"
+        ).fetchone() == (11,)
+    goals = load(file_name, verify=True)
+    goals.accept(ToggleOpenView())
+    assert len(goals.q().rows) == 10
+
+
+def test_deleted_placeholder_takes_archived_goals_away() -> None:
+    file_name = sample_file()
+    archive(file_name)
+    holder = GoalsHolder(load(file_name), file_name)
+    holder.accept(Delete(2))
+    holder.close()
+    assert names(file_name, "archive_goals") == ["Done 10"]
+    goals = load(file_name, verify=True)
+    goals.accept(ToggleOpenView())
+    assert "Done 3" not in {row.name for row in goals.q().rows}
+
+
+def test_nested_archives_are_merged() -> None:
+    g = build_goaltree(
+        open_(1, "Root", [2]),
+        clos_(2, "Top", [3]),
+        clos_(3, "Middle", [4]),
+        clos_(4, "Bottom"),
+    )
+    file_name = NamedTemporaryFile().name
+    save(all_layers(g), file_name)
+    assert archive(file_name, roots=[3]) == [3]
+    assert archive(file_name) == [2]
+    goals = load(file_name, verify=True)
+    assert goals.settings("archived") == {2: 2}
+    goals.accept(ToggleOpenView())
+    assert sorted(row.name for row in goals.q().rows) == [
+        "Bottom",
+        "Middle",
+        "Root",
+        "Top",
+    ]
+
+
+def test_autolinked_goals_are_not_archived() -> None:
+    file_name = sample_file()
+    with closing(sqlite3.connect(file_name)) as connection:
+        connection.execute("insert into autolink values (4, 'keyword')")
+        connection.commit()
+    assert sorted(archive(file_name)) == [9]
+
+
+def test_recently_closed_goals_are_not_archived() -> None:
+    file_name = sample_file()
+    assert not archive(file_name, older_than=1)
+    with closing(sqlite3.connect(file_name)) as connection:
+        connection.execute("update closed_at set at = at - 2 where goal_id <> 10")
+        connection.commit()
+    assert archive(file_name, older_than=1) == [2]
+
+
+def test_archive_policy_is_applied_on_load() -> None:
+    file_name = sample_file()
+    goals = load(file_name, archive_after=0)
+    assert sorted(goals.settings("archived")) == [2, 9]
+    assert sorted(names(file_name, "archive_goals")) == ["Done 10", "Done 3", "Done 4"]
+
+
+def test_subtrees_linked_from_outside_are_not_archived() -> None:
+    file_name = sample_file()
+    goals = load(file_name)
+    goals.accept(ToggleLink(8, 10, EdgeType.BLOCKER))
+    save(goals, file_name)
+    with closing(connect(file_name)) as connection:
+        assert 9 not in find_archivable(connection)
+
+
+def test_archive_command() -> None:
+    file_name = sample_file()
+    io = DummyIO()
+    main(["archive", file_name, "2", "5"], io)
+    assert io.log == ["Goal 5 can't be archived", "Archived subtrees: 1"]
+    io = DummyIO()
+    main(["archive", file_name, "--older-than", "1"], io)
+    assert io.log == ["Archived subtrees: 0"]
@@ -9,14 +9,23 @@ from siebenapp.system import load
 
 
 class DummyIO(IO):
-    def __init__(self, commands: list[str] | None = None, log: list[str] | None = None):
+    def __init__(
+        self,
+        commands: list[str] | None = None,
+        log: list[str] | None = None,
+        lines: int = 25,
+    ):
         super().__init__()
         self.commands = [] if commands is None else commands
         self.log: list[str] = [] if log is None else log
+        self.lines = lines
 
     def write(self, text: str, *args) -> None:
         self.log.append(" ".join([text, *args]))
 
+    def height(self) -> int:
+        return self.lines
+
     def read(self) -> str:
         if self.commands:
             command = self.commands.pop(0)
@@ -93,3 +102,24 @@ def test_complex_scenario() -> None:
     goals = load(db_name, update_message)
     loop(io, goals, db_name)
     verify_file(io)
+
+
+def test_paged_scenario() -> None:
+    commands = [
+        *(f"a Subgoal {i}" for i in range(1, 8)),
+        "]",
+        # select "Subgoal 6" on the 2nd page
+        "7",
+        "r Renamed on the page",
+        # there are no more goals
+        "]",
+        "[",
+        "c",
+        "]",
+        "q",
+    ]
+    io = DummyIO(commands, lines=8)
+    db_name = ":memory:"
+    goals = load(db_name, update_message)
+    loop(io, goals, db_name)
+    verify_file(io)
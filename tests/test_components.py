@@ -0,0 +1,127 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from siebenapp import components
+from siebenapp.components import split_components, merge_components
+from siebenapp.domain import EdgeType, RenderResult, RenderRow
+from siebenapp.layers import all_layers
+from siebenapp.open_view import ToggleOpenView
+from siebenapp.render import Renderer
+from siebenapp.render_next import full_render
+from siebenapp.switchable_view import ToggleSwitchableView
+from tests.dsl import build_goaltree, open_, clos_
+
+
+def _row(goal_id, *edges):
+    return RenderRow(
+        goal_id,
+        goal_id,
+        str(goal_id),
+        True,
+        True,
+        True,
+        [(e, EdgeType.PARENT) for e in edges],
+    )
+
+
+def test_single_component_is_returned_as_is():
+    rr = RenderResult([_row(1, 2), _row(2)], roots={1})
+    assert split_components(rr) == [rr]
+
+
+def test_split_into_components_ignores_edge_direction():
+    rr = RenderResult(
+        [_row(1, 3), _row(2, 3), _row(3), _row(4), _row(5, 6), _row(6)],
+        roots={1, 2, 4, 5},
+        global_opts={"select": 1},
+    )
+    result = split_components(rr)
+    assert [[r.goal_id for r in c.rows] for c in result] == [[1, 2, 3], [4], [5, 6]]
+    assert [c.roots for c in result] == [{1, 2}, {4}, {5}]
+    assert all(c.global_opts == {"select": 1} for c in result)
+
+
+def test_merge_packs_components_into_shelves():
+    rr = RenderResult([_row(1), _row(2), _row(3)], roots={1, 2, 3})
+    laid_out = [
+        RenderResult([_row(1)], node_opts={1: {"row": 0, "col": 0}}),
+        RenderResult([_row(2)], node_opts={2: {"row": 0, "col": 0}}),
+        RenderResult([_row(3)], node_opts={3: {"row": 0, "col": 0}}),
+    ]
+    result = merge_components(rr, laid_out, 2)
+    assert result.node_opts == {
+        1: {"row": 0, "col": 0},
+        2: {"row": 0, "col": 1},
+        3: {"row": 1, "col": 0},
+    }
+
+
+def test_merge_gives_unique_ids_to_fake_nodes():
+    rr = RenderResult([_row(1), _row(2)], roots={1, 2})
+    laid_out = [
+        RenderResult(
+            [_row(g)],
+            node_opts={
+                g: {"row": 1, "col": 0, "edge_render": [(-10, EdgeType.PARENT)]},
+                -10: {"row": 0, "col": 0, "edge_render": []},
+            },
+            edge_opts={-10: (g, 1, 2)},
+        )
+        for g in [1, 2]
+    ]
+    result = merge_components(rr, laid_out, 4, -10)
+    assert result.node_opts[1]["edge_render"] == [(-10, EdgeType.PARENT)]
+    assert result.node_opts[2]["edge_render"] == [(-11, EdgeType.PARENT)]
+    assert result.edge_opts == {-10: (1, 1, 2), -11: (2, 1, 2)}
+    assert result.node_opts[-11] == {"row": 0, "col": 1, "edge_render": []}
+
+
+@pytest.fixture
+def two_trees():
+    goals = all_layers(
+        build_goaltree(
+            open_(1, "Root", [2, 3]),
+            open_(2, "A", [4], blockers=[3]),
+            open_(3, "B"),
+            open_(4, "C", [5]),
+            clos_(5, "D"),
+        )
+    )
+    goals.accept_all(ToggleOpenView(), ToggleSwitchableView())
+    return goals
+
+
+@pytest.mark.parametrize(
+    "render", [lambda g: Renderer(g, 2).build(), lambda g: full_render(g, 2)]
+)
+def test_all_rows_are_placed_without_overlaps(two_trees, render):
+    result = render(two_trees)
+    positions = [(o["row"], o["col"]) for o in result.node_opts.values()]
+    assert len(positions) == len(set(positions))
+    assert {r.goal_id for r in result.rows}.issubset(result.node_opts.keys())
+
+
+def test_parallel_layout_gives_the_same_result(two_trees, monkeypatch):
+    sequential = Renderer(two_trees, 2).build()
+    monkeypatch.setattr(components, "PARALLEL_FROM", 1)
+    monkeypatch.setattr(components.os, "cpu_count", lambda: 2)
+    parallel = Renderer(two_trees, 2).build()
+    assert parallel == sequential
+    assert min(o["row"] for o in parallel.node_opts.values()) == 0
+
+
+def test_parallel_layout_is_made_by_spawned_workers_from_any_thread(
+    two_trees, monkeypatch
+):
+    sequential = Renderer(two_trees, 2).build()
+    monkeypatch.setattr(components, "PARALLEL_FROM", 1)
+    monkeypatch.setattr(components.os, "cpu_count", lambda: 2)
+    components.shutdown_executor()
+    with ThreadPoolExecutor(max_workers=1) as thread:
+        parallel = thread.submit(Renderer(two_trees, 2).build).result()
+    assert parallel == sequential
+    executor = components._get_executor()
+    assert executor._mp_context.get_start_method() == "spawn"
+    components.shutdown_executor()
+    assert components._executor is None
@@ -0,0 +1,235 @@
+import asyncio
+import os
+import socket
+import stat
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import Event, Thread
+from time import sleep
+from unittest.mock import patch
+
+import pytest
+
+from siebenapp.autolink import AutoLink
+from siebenapp.daemon import (
+    SOCKET_ENV,
+    Daemon,
+    DaemonError,
+    request,
+    socket_path,
+    subscribe,
+)
+from siebenapp.domain import Add
+from siebenapp.layers import get_root
+from siebenapp.manage import HANDLERS, main
+from siebenapp.session import GoalsHolder
+from siebenapp.system import load, save
+from tests.test_cli import DummyIO
+
+
+@pytest.fixture
+def daemon(tmp_path: Path) -> Iterator[tuple[Daemon, str]]:
+    address = str(tmp_path / "daemon.sock")
+    daemon = Daemon(HANDLERS)
+    loop = asyncio.new_event_loop()
+    thread = Thread(target=loop.run_forever)
+    thread.start()
+    server = asyncio.run_coroutine_threadsafe(daemon.start(address), loop).result()
+    yield daemon, address
+    loop.call_soon_threadsafe(server.close)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+    daemon.close()
+    Path(address).unlink(missing_ok=True)
+
+
+@pytest.fixture
+def goals_file() -> str:
+    file_name = NamedTemporaryFile().name
+    main(["--direct", "exec", file_name, "a Alpha", "a Beta", "2", "c"], DummyIO())
+    return file_name
+
+
+def run(*argv: str) -> str:
+    io = DummyIO()
+    main(list(argv), io)
+    return str(io)
+
+
+def test_daemon_gives_the_same_output_as_direct_load(daemon, goals_file) -> None:
+    _, address = daemon
+    for args in [["md"], ["md", "-n"], ["dot", "-p"], ["exec"]]:
+        command, *flags = args
+        rest = [goals_file] if command != "exec" else [goals_file, "3"]
+        expected = run("--direct", command, *flags, *rest)
+        assert run("--socket", address, command, *flags, *rest) == expected
+
+
+def test_daemon_keeps_files_loaded(daemon, goals_file) -> None:
+    instance, address = daemon
+    run("--socket", address, "md", goals_file)
+    hot = instance.files[os.path.abspath(goals_file)]
+    run("--socket", address, "md", "-t", goals_file)
+    assert instance.files[os.path.abspath(goals_file)] is hot
+
+
+def test_changes_made_by_daemon_are_saved(daemon, goals_file) -> None:
+    _, address = daemon
+    run("--socket", address, "md", goals_file)
+    run("--socket", address, "exec", goals_file, "a Gamma")
+    output = run("--direct", "md", goals_file)
+    assert "Gamma" in output and "Beta" in output
+    assert run("--socket", address, "md", goals_file) == output
+
+
+def test_file_changed_by_another_process_is_loaded_again(daemon, goals_file) -> None:
+    _, address = daemon
+    run("--socket", address, "md", goals_file)
+    goals = load(goals_file)
+    goals.accept(Add("Changed outside", 1))
+    save(goals, goals_file)
+    assert "Changed outside" in run("--socket", address, "md", goals_file)
+
+
+def test_showing_archived_goals_does_not_change_the_file(daemon) -> None:
+    instance, address = daemon
+    file_name = NamedTemporaryFile().name
+    commands = ["a Done", "2", "a Also done", "3", "c", "2", "c"]
+    main(["--direct", "exec", file_name, *commands], DummyIO())
+    assert run("archive", file_name) == "Archived subtrees: 1"
+    shown = run("--direct", "md", "-n", file_name)
+    assert "Also done" in shown
+    assert run("--socket", address, "md", "-n", file_name) == shown
+    assert os.path.abspath(file_name) not in instance.files
+    assert run("--socket", address, "md", "-n", file_name) == shown
+    assert run("archive", file_name) == "Archived subtrees: 0"
+
+
+def test_concurrent_changes_are_not_lost(daemon, goals_file) -> None:
+    _, address = daemon
+    with ThreadPoolExecutor(8) as pool:
+        list(
+            pool.map(
+                lambda i: run("--socket", address, "exec", goals_file, f"a Goal {i}"),
+                range(40),
+            )
+        )
+    output = run("--direct", "md", goals_file)
+    assert all(f"Goal {i}\n" in output + "\n" for i in range(40))
+
+
+def test_errors_are_sent_to_client(daemon, goals_file) -> None:
+    _, address = daemon
+    with pytest.raises(DaemonError, match="must be absolute"):
+        request(address, {"command": "md", "db": "relative.db"})
+
+
+@pytest.fixture
+def wedged_daemon(tmp_path: Path) -> Iterator[str]:
+    """Socket that accepts connections, but never responds."""
+    address = str(tmp_path / "daemon.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(address)
+        server.listen()
+        with patch("siebenapp.daemon.REQUEST_TIMEOUT", 0.1):
+            yield address
+
+
+def test_direct_mode_is_used_when_daemon_does_not_respond(
+    wedged_daemon, goals_file
+) -> None:
+    assert run("--socket", wedged_daemon, "md", goals_file) == run(
+        "--direct", "md", goals_file
+    )
+
+
+def test_changes_are_not_repeated_when_daemon_does_not_respond(
+    wedged_daemon, goals_file
+) -> None:
+    expected = run("--direct", "md", goals_file)
+    with pytest.raises(DaemonError, match="doesn't respond"):
+        run("--socket", wedged_daemon, "exec", goals_file, "a Gamma")
+    assert run("--direct", "md", goals_file) == expected
+
+
+def test_direct_mode_is_used_without_daemon(goals_file) -> None:
+    missing = NamedTemporaryFile().name
+    assert run("--socket", missing, "md", goals_file) == run(
+        "--direct", "md", goals_file
+    )
+
+
+def test_only_one_daemon_could_run_on_the_socket(daemon) -> None:
+    _, address = daemon
+    with pytest.raises(AssertionError, match="already running"):
+        asyncio.run(Daemon(HANDLERS).start(address))
+
+
+def test_socket_of_killed_daemon_is_replaced() -> None:
+    address = NamedTemporaryFile().name
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+        stale.bind(address)
+    assert request(address, {}) is None
+
+    async def start() -> None:
+        (await Daemon(HANDLERS).start(address)).close()
+
+    asyncio.run(start())
+    Path(address).unlink(missing_ok=True)
+
+
+def test_changes_are_shared_with_other_processes(daemon, goals_file) -> None:
+    instance, address = daemon
+    received = Event()
+    publisher = GoalsHolder(load(goals_file), goals_file, share=address)
+    subscriber = GoalsHolder(
+        load(goals_file), goals_file, share=address, notify=received.set
+    )
+    while len(instance.subscribers.get(os.path.abspath(goals_file), {})) < 2:
+        sleep(0.01)
+    publisher.accept(Add("Shared", 1))
+    assert received.wait(5)
+    assert subscriber.receive()
+    assert not publisher.receive()
+    assert (
+        get_root(subscriber.goals, AutoLink).q()
+        == get_root(publisher.goals, AutoLink).q()
+    )
+    publisher.close()
+    subscriber.close()
+
+
+def test_changes_are_not_shared_without_daemon(goals_file) -> None:
+    goals_holder = GoalsHolder(
+        load(goals_file), goals_file, share=NamedTemporaryFile().name
+    )
+    assert goals_holder.subscription is None
+    goals_holder.accept(Add("Not shared", 1))
+    goals_holder.close()
+
+
+def test_default_socket_is_created_in_a_private_directory(
+    tmp_path: Path, monkeypatch
+) -> None:
+    monkeypatch.delenv(SOCKET_ENV, raising=False)
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    address = socket_path()
+
+    async def start() -> None:
+        (await Daemon(HANDLERS).start(address)).close()
+
+    asyncio.run(start())
+    assert stat.S_IMODE(os.stat(os.path.dirname(address)).st_mode) == 0o700
+    assert not os.stat(address).st_mode & (stat.S_IRWXG | stat.S_IRWXO)
+
+
+def test_socket_of_another_user_is_not_used(daemon, goals_file) -> None:
+    _, address = daemon
+    with patch("siebenapp.daemon.os.getuid", return_value=os.getuid() + 1):
+        assert request(address, {"command": "md", "db": goals_file}) is None
+        assert subscribe(address, goals_file, "origin", print) is None
+        with pytest.raises(AssertionError, match="another user"):
+            asyncio.run(Daemon(HANDLERS).start(address))
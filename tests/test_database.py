@@ -1,21 +1,51 @@
+import multiprocessing
+import random
 import sqlite3
+import subprocess
+import sys
 from contextlib import closing
 from tempfile import NamedTemporaryFile
+from time import sleep
+from unittest.mock import patch
 
 import pytest
 
 from siebenapp.domain import (
+    RenderRow,
+    Sync,
     ToggleClose,
     ToggleLink,
     Add,
     EdgeType,
+    Rename,
+    Delete,
 )
+from siebenapp.autolink import AutoLink, ToggleAutoLink
 from siebenapp.enumeration import Enumeration
 from siebenapp.goaltree import Goals
-from siebenapp.layers import all_layers
+from siebenapp.layers import all_layers, get_root
 from siebenapp.open_view import ToggleOpenView
-from siebenapp.selectable_view import HoldSelect
-from siebenapp.system import MIGRATIONS, run_migrations, load, save
+from siebenapp.selectable_view import HoldSelect, Select
+from siebenapp.session import GoalsHolder
+from siebenapp.system import (
+    MIGRATIONS,
+    run_migrations,
+    load,
+    save,
+    Storage,
+    WriteBehind,
+    SYNC,
+    ASYNC,
+    ASYNC_FLUSH_ON_QUIT,
+    UPDATE_ACTIONS,
+    FAST,
+    PROFILE_ENV,
+    compact_events,
+    connect,
+    save_connection,
+    write_events,
+)
+from siebenapp.zoom_view import ToggleZoom
 
 
 def test_initial_migration_on_empty_db() -> None:
@@ -43,7 +73,21 @@ def test_last_known_migration() -> None:
             run_migrations(conn)
             cur.execute("select version from migrations")
             version = cur.fetchone()[0]
-            assert version == 11
+            assert version == 14
+
+
+@pytest.mark.parametrize(
+    "query",
+    [q for queries in UPDATE_ACTIONS.values() for q in queries if "where" in q],
+)
+def test_update_queries_do_not_scan_tables(query: str) -> None:
+    with closing(sqlite3.connect(":memory:")) as conn:
+        run_migrations(conn)
+        plan = list(
+            conn.execute(f"explain query plan {query}", (1,) * query.count("?"))
+        )
+        assert plan
+        assert not [row for row in plan if row[-1].startswith("SCAN")], plan
 
 
 def setup_sample_db(conn):
@@ -146,6 +190,564 @@ def test_multiple_saves_works_fine() -> None:
     assert goals.q() == new_goals.q()
 
 
+def test_storage_keeps_single_connection_between_saves() -> None:
+    file_name = NamedTemporaryFile().name
+    goals = all_layers(Goals("Root"))
+    storage = Storage(file_name)
+    storage.save(goals)
+    connection = storage.connection
+    with patch("siebenapp.system.run_migrations") as migrations:
+        for i in range(5):
+            goals.accept(Add(f"Next {i}", 1))
+            storage.save(goals)
+        migrations.assert_not_called()
+    assert storage.connection is connection
+    storage.close()
+    assert storage.connection is None
+    assert goals.q() == load(file_name).q()
+
+
+def test_storage_runs_migrations_once_on_existing_db() -> None:
+    file_name = NamedTemporaryFile().name
+    goals = all_layers(Goals("Root"))
+    save(goals, file_name)
+    storage = Storage(file_name)
+    with patch("siebenapp.system.run_migrations") as migrations:
+        for i in range(3):
+            goals.accept(Add(f"Next {i}", 1))
+            storage.save(goals)
+        migrations.assert_called_once()
+    storage.close()
+    assert goals.q() == load(file_name).q()
+
+
+def test_storage_could_be_reopened_after_close() -> None:
+    file_name = NamedTemporaryFile().name
+    goals = all_layers(Goals("Root"))
+    storage = Storage(file_name)
+    storage.save(goals)
+    storage.close()
+    goals.accept(Add("After close", 1))
+    storage.save(goals)
+    storage.close()
+    storage.close()
+    assert goals.q() == load(file_name).q()
+
+
+def test_storage_reads_database_changed_by_another_connection() -> None:
+    file_name = NamedTemporaryFile().name
+    goals = all_layers(Goals("Root"))
+    save(goals, file_name)
+    storage = Storage(file_name)
+    assert storage.read_changes() is None
+    goals.accept(Add("Own", 1))
+    storage.save(goals)
+    assert storage.read_changes() is None
+    other = load(file_name)
+    other.accept_all(Add("Other", 1), Delete(2))
+    save(other, file_name)
+    changes = storage.read_changes()
+    assert changes == Sync(
+        (
+            RenderRow(1, 1, "Root", True, False, True, [(3, EdgeType.PARENT)]),
+            RenderRow(3, 3, "Other", True, False, True, []),
+        ),
+        (2,),
+    )
+    assert storage.read_changes() is None
+    storage.close()
+
+
+def test_async_storage_does_not_look_for_changes() -> None:
+    file_name = NamedTemporaryFile().name
+    save(all_layers(Goals("Root")), file_name)
+    storage = Storage(file_name, ASYNC)
+    assert storage.read_changes() is None
+    other = load(file_name)
+    other.accept(Add("Other", 1))
+    save(other, file_name)
+    assert storage.read_changes() is None
+    assert storage.connection is None
+
+
+def outdated_storages(file_name: str, messages: list[str]) -> tuple:
+    """Two goal trees of the same file, each one with a storage of its own."""
+    first, second = load(file_name), load(file_name, messages.append)
+    first_storage, second_storage = Storage(file_name), Storage(file_name)
+    first_storage.watch(get_root(first, Goals).revision)
+    second_storage.watch(get_root(second, Goals).revision)
+    return first, first_storage, second, second_storage
+
+
+def names_of(goals) -> list[str]:
+    rows = Goals.export(get_root(goals, Goals))[0]
+    return [name for _, name, _ in rows if name is not None]
+
+
+def test_new_goals_of_outdated_tree_get_free_ids() -> None:
+    file_name = NamedTemporaryFile().name
+    save(all_layers(Goals("Root")), file_name)
+    messages: list[str] = []
+    first, first_storage, second, second_storage = outdated_storages(
+        file_name, messages
+    )
+    first.accept_all(Add("First", 1), ToggleAutoLink("first", 2))
+    assert not first_storage.save(first)
+    second.accept_all(Add("Second", 1), Add("Nested", 2), ToggleAutoLink("second", 2))
+    assert second_storage.save(second)
+    assert not messages
+    assert names_of(load(file_name, verify=True)) == [
+        "Root",
+        "First",
+        "Second",
+        "Nested",
+    ]
+    changes = second_storage.read_changes()
+    assert changes is not None
+    second.accept(changes)
+    assert get_root(second, AutoLink).q() == get_root(load(file_name), AutoLink).q()
+    assert get_root(second, AutoLink).back_kw == {2: "first", 3: "second"}
+    first_storage.close()
+    second_storage.close()
+
+
+def test_changes_of_goals_deleted_by_another_writer_are_reported() -> None:
+    file_name = NamedTemporaryFile().name
+    goals = all_layers(Goals("Root"))
+    goals.accept(Add("Doomed", 1))
+    save(goals, file_name)
+    messages: list[str] = []
+    first, first_storage, second, second_storage = outdated_storages(
+        file_name, messages
+    )
+    first.accept(Delete(2))
+    first_storage.save(first)
+    second.accept_all(Rename("Renamed", 2), Add("Orphan", 2), Add("Kept", 1))
+    second_storage.save(second)
+    assert messages == [
+        "Goal 2 has been deleted by another process",
+        "New goal 3 has been dropped: its parent has been deleted by another process",
+    ]
+    assert names_of(load(file_name, verify=True)) == ["Root", "Kept"]
+    first_storage.close()
+    second_storage.close()
+
+
+def test_new_goals_dropped_by_rebase_are_removed_from_goal_tree() -> None:
+    file_name = NamedTemporaryFile().name
+    goals = all_layers(Goals("Root"))
+    goals.accept(Add("Doomed", 1))
+    save(goals, file_name)
+    messages: list[str] = []
+    first = GoalsHolder(load(file_name), file_name)
+    second = GoalsHolder(load(file_name, messages.append), file_name)
+    first.accept(Add("Other", 1))
+    first.accept(Delete(2))
+    second.goals.accept_all(Add("Orphan", 2), Add("Nested", 3), Add("Kept", 1))
+    second.storage.save(second.goals)
+    assert messages == [
+        "Goal 2 has been deleted by another process",
+        "New goal 3 has been dropped: its parent has been deleted by another process",
+        "New goal 4 has been dropped: its parent has been deleted by another process",
+    ]
+    assert second.reload()
+    second.goals.verify()
+    assert names_of(second.goals) == ["Root", "Other", "Kept"]
+    assert get_root(second.goals, Goals).q() == get_root(load(file_name), Goals).q()
+    first.close()
+    second.close()
+
+
+def test_changes_that_break_goal_tree_are_discarded() -> None:
+    file_name = NamedTemporaryFile().name
+    goals = all_layers(Goals("Root"))
+    goals.accept(Add("Parent", 1))
+    save(goals, file_name)
+    messages: list[str] = []
+    first, first_storage, second, second_storage = outdated_storages(
+        file_name, messages
+    )
+    first.accept(Add("Open subgoal", 2))
+    first_storage.save(first)
+    second.accept_all(ToggleClose(2), Add("Lost", 1))
+    second_storage.save(second)
+    assert messages == ["Changes conflict with ones saved by another process"]
+    assert get_root(load(file_name, verify=True), Goals).q() == (
+        get_root(first, Goals).q()
+    )
+    changes = second_storage.read_changes()
+    assert changes is not None
+    second.accept(changes)
+    assert get_root(second, Goals).q() == get_root(first, Goals).q()
+    first_storage.close()
+    second_storage.close()
+
+
+def test_view_only_commands_do_not_touch_storage() -> None:
+    file_name = NamedTemporaryFile().name
+    goals = all_layers(Goals("Root"))
+    goals.accept(Add("Next", 1))
+    save(goals, file_name)
+    storage = Storage(file_name)
+    goals.accept_all(Select(2), HoldSelect(), ToggleZoom(2), ToggleOpenView())
+    assert goals.events()
+    with patch("siebenapp.system.sqlite3.connect") as connect:
+        storage.save(goals)
+        connect.assert_not_called()
+    assert not goals.events()
+    assert storage.connection is None
+
+
+def test_view_only_commands_of_holder_only_check_data_version() -> None:
+    file_name = NamedTemporaryFile().name
+    goals = all_layers(Goals("Root"))
+    goals.accept(Add("Next", 1))
+    save(goals, file_name)
+    goals_holder = GoalsHolder(load(file_name), file_name)
+    assert not goals_holder.reload()
+    storage = goals_holder.storage
+    assert isinstance(storage, Storage) and storage.connection is not None
+    statements: list[str] = []
+    storage.connection.set_trace_callback(statements.append)
+    for command in [Select(2), HoldSelect(), ToggleZoom(2), ToggleOpenView()]:
+        goals_holder.accept(command)
+        assert not goals_holder.reload()
+    assert set(statements) == {"pragma data_version"}
+    assert len(statements) == 8
+    goals_holder.close()
+
+
+def test_changes_are_checked_once_per_command() -> None:
+    file_name = NamedTemporaryFile().name
+    save(all_layers(Goals("Root")), file_name)
+    goals_holder = GoalsHolder(load(file_name), file_name)
+    other = GoalsHolder(load(file_name), file_name)
+    with patch.object(goals_holder, "reload", wraps=goals_holder.reload) as reload:
+        goals_holder.accept(Add("Own", 1))
+        other.accept(Add("Other", 1))
+        goals_holder.accept(Rename("Renamed", 2))
+        assert reload.call_count == 2
+    assert names_of(goals_holder.goals) == ["Root", "Renamed", "Other"]
+    goals_holder.close()
+    other.close()
+
+
+def test_changes_of_others_are_found_by_data_version() -> None:
+    file_name = NamedTemporaryFile().name
+    save(all_layers(Goals("Root")), file_name)
+    goals_holder = GoalsHolder(load(file_name), file_name)
+    goals_holder.accept(Add("Own", 1))
+    assert not goals_holder.reload()
+    other = GoalsHolder(load(file_name), file_name)
+    other.accept(Add("Other", 1))
+    other.close()
+    assert goals_holder.reload()
+    assert names_of(goals_holder.goals) == ["Root", "Own", "Other"]
+    goals_holder.close()
+
+
+def test_persistent_events_are_saved_among_view_ones() -> None:
+    file_name = NamedTemporaryFile().name
+    goals = all_layers(Goals("Root"))
+    save(goals, file_name)
+    goals.accept_all(Add("Next", 1), Select(2), ToggleZoom(2), Rename("Renamed", 2))
+    storage = Storage(file_name)
+    storage.save(goals)
+    storage.close()
+    assert not goals.events()
+    with closing(sqlite3.connect(file_name)) as conn:
+        assert list(conn.execute("select name from goals where goal_id=2")) == [
+            ("Renamed",)
+        ]
+
+
+def test_async_storage_writes_everything_before_file_switch() -> None:
+    file_name = NamedTemporaryFile().name
+    goals = Enumeration(all_layers(Goals("Root")))
+    save(goals, file_name)
+    storage = Storage(file_name, ASYNC)
+    for i in range(100):
+        goals.accept(Add(f"Goal {i}", 1))
+        storage.save(goals)
+    storage.close()
+    assert goals.q() == load(file_name).q()
+
+
+def test_async_storage_coalesces_commits() -> None:
+    file_name = NamedTemporaryFile().name
+    goals = all_layers(Goals("Root"))
+    save(goals, file_name)
+    writer = WriteBehind(file_name, interval=10)
+    writer.put([("add", 2, "First", True)])
+    while writer.commits < 1:
+        sleep(0.01)
+    for i in range(3, 20):
+        writer.put([("add", i, "Next", True)])
+    writer.close(wait=True)
+    # First event is written at once, others are waiting for the flush interval
+    assert writer.commits == 2
+    with closing(sqlite3.connect(file_name)) as conn:
+        assert list(conn.execute("select count(*) from goals")) == [(19,)]
+
+
+def test_async_storage_reports_write_errors() -> None:
+    file_name = NamedTemporaryFile().name
+    goals = all_layers(Goals("Root"))
+    save(goals, file_name)
+    storage = Storage(file_name, ASYNC_FLUSH_ON_QUIT)
+    # Goal with the same id could not be added twice
+    goals.events().append(("add", 1, "Duplicate", True))
+    storage.save(goals)
+    with pytest.raises(sqlite3.IntegrityError):
+        storage.close(quitting=True)
+
+
+def test_failed_writer_does_not_block_with_full_queue() -> None:
+    writer = WriteBehind("/nonexistent/dir/file.db", interval=0.01, queue_size=1)
+    writer.thread.join()
+    writer.queue.put_nowait([("add", 2, "Never written", True)])
+    writer.close(wait=False)
+    with pytest.raises(sqlite3.OperationalError):
+        writer.put([("add", 3, "Never written", True)])
+    with pytest.raises(sqlite3.OperationalError):
+        writer.close(wait=True)
+
+
+def test_failed_save_does_not_keep_database_locked() -> None:
+    file_name = NamedTemporaryFile().name
+    goals = all_layers(Goals("Root"))
+    save(goals, file_name)
+    storage = Storage(file_name)
+    goals.accept(Add("Lost", 1))
+    with patch("siebenapp.system.write_events", side_effect=sqlite3.DataError):
+        with pytest.raises(sqlite3.DataError):
+            storage.save(goals)
+    assert storage.connection is not None
+    assert not storage.connection.in_transaction
+    other = Storage(file_name)
+    goals.accept(Add("Saved", 1))
+    other.save(goals)
+    other.close()
+    storage.close()
+
+
+def test_compact_add_rename_and_close_into_single_insert() -> None:
+    events = [
+        ("add", 2, "New", True),
+        ("link", 1, 2, EdgeType.PARENT),
+        ("rename", "Renamed", 2),
+        ("toggle_close", False, 2),
+    ]
+    assert compact_events(events) == [
+        ("add", 2, "Renamed", False),
+        ("link", 1, 2, EdgeType.PARENT),
+    ]
+
+
+def test_compact_link_and_unlink_into_nothing() -> None:
+    events = [
+        ("link", 2, 3, EdgeType.BLOCKER),
+        ("unlink", 2, 3, EdgeType.BLOCKER),
+        ("unlink", 1, 3, EdgeType.PARENT),
+        ("link", 1, 3, EdgeType.PARENT),
+    ]
+    assert compact_events(events) == []
+
+
+def test_compact_repeated_toggle_close_into_last_state() -> None:
+    events = [
+        ("toggle_close", False, 2),
+        ("toggle_close", True, 2),
+        ("toggle_close", False, 2),
+    ]
+    assert compact_events(events) == [("toggle_close", False, 2)]
+
+
+def test_compact_drops_everything_about_new_deleted_goals() -> None:
+    events = [
+        ("add", 3, "Temporary", True),
+        ("link", 2, 3, EdgeType.PARENT),
+        ("add_autolink", 3, "tmp"),
+        ("remove_autolink", 3),
+        ("delete", 3),
+        ("rename", "Old", 2),
+        ("delete", 2),
+    ]
+    assert compact_events(events) == [("delete", 2)]
+
+
+def naive_replay(events: list[tuple], connection: sqlite3.Connection) -> None:
+    for event in events:
+        for query in UPDATE_ACTIONS[event[0]]:
+            connection.execute(query, event[1:])
+    connection.commit()
+
+
+def dump(connection: sqlite3.Connection) -> list[list[tuple]]:
+    return [
+        sorted(connection.execute(f"select * from {table}"))
+        for table in ["goals", "edges", "autolink"]
+    ]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_compacted_events_give_the_same_database_as_naive_replay(seed: int) -> None:
+    rnd = random.Random(seed)
+    goals = all_layers(Goals("Root"))
+    for i in range(10):
+        goals.accept(Add(f"Goal {i}", rnd.randint(1, i + 1)))
+    with (
+        closing(sqlite3.connect(":memory:")) as batched,
+        closing(sqlite3.connect(":memory:")) as naive,
+    ):
+        save_connection(goals, batched)
+        save_connection(goals, naive)
+        for _ in range(200):
+            ids = [row.goal_id for row in goals.q().rows if row.goal_id > 0]
+            a, b = rnd.choice(ids), rnd.choice(ids)
+            goals.accept(
+                rnd.choice(
+                    [
+                        Add(f"New {a}", a),
+                        Rename(f"Renamed {a}", a),
+                        ToggleClose(a),
+                        ToggleLink(a, b, rnd.choice(list(EdgeType))),
+                        ToggleAutoLink(rnd.choice("abc"), a),
+                        Delete(a),
+                    ]
+                )
+            )
+        events = list(goals.events())
+        goals.events().clear()
+        write_events(events, batched)
+        naive_replay([e for e in events if e[0] in UPDATE_ACTIONS], naive)
+        assert dump(batched) == dump(naive)
+
+
+def journal_mode(file_name: str, profile: str | None = None) -> str:
+    with closing(connect(file_name, profile)) as conn:
+        return conn.execute("pragma journal_mode").fetchone()[0]
+
+
+def test_safe_storage_profile_is_used_by_default() -> None:
+    file_name = NamedTemporaryFile().name
+    save(all_layers(Goals("Root")), file_name)
+    assert journal_mode(file_name) == "delete"
+
+
+def test_fast_storage_profile_enables_wal() -> None:
+    file_name = NamedTemporaryFile().name
+    goals = all_layers(Goals("Root"))
+    save(goals, file_name, FAST)
+    assert journal_mode(file_name, FAST) == "wal"
+    with closing(connect(file_name, FAST)) as conn:
+        assert conn.execute("pragma synchronous").fetchone()[0] == 1  # NORMAL
+    assert goals.q() == load(file_name, profile=FAST).q()
+
+
+def test_storage_profile_is_taken_from_environment() -> None:
+    file_name = NamedTemporaryFile().name
+    with patch.dict("os.environ", {PROFILE_ENV: FAST}):
+        save(all_layers(Goals("Root")), file_name)
+    assert journal_mode(file_name) == "wal"
+
+
+def test_unknown_storage_profile_is_rejected() -> None:
+    with pytest.raises(AssertionError):
+        connect(":memory:", "reckless")
+
+
+def test_verification_is_skipped_for_files_saved_by_the_app() -> None:
+    file_name = NamedTemporaryFile().name
+    goals = all_layers(Goals("Root"))
+    goals.accept(Add("Next", 1))
+    save(goals, file_name)
+    with patch.object(Goals, "verify") as verify:
+        load(file_name)
+        verify.assert_not_called()
+        load(file_name, verify=True)
+        verify.assert_called()
+
+
+def test_verification_is_not_skipped_after_migrations() -> None:
+    file_name = NamedTemporaryFile().name
+    save(all_layers(Goals("Root")), file_name)
+    with closing(sqlite3.connect(file_name)) as conn:
+        conn.execute("update settings set goal=goal-1 where name='verified'")
+        conn.commit()
+    with patch.object(Goals, "verify") as verify:
+        load(file_name)
+        verify.assert_called()
+
+
+def test_broken_data_is_found_with_explicit_verification() -> None:
+    file_name = NamedTemporaryFile().name
+    goals = all_layers(Goals("Root"))
+    goals.accept_all(Add("A", 1), Add("B", 2))
+    save(goals, file_name)
+    with closing(sqlite3.connect(file_name)) as conn:
+        conn.execute("delete from edges where child=2")
+        conn.commit()
+    load(file_name)
+    with pytest.raises(AssertionError):
+        load(file_name, verify=True)
+
+
+def test_build_from_cursors_gives_the_same_goals() -> None:
+    file_name = NamedTemporaryFile().name
+    goals = all_layers(Goals("Root"))
+    goals.accept_all(Add("A", 1), Add("B", 1), Add("C", 2), Delete(3), ToggleClose(4))
+    save(goals, file_name)
+    with closing(sqlite3.connect(file_name)) as conn:
+        from_lists = Goals.build(
+            list(conn.execute("select * from goals")),
+            list(conn.execute("select parent, child, reltype from edges")),
+        )
+        from_cursors = Goals.build(
+            conn.execute("select * from goals"),
+            conn.execute("select parent, child, reltype from edges"),
+            verify=False,
+        )
+    assert from_cursors.q() == from_lists.q()
+    assert from_cursors.goals == from_lists.goals
+    assert from_cursors.closed == from_lists.closed
+
+
+CRASH_SCRIPT = """
+import sys
+from siebenapp.domain import Add
+from siebenapp.system import load, Storage
+goals = load(sys.argv[1])
+storage = Storage(sys.argv[1], sys.argv[2])
+for i in range(10000):
+    goals.accept(Add(f"Goal {i}", 1))
+    storage.save(goals)
+    print(i, flush=True)
+"""
+
+
+def test_no_acknowledged_event_is_lost_on_crash_in_sync_mode() -> None:
+    file_name = NamedTemporaryFile().name
+    save(all_layers(Goals("Root")), file_name)
+    process = subprocess.Popen(
+        [sys.executable, "-c", CRASH_SCRIPT, file_name, SYNC],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    assert process.stdout is not None
+    acknowledged: int = -1
+    for line in process.stdout:
+        acknowledged = int(line)
+        if acknowledged >= 50:
+            break
+    process.kill()
+    process.wait()
+    assert acknowledged >= 50
+    with closing(sqlite3.connect(file_name)) as conn:
+        names = {name for (name,) in conn.execute("select name from goals")}
+    assert {f"Goal {i}" for i in range(acknowledged + 1)} <= names
+
+
 def test_do_not_load_from_broken_data() -> None:
     file_name = NamedTemporaryFile().name
     with sqlite3.connect(file_name) as conn:
@@ -155,3 +757,100 @@ def test_do_not_load_from_broken_data() -> None:
             cur.execute("delete from goals where goal_id = 2")
     with pytest.raises(AssertionError):
         load(file_name)
+
+
+def add_goals(
+    file_name: str, writer: int, count: int, durability: str = SYNC, lazy: bool = False
+) -> str | None:
+    goals_holder = GoalsHolder(
+        load(file_name, lazy=lazy), file_name, durability=durability
+    )
+    try:
+        for i in range(count):
+            goals_holder.accept(Add(f"Writer {writer} goal {i}", 1))
+        goals_holder.close()
+    except RuntimeError as e:
+        return str(e)
+    return None
+
+
+def test_no_update_is_lost_with_concurrent_writers() -> None:
+    file_name = NamedTemporaryFile().name
+    save(all_layers(Goals("Root")), file_name)
+    with multiprocessing.Pool(4) as pool:
+        errors = pool.starmap(
+            add_goals, [(file_name, writer, 25) for writer in range(4)]
+        )
+    assert errors == [None] * 4
+    names = names_of(load(file_name, verify=True))
+    assert sorted(names[1:]) == sorted(
+        f"Writer {w} goal {i}" for w in range(4) for i in range(25)
+    )
+
+
+def test_no_update_is_lost_with_concurrent_lazy_writers() -> None:
+    file_name = NamedTemporaryFile().name
+    save(all_layers(Goals("Root")), file_name)
+    with multiprocessing.Pool(4) as pool:
+        errors = pool.starmap(
+            add_goals,
+            [(file_name, writer, 25, SYNC, writer % 2 == 0) for writer in range(4)],
+        )
+    assert errors == [None] * 4
+    names = names_of(load(file_name, verify=True))
+    assert sorted(names[1:]) == sorted(
+        f"Writer {w} goal {i}" for w in range(4) for i in range(25)
+    )
+
+
+def test_changes_of_lazy_tree_are_rebased() -> None:
+    file_name = NamedTemporaryFile().name
+    goals = all_layers(Goals("Root"))
+    goals.accept(Add("Shared", 1))
+    save(goals, file_name)
+    lazy = GoalsHolder(load(file_name, lazy=True), file_name)
+    eager = GoalsHolder(load(file_name), file_name)
+    assert lazy.goals.q().rows  # rows are cached before they're changed by others
+    eager.accept(Add("Other", 1))
+    eager.accept(Rename("Renamed by other", 2))
+    lazy.goals.accept(Add("Lazy", 1))
+    assert lazy.storage.save(lazy.goals)
+    lazy.reload()
+    lazy.goals.verify()
+    assert names_of(load(file_name, verify=True)) == [
+        "Root",
+        "Renamed by other",
+        "Other",
+        "Lazy",
+    ]
+    assert get_root(lazy.goals, AutoLink).q() == get_root(load(file_name), AutoLink).q()
+    lazy.close()
+    eager.close()
+
+
+def test_concurrent_async_writers_stop_instead_of_breaking_database() -> None:
+    file_name = NamedTemporaryFile().name
+    save(all_layers(Goals("Root")), file_name)
+    with multiprocessing.Pool(4) as pool:
+        errors = pool.starmap(
+            add_goals, [(file_name, writer, 25, ASYNC) for writer in range(4)]
+        )
+    conflict = f"{file_name} has been changed by another process"
+    assert all(error is None or error.startswith(conflict) for error in errors)
+    names = names_of(load(file_name, verify=True))
+    for writer, error in enumerate(errors):
+        if error is None:
+            assert {f"Writer {writer} goal {i}" for i in range(25)} <= set(names)
+
+
+def test_async_writer_does_not_overwrite_changes_of_others() -> None:
+    file_name = NamedTemporaryFile().name
+    save(all_layers(Goals("Root")), file_name)
+    first = GoalsHolder(load(file_name), file_name, durability=ASYNC)
+    second = GoalsHolder(load(file_name), file_name)
+    second.accept(Add("Second", 1))
+    first.accept(Add("First", 1))
+    with pytest.raises(RuntimeError, match="use sync durability"):
+        first.close()
+    second.close()
+    assert names_of(load(file_name, verify=True)) == ["Root", "Second"]
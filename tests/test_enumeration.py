@@ -1,13 +1,19 @@
+from collections.abc import Iterator
+
 import pytest
 
 from siebenapp.domain import (
     Add,
+    EVERYTHING,
+    EdgeType,
+    QuerySpec,
     child,
     blocker,
     RenderRow,
     RenderResult,
 )
 from siebenapp.enumeration import Enumeration, BidirectionalIndex
+from siebenapp.goaltree import Goals
 from siebenapp.layers import all_layers
 from siebenapp.selectable_view import (
     SelectableView,
@@ -349,3 +355,33 @@ def test_all_keys_in_enumeration_must_be_of_the_same_length() -> None:
     mapped = [e.forward(x) for x in items]
     assert len(mapped) == len(items)
     assert {len(str(k)) for k in mapped} == {4}
+
+
+def test_first_rows_are_numbered_before_all_rows_are_built(monkeypatch) -> None:
+    size = 3000
+    goals = all_layers(
+        Goals.build(
+            [(goal_id, f"Goal {goal_id}", True) for goal_id in range(1, size + 1)],
+            [
+                *(((g - 2) // 5 + 1, g, EdgeType.PARENT) for g in range(2, size + 1)),
+                (2, size, EdgeType.BLOCKER),
+            ],
+        )
+    )
+    e = Enumeration(goals)
+    expected: list[RenderRow] = e.q().rows
+    built: list[RenderRow] = []
+    iter_rows = goals.iter_rows
+
+    def counted(spec: QuerySpec = EVERYTHING) -> Iterator[RenderRow]:
+        for row in iter_rows(spec):
+            built.append(row)
+            yield row
+
+    monkeypatch.setattr(goals, "iter_rows", counted)
+    rows = e.iter_rows()
+    assert next(rows) == expected[0]
+    # Numbers are known after 900 goals
+    assert len(built) == 901
+    # The 2nd goal waits for its blocker, which is the last one
+    assert list(rows) == expected[1:]
@@ -1,3 +1,5 @@
+import pytest
+
 from _pytest.fixtures import fixture
 
 from siebenapp.domain import child, blocker, RenderRow, RenderResult
@@ -12,6 +14,8 @@ from siebenapp.selectable_view import (
 from tests.dsl import build_goaltree, open_
 from siebenapp.zoom_view import ZoomView, ToggleZoom
 
+pytestmark = pytest.mark.usefixtures("push_down")
+
 
 @fixture
 def goaltree():
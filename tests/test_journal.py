@@ -0,0 +1,224 @@
+import random
+import sqlite3
+from contextlib import closing
+from os import path
+from tempfile import NamedTemporaryFile
+
+import pytest
+
+from siebenapp.autolink import ToggleAutoLink
+from siebenapp.domain import Add, Delete, EdgeType, Rename, ToggleClose, ToggleLink
+from siebenapp.enumeration import Enumeration
+from siebenapp.goaltree import Goals
+from siebenapp.journal import (
+    FIELDS,
+    Compaction,
+    HEADER,
+    Journal,
+    JournalState,
+    decode_events,
+    encode_events,
+    read_journal,
+)
+from siebenapp.layers import all_layers
+from siebenapp.session import GoalsHolder
+from siebenapp.system import (
+    UPDATE_ACTIONS,
+    JournalStorage,
+    Storage,
+    compact_events,
+    load,
+    open_storage,
+    save,
+    save_connection,
+    write_events,
+)
+
+
+def journal_name() -> str:
+    return NamedTemporaryFile(suffix=".journal").name
+
+
+def test_journal_knows_all_persistent_events() -> None:
+    assert set(FIELDS) == set(UPDATE_ACTIONS)
+
+
+def test_events_are_encoded_without_loss() -> None:
+    events = [
+        ("add", 1, "Ünicode", True),
+        ("add", 2, None, False),
+        ("rename", "", 1),
+        ("toggle_close", False, 1),
+        ("link", 1, 2, int(EdgeType.PARENT)),
+        ("unlink", 1, 2, int(EdgeType.BLOCKER)),
+        ("delete", 2),
+        ("add_autolink", 1, "keyword"),
+        ("remove_autolink", 1),
+    ]
+    assert decode_events(encode_events(events)) == events
+
+
+def test_storage_is_chosen_by_file_extension() -> None:
+    assert isinstance(open_storage("goals.journal"), JournalStorage)
+    assert isinstance(open_storage("goals.db"), Storage)
+
+
+def test_save_and_load_journal() -> None:
+    file_name = journal_name()
+    goals = all_layers(Goals("Root"))
+    goals.accept_all(
+        Add("Child", 1),
+        Add("Deleted", 1),
+        Add("Ünicode", 2),
+        ToggleLink(3, 4, EdgeType.BLOCKER),
+        ToggleAutoLink("kw", 4),
+        Delete(3),
+        ToggleClose(4),
+    )
+    save(goals, file_name)
+    assert load(file_name).q() == load(file_name, verify=True).q()
+    holder = GoalsHolder(load(file_name), file_name)
+    holder.accept(Rename("Renamed", 2), Add("New", 1))
+    holder.close()
+    assert load(file_name).q() == holder.goals.q()
+    assert [row.name for row in holder.goals.q().rows] == ["Root", "Renamed", "New"]
+
+
+def test_each_save_appends_a_single_record() -> None:
+    file_name = journal_name()
+    goals = all_layers(Goals("Root"))
+    storage = JournalStorage(file_name)
+    storage.save(goals)
+    size = path.getsize(file_name)
+    goals.accept_all(Add("A", 1), Add("B", 1), Rename("C", 3))
+    storage.save(goals)
+    storage.close()
+    with open(file_name, "rb") as f:
+        f.seek(size)
+        record = f.read()
+    # Events of the batch are compacted, too
+    assert decode_events(record[8:]) == [
+        ("add", 2, "A", True),
+        ("add", 3, "C", True),
+        ("link", 1, 2, EdgeType.PARENT),
+        ("link", 1, 3, EdgeType.PARENT),
+    ]
+
+
+def test_torn_record_is_ignored_and_overwritten() -> None:
+    file_name = journal_name()
+    goals = all_layers(Goals("Root"))
+    save(goals, file_name)
+    with open(file_name, "ab") as f:
+        f.write(b"\x10\x00\x00\x00garbage")
+    assert load(file_name).q() == goals.q()
+    storage = JournalStorage(file_name)
+    goals.accept(Add("After crash", 1))
+    storage.save(goals)
+    storage.close()
+    assert load(file_name).q() == goals.q()
+
+
+def test_not_a_journal_is_rejected() -> None:
+    file_name = journal_name()
+    with open(file_name, "wb") as f:
+        f.write(b"SQLite format 3\0")
+    with pytest.raises(ValueError):
+        load(file_name)
+
+
+def test_compaction_keeps_records_appended_meanwhile() -> None:
+    file_name = journal_name()
+    goals = all_layers(Goals("Root"))
+    save(goals, file_name)
+    journal = Journal(file_name, compact_from=1000)
+    for i in range(200):
+        goals.accept(Rename(f"Root {i}", 1))
+        journal.append(compact_events(list(goals.events())))
+        goals.events().clear()
+        if journal.compaction is not None and i % 10 == 0:
+            # wait for the background thread sometimes, so that it's applied
+            journal.compaction.thread.join()
+    journal.close()
+    assert path.getsize(file_name) < 1000 * 2
+    assert not path.exists(f"{file_name}.compact")
+    assert load(file_name).q() == goals.q()
+
+
+def test_compacted_journal_has_a_single_record() -> None:
+    file_name = journal_name()
+    goals = Enumeration(all_layers(Goals("Root")))
+    save(goals, file_name)
+    journal = Journal(file_name)
+    for i in range(10):
+        goals.accept(Add(f"Goal {i}", 1))
+        journal.append(compact_events(list(goals.events())))
+        goals.events().clear()
+    journal.compaction = Compaction(file_name, journal.size)
+    journal.close()
+    journal = Journal(file_name)
+    assert journal.size == HEADER.size + journal.base_size
+    journal.close()
+    assert load(file_name).q() == goals.q()
+
+
+def dump(connection: sqlite3.Connection) -> list[list[tuple]]:
+    return [
+        sorted(connection.execute(f"select * from {table}"))
+        for table in ["goals", "edges", "autolink"]
+    ]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_replay_gives_the_same_tables_as_database(seed: int) -> None:
+    rnd = random.Random(seed)
+    goals = all_layers(Goals("Root"))
+    state = JournalState()
+    with closing(sqlite3.connect(":memory:")) as connection:
+        save_connection(goals, connection)
+        state.apply([("add", 1, "Root", True)])
+        for _ in range(50):
+            for _ in range(rnd.randint(1, 5)):
+                ids = [row.goal_id for row in goals.q().rows if row.goal_id > 0]
+                a, b = rnd.choice(ids), rnd.choice(ids)
+                goals.accept(
+                    rnd.choice(
+                        [
+                            Add(f"New {a}", a),
+                            Rename(f"Renamed {a}", a),
+                            ToggleClose(a),
+                            ToggleLink(a, b, rnd.choice(list(EdgeType))),
+                            ToggleAutoLink(rnd.choice("abc"), a),
+                            Delete(a),
+                        ]
+                    )
+                )
+            events = [e for e in goals.events() if e[0] in UPDATE_ACTIONS]
+            goals.events().clear()
+            write_events(events, connection)
+            state.apply(compact_events(events))
+        assert dump(connection) == [
+            sorted((goal_id, *row) for goal_id, row in state.goals.items()),
+            sorted(state.edges),
+            sorted(state.autolink.items()),
+        ]
+
+
+def test_journal_survives_reload_with_reused_ids() -> None:
+    file_name = journal_name()
+    goals = all_layers(Goals("Root"))
+    goals.accept_all(Add("Child", 1), Add("Grandchild", 2))
+    save(goals, file_name)
+    goals = load(file_name)
+    goals.accept(Delete(3))
+    save(goals, file_name)
+    # Goal 3 was the last one, so its id is reused after reload
+    goals = load(file_name)
+    goals.accept_all(Add("Another", 1), ToggleLink(2, 3, EdgeType.BLOCKER))
+    save(goals, file_name)
+    assert read_journal(file_name).edges == {
+        (1, 2, EdgeType.PARENT): None,
+        (1, 3, EdgeType.PARENT): None,
+        (2, 3, EdgeType.BLOCKER): None,
+    }
+    assert load(file_name).q() == goals.q()
@@ -0,0 +1,161 @@
+import random
+from tempfile import NamedTemporaryFile
+
+import pytest
+
+from siebenapp.autolink import ToggleAutoLink
+from siebenapp.domain import (
+    Add,
+    Delete,
+    EdgeType,
+    Graph,
+    Insert,
+    QuerySpec,
+    Rename,
+    ToggleClose,
+    ToggleLink,
+)
+from siebenapp.enumeration import Enumeration
+from siebenapp.goaltree import Goals
+from siebenapp.layers import all_layers, get_root
+from siebenapp.lazy import LRU, LazyGoals
+from siebenapp.open_view import ToggleOpenView
+from siebenapp.system import Storage, connect, load, save
+from tests.test_archive import sample_file
+
+
+def saved_tree(seed: int, steps: int = 100) -> str:
+    goals = all_layers(Goals("Root"))
+    file_name = NamedTemporaryFile().name
+    run_random_commands(random.Random(seed), [goals], steps)
+    save(goals, file_name)
+    return file_name
+
+
+def run_random_commands(rnd: random.Random, trees: list[Graph], steps: int) -> None:
+    for _ in range(steps):
+        ids = [row.goal_id for row in trees[0].q().rows]
+        a, b = rnd.choice(ids), rnd.choice(ids)
+        command = rnd.choice(
+            [
+                Add(f"New {a}", a),
+                Add(f"New {a}", a),
+                Insert(f"Between {a} and {b}", a, b),
+                Rename(f"Renamed {a}", a),
+                ToggleClose(a),
+                ToggleLink(a, b, rnd.choice(list(EdgeType))),
+                ToggleAutoLink(rnd.choice("abc"), a),
+                Delete(a),
+            ]
+        )
+        for tree in trees:
+            tree.accept(command)
+
+
+def test_lru_drops_least_recently_used_items() -> None:
+    cache: LRU[str] = LRU(2)
+    assert cache.get_or_load(1, str) == "1"
+    cache.get_or_load(2, str)
+    cache.get_or_load(1, lambda _: "not loaded again")
+    cache.get_or_load(3, str)
+    assert dict(cache) == {1: "1", 3: "3"}
+
+
+def test_lazy_load_gives_the_same_tree() -> None:
+    file_name = saved_tree(0)
+    lazy = load(file_name, lazy=True)
+    assert isinstance(get_root(lazy, Goals), LazyGoals)
+    assert lazy.q() == load(file_name).q()
+    lazy.verify()
+
+
+@pytest.mark.parametrize("cache_size", [1, 3, 1000])
+@pytest.mark.parametrize("seed", range(5))
+def test_lazy_goals_accept_commands_like_goals(seed: int, cache_size: int) -> None:
+    file_name = saved_tree(seed)
+    connection = connect(file_name)
+    autolink_data = list(connection.execute("select * from autolink"))
+    goals = all_layers(get_root(load(file_name), Goals), autolink_data)
+    lazy = all_layers(LazyGoals(connection, cache_size=cache_size), autolink_data)
+    rnd = random.Random(seed)
+    for _ in range(10):
+        run_random_commands(rnd, [goals, lazy], 10)
+        assert lazy.q() == goals.q()
+        assert list(lazy.events()) == list(goals.events())
+        # Changes are kept in memory, while the database is updated by another connection
+        save(lazy, file_name)
+        goals.events().clear()
+    lazy.verify()
+    assert load(file_name).q().rows == Enumeration(goals).q().rows
+
+
+def test_changed_edges_are_never_evicted() -> None:
+    file_name = saved_tree(1)
+    lazy = LazyGoals(connect(file_name), cache_size=1)
+    lazy.accept(Add("Pinned", 1))
+    new_id = len(lazy.goals)
+    for goal_id in range(1, new_id):
+        lazy.has_goal(goal_id)
+        lazy.parent(goal_id)
+    assert new_id in lazy.edges_forward[1]
+    assert lazy.parent(new_id) == 1
+    assert not lazy.is_closed(new_id)
+
+
+def test_saved_changes_are_not_pinned_anymore() -> None:
+    file_name = saved_tree(1)
+    lazy = LazyGoals(connect(file_name), cache_size=1)
+    goals = all_layers(lazy)
+    goals.accept_all(Add("New", 1), Rename("Renamed", 1), ToggleLink(1, 2))
+    assert lazy.rows.names and lazy.forward.pinned and lazy.backward.pinned
+    expected = goals.q()
+    storage = Storage(file_name)
+    storage.save(goals)
+    assert not lazy.rows.names and not lazy.rows.states
+    assert not lazy.forward.pinned and not lazy.backward.pinned
+    assert goals.q() == expected
+    goals.accept(Rename("Renamed again", 1))
+    storage.save(goals)
+    assert not lazy.rows.names
+    assert Enumeration(goals).q() == load(file_name).q()
+    storage.close()
+
+
+def test_archived_goals_are_loaded_back_into_lazy_goals() -> None:
+    file_name = sample_file()
+    expected = load(file_name)
+    expected.accept(ToggleOpenView())
+    lazy = load(file_name, archive_after=0, lazy=True)
+    assert get_root(lazy, Goals).archived
+    lazy.accept(ToggleOpenView())
+    assert lazy.q().rows == expected.q().rows
+
+
+def test_lazy_goals_build_only_needed_rows_like_goals() -> None:
+    file_name = saved_tree(2)
+    goals = get_root(load(file_name), Goals)
+    lazy = LazyGoals(connect(file_name))
+    specs: list[QuerySpec] = [
+        QuerySpec(open_only=True, keep=frozenset([2])),
+        QuerySpec(pattern="renamed"),
+        *(QuerySpec(subtree=row.goal_id) for row in goals.q().rows),
+    ]
+    for spec in specs:
+        assert lazy.q(spec) == goals.q(spec)
+        assert list(lazy.iter_rows(spec)) == goals.q(spec).rows
+
+
+@pytest.mark.parametrize("closed_count,closed_rows", [(1, 1), (5, 0)])
+def test_open_rows_are_narrowed_only_when_many_goals_are_closed(
+    closed_count: int, closed_rows: int
+) -> None:
+    goals = all_layers(Goals("Root"))
+    for i in range(9):
+        goals.accept(Add(f"Goal {i}", 1))
+    goals.accept_all(*(ToggleClose(goal_id) for goal_id in range(2, 2 + closed_count)))
+    file_name = NamedTemporaryFile().name
+    save(goals, file_name)
+    spec = QuerySpec(open_only=True)
+    expected = get_root(goals, Goals).q(spec)
+    assert sum(not row.is_open for row in expected.rows) == closed_rows
+    assert LazyGoals(connect(file_name)).q(spec) == expected
@@ -1,3 +1,5 @@
+import sqlite3
+from contextlib import closing
 from pathlib import Path
 from tempfile import NamedTemporaryFile
 
@@ -34,6 +36,16 @@ def test_create_default_db_on_migrate_missing_file() -> None:
     )
 
 
+def test_migrate_with_fast_storage_profile() -> None:
+    file_name = NamedTemporaryFile().name
+    io = DummyIO()
+    main(["--storage", "fast", "migrate", file_name], io)
+
+    assert not io.log
+    with closing(sqlite3.connect(file_name)) as conn:
+        assert conn.execute("pragma journal_mode").fetchone()[0] == "wal"
+
+
 def test_print_dot_empty_file() -> None:
     file_name = NamedTemporaryFile().name
     io = DummyIO()
@@ -17,6 +17,8 @@ from siebenapp.open_view import ToggleOpenView, OpenView
 from tests.dsl import build_goaltree, open_, clos_
 from siebenapp.zoom_view import ZoomView, ToggleZoom
 
+pytestmark = pytest.mark.usefixtures("push_down")
+
 
 @pytest.fixture
 def trivial():
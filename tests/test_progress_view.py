@@ -1,3 +1,5 @@
+import pytest
+
 from _pytest.fixtures import fixture
 
 from siebenapp.domain import (
@@ -10,6 +12,8 @@ from siebenapp.domain import (
 from siebenapp.progress_view import ProgressView, ToggleProgress
 from tests.dsl import build_goaltree, open_
 
+pytestmark = pytest.mark.usefixtures("push_down")
+
 
 @fixture
 def goaltree():
@@ -25,11 +25,14 @@ from siebenapp.domain import (
     Command,
     GoalId,
     Graph,
+    QuerySpec,
 )
+from siebenapp.enumeration import Enumeration
 from siebenapp.filter_view import FilterBy
 from siebenapp.goaltree import Goals
 from siebenapp.layers import all_layers
 from siebenapp.open_view import ToggleOpenView
+from siebenapp.progress_view import ToggleProgress
 from siebenapp.selectable_view import (
     OPTION_SELECT,
     OPTION_PREV_SELECT,
@@ -192,6 +195,11 @@ class GoaltreeRandomWalk(RuleBasedStateMachine):
         event("reset filter")
         self._accept(FilterBy(""))
 
+    @rule()
+    def progress_view(self) -> None:
+        event("progress_view")
+        self._accept(ToggleProgress())
+
     #
     # Verifiers
     #
@@ -238,6 +246,22 @@ class GoaltreeRandomWalk(RuleBasedStateMachine):
         }
         assert result_roots == actual_roots
 
+    @invariant()
+    def query_push_down_does_not_change_results(self) -> None:
+        q1 = self.goaltree.q()
+        QuerySpec.push_down = False
+        try:
+            q2 = self.goaltree.q()
+        finally:
+            QuerySpec.push_down = True
+        assert q1 == q2
+
+    @invariant()
+    def streamed_rows_are_the_same_as_queried_ones(self) -> None:
+        assert list(self.goaltree.iter_rows()) == self.goaltree.q().rows
+        enumerated = Enumeration(self.goaltree)
+        assert list(enumerated.iter_rows()) == enumerated.q().rows
+
     @invariant()
     @precondition(lambda self: self.db_is_ready)
     def full_export_and_streaming_export_must_be_the_same(self) -> None:
@@ -4,7 +4,14 @@ from siebenapp.enumeration import Enumeration
 from siebenapp.selectable_view import SelectableView
 from siebenapp.switchable_view import ToggleSwitchableView, SwitchableView
 from siebenapp.domain import EdgeType, child, blocker
-from siebenapp.render import Renderer
+from siebenapp.render import (
+    Renderer,
+    Point,
+    LinesCache,
+    middle_point,
+    flat_lines,
+    render_lines,
+)
 from tests.dsl import build_goaltree, open_
 
 
@@ -169,3 +176,67 @@ def test_place(before, after) -> None:
     # NB: do we still need to test internal implementation of Renderer?
     # Not sure
     assert after == r.place(before)
+
+
+@pytest.mark.parametrize(
+    "left,right,num,den",
+    [
+        (Point(0, 0), Point(10, 20), 1, 2),
+        (Point(3, 7), Point(-13, 50), 2, 3),
+        (Point(100, 5), Point(27, 5), 3, 7),
+    ],
+)
+def test_middle_point(left, right, num, den) -> None:
+    assert middle_point(left, right, num, den) == left + (right - left) * num / den
+
+
+class CountingGeometry:
+    def __init__(self):
+        self.calls = 0
+
+    def top_left(self, row, col):
+        self.calls += 1
+        return Point(col * 100, row * 100)
+
+    def top_right(self, row, col):
+        return self.top_left(row, col) + Point(50, 0)
+
+    def bottom_left(self, row, col):
+        return self.top_left(row, col) + Point(0, 40)
+
+    def bottom_right(self, row, col):
+        return self.bottom_left(row, col) + Point(50, 0)
+
+
+def test_lines_are_cached_per_render_result_and_geometry_revision() -> None:
+    goals = build_goaltree(
+        open_(1, "Root", [2, 3], blockers=[4]),
+        open_(2, "A", [4]),
+        open_(3, "B"),
+        open_(4, "C"),
+    )
+    result = Renderer(goals).build()
+    gp = CountingGeometry()
+    cache = LinesCache()
+    lines = cache.get(gp, result, 1)
+    assert lines == flat_lines(render_lines(gp, result))
+    calls = gp.calls
+    assert cache.get(gp, result, 1) is lines
+    assert gp.calls == calls
+    cache.get(gp, result, 2)
+    assert gp.calls > calls
+    calls = gp.calls
+    cache.get(gp, Renderer(goals).build(), 2)
+    assert gp.calls > calls
+
+
+def test_flat_lines_are_grouped_by_edge_type() -> None:
+    lines = [
+        (EdgeType.PARENT, Point(0, 1), Point(2, 3), "1-2"),
+        (EdgeType.BLOCKER, Point(4, 5), Point(6, 7), "1-3"),
+        (EdgeType.PARENT, Point(8, 9), Point(10, 11), ""),
+    ]
+    assert flat_lines(lines) == {
+        EdgeType.PARENT: [0, 1, 2, 3, 8, 9, 10, 11],
+        EdgeType.BLOCKER: [4, 5, 6, 7],
+    }
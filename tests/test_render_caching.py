@@ -1,3 +1,8 @@
+import sqlite3
+from contextlib import closing
+from threading import Event
+from unittest.mock import patch
+
 import pytest
 
 from siebenapp.autolink import ToggleAutoLink
@@ -7,16 +12,21 @@ from siebenapp.domain import (
     ToggleClose,
     Delete,
     Insert,
+    RenderResult,
 )
 from siebenapp.filter_view import FilterBy
 from siebenapp.layers import all_layers
+from siebenapp.lazy import LazyGoals
 from siebenapp.open_view import ToggleOpenView
 from siebenapp.progress_view import ToggleProgress
-from siebenapp.render import GoalsHolder
+from siebenapp.render import LayoutWorker, RenderStats, build_layout
 from siebenapp.selectable_view import Select, HoldSelect
+from siebenapp.session import GoalsHolder
 from siebenapp.switchable_view import ToggleSwitchableView
+from siebenapp.system import load
 from siebenapp.zoom_view import ToggleZoom
 from tests.dsl import build_goaltree, open_, clos_
+from tests.test_lazy import saved_tree
 
 WIDTH = 3
 
@@ -84,3 +94,79 @@ def test_make_diff_on_hold(sample_holder):
     holder.accept(HoldSelect())
     result = holder.render(WIDTH)
     assert result[1] == []
+
+
+def wait_for_layout(worker: LayoutWorker) -> RenderResult:
+    assert worker.pending is not None
+    worker.pending.result()
+    result = worker.take()
+    assert result is not None
+    return result
+
+
+def test_layout_is_built_for_the_tree_as_it_was_submitted(sample_holder):
+    holder = sample_holder
+    expected, _ = holder.render(WIDTH)
+    worker = LayoutWorker(RenderStats())
+    worker.submit(holder.goals, WIDTH, holder.classic)
+    holder.accept(Rename("Renamed while being laid out", 2))
+    assert holder.show(wait_for_layout(worker)) == (expected, [])
+    assert worker.take() is None
+    worker.close()
+
+
+def test_only_the_newest_layout_is_shown(sample_holder):
+    holder = sample_holder
+    stats = RenderStats()
+    worker = LayoutWorker(stats)
+    # Worker is kept busy, so that layouts wait in its queue
+    busy = Event()
+    worker.executor.submit(busy.wait)
+    worker.submit(holder.goals, WIDTH)
+    holder.accept(Rename("Newest", 2))
+    worker.submit(holder.goals, WIDTH)
+    busy.set()
+    result = wait_for_layout(worker)
+    assert result.by_id(2).name == "Newest"
+    assert (stats.shown, stats.superseded) == (1, 1)
+    assert stats.summary() == "Layouts shown: 1, superseded: 1, renders avoided: 0"
+    worker.close()
+
+
+def test_lazy_goals_are_laid_out_in_background():
+    goals = load(saved_tree(0), lazy=True)
+    worker = LayoutWorker(RenderStats())
+    busy = Event()
+    worker.executor.submit(busy.wait)
+    worker.submit(goals, WIDTH)
+    assert worker.take() is None
+    busy.set()
+    assert wait_for_layout(worker) == build_layout(goals, WIDTH)
+    worker.close()
+
+
+def test_goals_of_memory_database_are_laid_out_right_away():
+    memory = sqlite3.connect(":memory:")
+    with closing(sqlite3.connect(saved_tree(0))) as source:
+        source.backup(memory)
+    goals = all_layers(LazyGoals(memory))
+    worker = LayoutWorker(RenderStats())
+    worker.submit(goals, WIDTH)
+    assert worker.take() == build_layout(goals, WIDTH)
+    worker.close()
+
+
+def test_errors_of_freezing_are_not_hidden():
+    goals = all_layers(LazyGoals(sqlite3.connect(saved_tree(0))))
+    worker = LayoutWorker(RenderStats())
+    with patch.object(LazyGoals, "freeze", side_effect=NotImplementedError):
+        with pytest.raises(NotImplementedError):
+            worker.submit(goals, WIDTH)
+    worker.close()
+
+
+def test_time_to_first_paint_is_summarized():
+    stats = RenderStats(first_paint=[0.01 * i for i in range(1, 21)])
+    assert stats.summary().splitlines()[1] == (
+        "Time to first paint: median 105.0 ms, 95% 190.5 ms, max 200.0 ms (20 paints)"
+    )
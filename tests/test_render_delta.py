@@ -0,0 +1,245 @@
+import random
+from threading import Event
+from unittest.mock import Mock, patch
+
+import pytest
+
+from siebenapp.autolink import AutoLink
+from siebenapp.domain import (
+    Add,
+    Command,
+    Delete,
+    RenderResult,
+    RenderRow,
+    Rename,
+    child,
+)
+from siebenapp.goaltree import Goals
+from siebenapp.layers import get_root, view_layers
+from siebenapp.open_view import ToggleOpenView
+from siebenapp.render import RenderDelta, diff_results
+from siebenapp.selectable_view import Select
+from siebenapp.session import GoalsHolder
+from siebenapp.system import drain_events, load, save
+from siebenapp.zoom_view import ToggleZoom
+from tests.test_archive import archive, sample_file
+from tests.test_lazy import run_random_commands, saved_tree
+
+
+def holder(file_name: str) -> GoalsHolder:
+    # Commands of random tests use real goal ids, so there's no enumeration here
+    return GoalsHolder(view_layers(get_root(load(file_name), AutoLink)), file_name)
+
+
+def persistent_data(goals_holder: GoalsHolder) -> tuple:
+    goals = get_root(goals_holder.goals, Goals)
+    names, edges = Goals.export(goals)
+    autolink = get_root(goals_holder.goals, AutoLink).back_kw
+    return names, sorted(edges), goals.archived, autolink
+
+
+def test_diff_results_finds_changed_added_and_removed_rows() -> None:
+    old = RenderResult(
+        [
+            RenderRow(1, 1, "Root", True, False, True, [child(2), child(3)]),
+            RenderRow(2, 2, "Same", True, True, True, []),
+            RenderRow(3, 3, "Removed", True, True, True, []),
+        ],
+        node_opts={1: {"row": 1}, 2: {"row": 0}, 3: {"row": 0}},
+    )
+    new = RenderResult(
+        [
+            RenderRow(1, 1, "Root", True, False, True, [child(2), child(4)]),
+            RenderRow(2, 2, "Same", True, True, True, []),
+            RenderRow(4, 4, "Added", True, True, True, []),
+        ],
+        node_opts={1: {"row": 1}, 2: {"row": 0}, 4: {"row": 0}},
+        global_opts={"select": 4},
+    )
+    assert diff_results(old, new) == RenderDelta(
+        changed=[1],
+        added=[4],
+        removed=[3],
+        rows=[new.rows[0], new.rows[2]],
+        global_opts={"select": 4},
+    )
+
+
+def test_row_is_changed_when_only_its_layout_is_changed() -> None:
+    row = RenderRow(1, 1, "Root", True, True, True, [])
+    old = RenderResult([row], node_opts={1: {"row": 0, "col": 0}})
+    new = RenderResult([row], node_opts={1: {"row": 0, "col": 1}})
+    assert diff_results(old, new).changed == [1]
+    assert not diff_results(old, old).has_rows()
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_subscriber_gets_the_same_goals_as_publisher(seed: int) -> None:
+    file_name = saved_tree(seed)
+    publisher, subscriber = holder(file_name), holder(file_name)
+    deltas: list[RenderDelta] = []
+    publisher.subscribe(deltas.append)
+    publisher.subscribe(subscriber.apply)
+    rnd = random.Random(seed)
+    for _ in range(30):
+        run_random_commands(rnd, [publisher.goals], 1)
+        publisher.accept()
+        assert persistent_data(subscriber) == persistent_data(publisher)
+    assert deltas
+    subscriber.goals.verify()
+    # Changes are applied, not made: there's nothing to save
+    assert not drain_events(subscriber.goals)
+    assert persistent_data(subscriber) == persistent_data(holder(file_name))
+
+
+def test_only_changed_rows_are_published() -> None:
+    file_name = saved_tree(0)
+    publisher = holder(file_name)
+    deltas: list[RenderDelta] = []
+    publisher.subscribe(deltas.append)
+    publisher.accept(Rename("Renamed", 1))
+    publisher.accept(Select(1))
+    assert [(d.changed, d.added, d.removed) for d in deltas] == [([1], [], [])]
+    assert deltas[0].rows[0].name == "Renamed"
+
+
+def test_publisher_builds_rows_of_changed_goals_only() -> None:
+    file_name = saved_tree(0)
+    publisher, subscriber = holder(file_name), holder(file_name)
+    publisher.subscribe(subscriber.apply)
+    with (
+        patch.object(Goals, "q", side_effect=AssertionError),
+        patch.object(Goals, "iter_rows", side_effect=AssertionError),
+    ):
+        publisher.accept(Rename("Renamed", 1))
+    assert persistent_data(subscriber) == persistent_data(publisher)
+
+
+def test_deltas_are_sent_without_waiting_for_the_daemon() -> None:
+    file_name = saved_tree(0)
+    sent: list[dict] = []
+    daemon_is_slow = Event()
+
+    def slow_request(address: str, message: dict) -> None:
+        daemon_is_slow.wait(5)
+        sent.append(message)
+
+    with (
+        patch("siebenapp.session.subscribe", return_value=Mock()),
+        patch("siebenapp.session.request", slow_request),
+    ):
+        goals_holder = GoalsHolder(load(file_name), file_name, share="daemon.sock")
+        goals_holder.accept(Rename("Renamed", 1))
+        assert not sent
+        daemon_is_slow.set()
+        goals_holder.close()
+    assert [m["delta"]["changed"] for m in sent] == [[1]]
+
+
+def test_view_state_of_subscriber_is_kept() -> None:
+    file_name = saved_tree(0)
+    publisher, subscriber = holder(file_name), holder(file_name)
+    publisher.subscribe(subscriber.apply)
+    publisher.accept(Add("Zoomed", 1))
+    goal_id: int = len(get_root(subscriber.goals, Goals).goals)
+    subscriber.goals.accept_all(ToggleZoom(goal_id), Select(goal_id), ToggleOpenView())
+    publisher.accept(Rename("Renamed root", 1))
+    assert subscriber.goals.settings("zoom_root") == goal_id
+    assert subscriber.goals.settings("selection") == goal_id
+    assert not subscriber.goals.settings("filter_open")
+
+
+def test_deleted_goals_are_unzoomed_and_unselected() -> None:
+    file_name = saved_tree(0)
+    publisher, subscriber = holder(file_name), holder(file_name)
+    publisher.subscribe(subscriber.apply)
+    publisher.accept(Add("Temporary", 1))
+    goal_id: int = len(get_root(publisher.goals, Goals).goals)
+    subscriber.goals.accept_all(ToggleZoom(goal_id), Select(goal_id))
+    publisher.accept(Delete(goal_id))
+    assert subscriber.goals.settings("zoom_root") == Goals.ROOT_ID
+    assert subscriber.goals.settings("selection") == Goals.ROOT_ID
+    subscriber.goals.verify()
+
+
+def test_archived_goals_brought_back_by_publisher_are_not_loaded_again() -> None:
+    file_name = sample_file()
+    archive(file_name)
+    publisher, subscriber = holder(file_name), holder(file_name)
+    publisher.subscribe(subscriber.apply)
+    publisher.accept(ToggleOpenView())
+    assert subscriber.goals.settings("archived") == {}
+    subscriber.goals.accept(ToggleOpenView())
+    assert not drain_events(subscriber.goals)
+    assert persistent_data(subscriber) == persistent_data(publisher)
+
+
+def save_outside(file_name: str, *commands: Command) -> None:
+    goals = load(file_name)
+    goals.accept_all(*commands)
+    save(goals, file_name)
+
+
+def test_goals_saved_by_another_process_are_reloaded() -> None:
+    file_name = saved_tree(0)
+    goals_holder = holder(file_name)
+    goal_id: int = len(get_root(goals_holder.goals, Goals).goals)
+    goals_holder.goals.accept_all(
+        ToggleZoom(goal_id), Select(goal_id), ToggleOpenView()
+    )
+    assert not goals_holder.reload()
+    save_outside(file_name, Rename("Renamed outside", 1), Add("Added outside", goal_id))
+    assert goals_holder.reload()
+    assert persistent_data(goals_holder) == persistent_data(holder(file_name))
+    assert goals_holder.goals.settings("zoom_root") == goal_id
+    assert goals_holder.goals.settings("selection") == goal_id
+    assert not goals_holder.goals.settings("filter_open")
+    assert not drain_events(goals_holder.goals)
+    assert not goals_holder.reload()
+
+
+def test_new_goals_do_not_reuse_ids_of_goals_saved_by_another_process() -> None:
+    file_name = saved_tree(0)
+    goals_holder = holder(file_name)
+    save_outside(file_name, Add("Outside", 1))
+    goals_holder.accept(Add("Inside", 1))
+    assert persistent_data(goals_holder) == persistent_data(holder(file_name))
+    names = [
+        name for _, name, _ in Goals.export(get_root(goals_holder.goals, Goals))[0]
+    ]
+    assert names[-2:] == ["Outside", "Inside"]
+
+
+def test_goals_deleted_by_another_process_are_unselected() -> None:
+    file_name = saved_tree(0)
+    save_outside(file_name, Add("Temporary", 1))
+    goals_holder = holder(file_name)
+    goal_id: int = len(get_root(goals_holder.goals, Goals).goals)
+    goals_holder.goals.accept(Select(goal_id))
+    save_outside(file_name, Delete(goal_id))
+    assert goals_holder.reload()
+    assert goals_holder.goals.settings("selection") == Goals.ROOT_ID
+    goals_holder.goals.verify()
+
+
+def test_only_changed_goals_are_read_again() -> None:
+    file_name = saved_tree(0)
+    goals_holder = holder(file_name)
+    save_outside(file_name, Rename("Renamed outside", 1))
+    with patch("siebenapp.system.read_goals") as read_goals:
+        assert goals_holder.reload()
+        read_goals.assert_not_called()
+    assert persistent_data(goals_holder) == persistent_data(holder(file_name))
+
+
+def test_goals_archived_by_another_process_could_be_shown() -> None:
+    file_name = sample_file()
+    goals_holder = holder(file_name)
+    archive(file_name)
+    assert goals_holder.reload()
+    assert persistent_data(goals_holder) == persistent_data(holder(file_name))
+    goals_holder.accept(ToggleOpenView())
+    shown = holder(file_name)
+    shown.accept(ToggleOpenView())
+    assert goals_holder.goals.q() == shown.goals.q()
+    goals_holder.goals.verify()
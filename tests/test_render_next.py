@@ -1,6 +1,19 @@
 import pytest
 
-from siebenapp.render_next import uniform_locations
+from siebenapp.domain import Add, EdgeType, ToggleLink
+from siebenapp.goaltree import Goals
+from siebenapp.layers import all_layers
+from siebenapp.open_view import ToggleOpenView
+from siebenapp.render_next import (
+    uniform_locations,
+    full_render,
+    Tube,
+    find_previous,
+    revert_rows,
+    shift_columns,
+    shift_columns_vectorized,
+)
+from tests.dsl import build_goaltree, open_, clos_, diamond_ladder
 
 
 @pytest.mark.parametrize(
@@ -19,3 +32,134 @@ from siebenapp.render_next import uniform_locations
 )
 def test_uniform_locations(width, num, expected):
     assert expected == uniform_locations(width, num)
+
+
+@pytest.fixture
+def complex_tree():
+    goals = all_layers(
+        build_goaltree(
+            open_(1, "Root", [2, 3, 4], blockers=[6]),
+            open_(2, "A", [5, 6]),
+            open_(3, "B", blockers=[5]),
+            open_(4, "C", [7], relations=[6]),
+            open_(5, "D", [8]),
+            open_(6, "E"),
+            clos_(7, "F"),
+            open_(8, "G", blockers=[7]),
+        )
+    )
+    goals.accept(ToggleOpenView())
+    return goals
+
+
+@pytest.mark.parametrize(
+    "width,expected",
+    [
+        (
+            2,
+            {
+                1: (5, 0),
+                2: (4, 0),
+                3: (4, 1),
+                4: (3, 0),
+                5: (3, 1),
+                6: (2, 0),
+                7: (1, 0),
+                8: (2, 1),
+            },
+        ),
+        (
+            3,
+            {
+                1: (5, 1),
+                2: (4, 0),
+                3: (4, 2),
+                4: (4, 1),
+                5: (3, 1),
+                6: (3, 0),
+                7: (1, 1),
+                8: (2, 1),
+            },
+        ),
+        (
+            4,
+            {
+                1: (5, 1),
+                2: (4, 0),
+                3: (4, 2),
+                4: (4, 1),
+                5: (3, 1),
+                6: (3, 0),
+                7: (1, 1),
+                8: (2, 1),
+            },
+        ),
+    ],
+)
+def test_full_render_placement(complex_tree, width, expected):
+    result = full_render(complex_tree, width)
+    assert {k: (v["row"], v["col"]) for k, v in result.node_opts.items()} == expected
+
+
+def test_full_render_with_and_without_listener_are_equal(complex_tree):
+    listener: list = []
+    assert full_render(complex_tree, 3, listener) == full_render(complex_tree, 3)
+    assert [msg for msg, _ in listener][0] == "Graph"
+
+
+def test_tube_places_every_goal_exactly_once(complex_tree):
+    rr = complex_tree.q()
+    rr.node_opts = {row.goal_id: {} for row in rr.rows}
+    tube = Tube(2, rr).build()
+    placed = [g for layer in tube.layers for g in layer]
+    assert sorted(placed) == sorted(row.goal_id for row in rr.rows)
+    assert all(len(layer) <= 2 for layer in tube.layers)
+    assert all(
+        tube.node_opts[g]["row"] == i
+        for i, layer in enumerate(tube.layers)
+        for g in layer
+    )
+    # source render result is not modified
+    assert all(opts == {} for opts in rr.node_opts.values())
+
+
+def test_find_previous_on_diamond_ladder():
+    rungs = 1000
+    previous = find_previous(diamond_ladder(rungs).q())
+    right_start = 2 * rungs + 2
+    assert previous[1] == []
+    for i in range(rungs):
+        top, left, bottom, right = 2 * i + 1, 2 * i + 2, 2 * i + 3, right_start + i
+        assert previous[left] == [top]
+        assert previous[right] == [top]
+        assert sorted(previous[bottom]) == [left, right]
+
+
+@pytest.fixture
+def wide_render_result():
+    goals = Goals("Root")
+    for i in range(2, 301):
+        goals.accept(Add(f"Goal {i}", i // 3 or 1))
+    for i in range(2, 301, 7):
+        goals.accept(ToggleLink(i, 301 - i, EdgeType.BLOCKER))
+    rr = goals.q()
+    rr.node_opts = {row.goal_id: {} for row in rr.rows}
+    return revert_rows(Tube(6, rr).build().result())
+
+
+@pytest.mark.parametrize("iterations", [1, 2, 10])
+def test_vectorized_shift_matches_pure_python(wide_render_result, iterations):
+    pytest.importorskip("numpy")
+    expected = shift_columns(wide_render_result, iterations)
+    actual = shift_columns_vectorized(wide_render_result, iterations)
+    for goal_id, opts in expected.node_opts.items():
+        assert actual.node_opts[goal_id] == {
+            "row": opts["row"],
+            "col": pytest.approx(opts["col"]),
+        }
+
+
+def test_shift_stops_on_convergence(wide_render_result):
+    listener: list = []
+    shift_columns(wide_render_result, 1000, listener)
+    assert 1 < len(listener) < 1000
@@ -0,0 +1,88 @@
+import os
+from tempfile import NamedTemporaryFile
+from unittest.mock import patch
+
+from siebenapp.autolink import ToggleAutoLink
+from siebenapp.domain import Add, Delete, ToggleClose, ToggleLink, EdgeType, Rename
+from siebenapp.enumeration import Enumeration
+from siebenapp.goaltree import Goals
+from siebenapp.layers import all_layers
+from siebenapp.session import GoalsHolder
+from siebenapp.snapshot import (
+    read_snapshot,
+    snapshot_name,
+    write_snapshot,
+    is_snapshot_valid,
+)
+from siebenapp.system import save, load
+
+
+def sample_file() -> tuple[str, Enumeration]:
+    file_name = NamedTemporaryFile().name
+    goals = Enumeration(all_layers(Goals("Root")))
+    goals.accept_all(
+        Add("Same", 1),
+        Add("Same", 1),
+        Add("Closed", 2),
+        ToggleClose(4),
+        Add("Deleted", 1),
+        Delete(5),
+        Add("Ünicode", 3),
+        ToggleLink(3, 2, EdgeType.BLOCKER),
+        ToggleAutoLink("kw", 6),
+    )
+    save(goals, file_name)
+    return file_name, goals
+
+
+def test_snapshot_keeps_everything_needed_for_load() -> None:
+    file_name, goals = sample_file()
+    write_snapshot(goals, file_name)
+    with patch("siebenapp.system.connect") as connect:
+        loaded = load(file_name, snapshot=True)
+        connect.assert_not_called()
+    assert loaded.q() == load(file_name).q()
+    assert loaded.q() == goals.q()
+
+
+def test_snapshot_stores_equal_names_once() -> None:
+    file_name, goals = sample_file()
+    write_snapshot(goals, file_name)
+    with open(snapshot_name(file_name), "rb") as f:
+        assert f.read().count(b"Same") == 1
+
+
+def test_snapshot_is_not_used_after_database_change() -> None:
+    file_name, goals = sample_file()
+    write_snapshot(goals, file_name)
+    goals.accept(Rename("Changed", 2))
+    save(goals, file_name)
+    assert not is_snapshot_valid(file_name)
+    assert read_snapshot(file_name) is None
+    assert load(file_name, snapshot=True).q() == goals.q()
+
+
+def test_broken_snapshot_is_ignored() -> None:
+    file_name, goals = sample_file()
+    with open(snapshot_name(file_name), "wb") as f:
+        f.write(b"garbage")
+    assert read_snapshot(file_name) is None
+    assert load(file_name, snapshot=True).q() == goals.q()
+
+
+def test_snapshot_is_rewritten_only_when_needed() -> None:
+    file_name, goals = sample_file()
+    holder = GoalsHolder(goals, file_name, snapshot=True)
+    holder.close(quitting=True)
+    assert is_snapshot_valid(file_name)
+    modified = os.stat(snapshot_name(file_name)).st_mtime_ns
+
+    holder = GoalsHolder(load(file_name, snapshot=True), file_name, snapshot=True)
+    holder.close(quitting=True)
+    assert os.stat(snapshot_name(file_name)).st_mtime_ns == modified
+
+    holder = GoalsHolder(load(file_name, snapshot=True), file_name, snapshot=True)
+    holder.accept(Add("New", 1))
+    holder.close(quitting=True)
+    assert is_snapshot_valid(file_name)
+    assert load(file_name, snapshot=True).q() == load(file_name).q()
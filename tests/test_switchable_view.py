@@ -1,3 +1,5 @@
+import pytest
+
 from siebenapp.domain import Add, RenderRow, RenderResult, child
 from siebenapp.goaltree import Goals
 from siebenapp.layers import persistent_layers
@@ -12,6 +14,8 @@ from siebenapp.switchable_view import ToggleSwitchableView, SwitchableView
 from siebenapp.zoom_view import ToggleZoom, ZoomView
 from tests.dsl import build_goaltree, open_
 
+pytestmark = pytest.mark.usefixtures("push_down")
+
 
 def test_toggle_hide_non_switchable_goals() -> None:
     g = build_goaltree(
@@ -0,0 +1,163 @@
+import gc
+import random
+import sqlite3
+import sys
+from collections.abc import Iterator
+from contextlib import closing
+from queue import Queue
+from threading import Thread
+
+import pytest
+
+from siebenapp.domain import EdgeType, Graph, RenderResult, Rename
+from siebenapp.goaltree import Goals
+from siebenapp.layers import all_layers, get_root
+from siebenapp.lazy import LazyGoals, LazySnapshot
+from siebenapp.open_view import ToggleOpenView
+from siebenapp.system import load
+from siebenapp.tracked import (
+    FrozenAdjacency,
+    FrozenMapping,
+    FrozenSetView,
+    TrackedAdjacency,
+    TrackedDict,
+    TrackedSet,
+)
+from siebenapp.zoom_view import ToggleZoom
+from tests.test_lazy import run_random_commands, saved_tree
+
+
+@pytest.fixture
+def fast_switching() -> Iterator[None]:
+    # Threads are switched as often as possible, so that they interleave a lot
+    interval: float = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def test_frozen_mapping_keeps_values_of_changed_keys() -> None:
+    live: TrackedDict[int, str] = TrackedDict({1: "a", 2: "b", 3: "c"})
+    frozen = FrozenMapping(live)
+    live[1] = "changed"
+    live[4] = "added"
+    del live[2]
+    live.pop(3)
+    live[3] = "added again"
+    assert dict(frozen) == {1: "a", 2: "b", 3: "c"}
+    assert 4 not in frozen and frozen.get(4) is None and len(frozen) == 3
+    live.clear()
+    assert dict(frozen) == {1: "a", 2: "b", 3: "c"}
+    with pytest.raises(TypeError):
+        frozen[1] = "changed"
+
+
+def test_frozen_set_keeps_its_members() -> None:
+    live: TrackedSet[int] = TrackedSet({1, 2})
+    frozen = FrozenSetView(live)
+    live.add(3)
+    live.discard(1)
+    live |= {4}
+    live -= {2}
+    assert set(frozen) == {1, 2} and 1 in frozen and 3 not in frozen
+    assert live == {3, 4}
+
+
+def test_frozen_adjacency_copies_edges_of_changed_goals() -> None:
+    live = TrackedAdjacency([(1, {2: EdgeType.PARENT})])
+    frozen = FrozenAdjacency(live)
+    live[1][3] = EdgeType.BLOCKER
+    live[2][1] = EdgeType.RELATION
+    assert frozen[1] == {2: EdgeType.PARENT}
+    assert frozen[2] == {} and 2 not in frozen
+    assert set(frozen) == {1}
+
+
+def test_views_that_are_gone_are_forgotten() -> None:
+    live: TrackedDict[int, str] = TrackedDict({1: "a"})
+    frozen = FrozenMapping(live)
+    assert live.views
+    del frozen
+    gc.collect()
+    assert not live.views
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_frozen_goals_are_not_changed_with_original(seed: int) -> None:
+    goals: Graph = all_layers(get_root(load(saved_tree(seed)), Goals))
+    rnd = random.Random(seed)
+    frozen: list[tuple[Graph, RenderResult]] = []
+    for _ in range(50):
+        frozen.append((goals.freeze(), goals.q()))
+        run_random_commands(rnd, [goals], 1)
+        goals.accept(ToggleOpenView())
+    assert all(copy.q() == result for copy, result in frozen)
+    for copy, _ in frozen:
+        copy.verify()
+
+
+def test_view_settings_are_frozen_too() -> None:
+    goals: Graph = all_layers(get_root(load(saved_tree(0)), Goals))
+    goal_id: int = goals.q().rows[-1].goal_id
+    frozen: Graph = goals.freeze()
+    goals.accept_all(ToggleZoom(goal_id), ToggleOpenView())
+    assert frozen.settings("zoom_root") == Goals.ROOT_ID
+    assert frozen.settings("filter_open")
+
+
+def test_frozen_copy_shares_goals_until_they_are_changed() -> None:
+    goals = Goals("Root")
+    goals.freeze()
+    frozen = goals.freeze()
+    assert isinstance(frozen, Goals) and isinstance(frozen.goals, FrozenMapping)
+    assert frozen.goals.live is goals.goals
+    goals.accept(Rename("Renamed", 1))
+    assert frozen.goals.old == {1: "Root"}
+    with pytest.raises(TypeError):
+        frozen.accept(Rename("Renamed", 1))
+
+
+def test_lazy_goals_are_frozen_into_snapshot() -> None:
+    goals = load(saved_tree(0), lazy=True)
+    goals.accept(Rename("Not saved", 1))
+    assert goals.can_freeze()
+    frozen = goals.freeze()
+    assert isinstance(get_root(frozen, Goals), LazySnapshot)
+    results: list[RenderResult] = []
+    reader = Thread(target=lambda: results.append(frozen.q()))
+    reader.start()
+    reader.join()
+    assert results == [goals.q()]
+    assert "Not saved" in [row.name for row in results[0].rows]
+
+
+def test_lazy_goals_of_memory_database_could_not_be_frozen() -> None:
+    memory = sqlite3.connect(":memory:")
+    with closing(sqlite3.connect(saved_tree(0))) as source:
+        source.backup(memory)
+    assert not all_layers(LazyGoals(memory)).can_freeze()
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_frozen_goals_are_queried_while_original_is_changed(
+    seed: int, fast_switching: None
+) -> None:
+    goals: Graph = all_layers(get_root(load(saved_tree(seed)), Goals))
+    frozen: Queue[tuple[Graph, RenderResult] | None] = Queue()
+    mismatches: list[int] = []
+
+    def query() -> None:
+        while (item := frozen.get()) is not None:
+            copy, result = item
+            if copy.q() != result:
+                mismatches.append(len(result.rows))
+
+    reader = Thread(target=query)
+    reader.start()
+    rnd = random.Random(seed)
+    for _ in range(100):
+        frozen.put((goals.freeze(), goals.q()))
+        run_random_commands(rnd, [goals], 1)
+    frozen.put(None)
+    reader.join()
+    assert not mismatches
@@ -1,3 +1,7 @@
+import random
+
+import pytest
+
 from siebenapp.domain import (
     EdgeType,
     ToggleClose,
@@ -9,8 +13,14 @@ from siebenapp.domain import (
     blocker,
     RenderRow,
     RenderResult,
+    QuerySpec,
+    Command,
 )
+from siebenapp.filter_view import FilterBy
 from siebenapp.goaltree import Goals
+from siebenapp.layers import all_layers, get_root
+from siebenapp.open_view import ToggleOpenView
+from siebenapp.progress_view import ToggleProgress
 from siebenapp.selectable_view import (
     SelectableView,
     OPTION_SELECT,
@@ -20,6 +30,9 @@ from siebenapp.selectable_view import (
 )
 from tests.dsl import build_goaltree, open_, clos_
 from siebenapp.zoom_view import ZoomView, ToggleZoom
+from tests.test_lazy import run_random_commands
+
+pytestmark = pytest.mark.usefixtures("push_down")
 
 
 def _zoom_events(goals: Graph) -> list[tuple]:
@@ -755,3 +768,31 @@ def test_zoom_attempt_out_of_stack() -> None:
     goals.accept(ToggleZoom(2))
     assert goals.q() == expected
     assert messages == ["Zooming outside of current zoom root is not allowed!"]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_zoomed_subtree_is_queried_without_other_goals(seed: int) -> None:
+    goals = all_layers(Goals("Root"))
+    run_random_commands(random.Random(seed), [goals], 60)
+    views: list[list[Command]] = [
+        [],
+        [ToggleOpenView()],
+        [FilterBy("new")],
+        [ToggleProgress()],
+        [ToggleOpenView(), FilterBy("1")],
+    ]
+    for goal_id in [row.goal_id for row in goals.q().rows if row.goal_id > 1]:
+        goals.accept(ToggleZoom(goal_id))
+        for commands in views:
+            goals.accept_all(*commands)
+            expected = goals.q()
+            assert list(goals.iter_rows()) == expected.rows
+            QuerySpec.push_down = False
+            try:
+                assert goals.q() == expected
+            finally:
+                QuerySpec.push_down = True
+            goals.accept_all(*commands)
+            goals.accept(FilterBy(""))
+        if get_root(goals, ZoomView).zoom_root[-1] == goal_id:
+            goals.accept(ToggleZoom(goal_id))